@@ -1,24 +1,45 @@
+import argparse
+import os
 import random
 import pygame as py
 from sys import exit
-import time
-import threading
+from time import perf_counter
+from tetris.checkpoint import load_checkpoint, save_checkpoint
+from tetris.engine import TetrisEngine, LEFT, RIGHT, DOWN, ROTATE, HARD_DROP, GRAVITY_CURVE, gravity_delay
+from tetris.input import ARR, DAS, MAX_CATCH_UP, TICK, InputBuffer
+from tetris.pieces import ROTATIONS
+from tetris.policies import HeuristicPolicy, PlannerPolicy
+from tetris.profiling import FrameProfiler, profiling_requested
+from tetris.randomizer import RANDOMIZERS
+from tetris.replay import ReplayRecorder
+# the rules of our game live in the tetris package so they can run without pygame
+# we import them here so they are still available as Tetris.move_down() etc.
+from tetris.grid import (
+    columns, rows, create_grid, new_pieces, random_piece, map_to_grid, clear_piece,
+    move_right, move_left, move_down, subgrid_bound, isolate_subgrid, rotate,
+    map_rotate_to_grid, clear_lines, lock_pieces, calculate_score, game_over_condition,
+)
 
 
 # Game settings
 
 # each cell will occupy a size of 40 pixels
-columns = 10
-rows = 20
 cell_size = 40
 # we multiply of cell size by a width of 10 and height of 20 to get
 # a game width of 400 pixels and a game height of 800 pixels
 game_width, game_height = columns * cell_size, rows * cell_size
+# the most rows and columns we show at once, bigger boards are shown through a
+# view that follows the piece
+MAX_VIEW_ROWS = 40
+MAX_VIEW_COLUMNS = 60
+# how many of the pieces after our piece we show in the next piece panel
+PREVIEW = 5
 
 # Colors
 # we will use the colors to color in our game grid
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
+# Light green outlines our ghost piece
 LIGHT_GREEN = (144, 238, 144)
 # Lighter green for border
 LIGHTER_GREEN = (173, 255, 173)  
@@ -27,35 +48,18 @@ DARK_GREEN = (0, 100, 0)
 
 
 
-# Create the grid (2D array)
-# we use a list compression to create a nested list for our game grid
-# our game grid will include 20 rows and 10 columns
-# we will use a function called draw_grid to draw physical map of our game grid 
-# using pygame
-# additionally, the design of this game will rely on functions such as move left,
-# move down, etc. So our create_grid() will store the grid that all of the functions
-# will operate on
-#
-# create grid is also used to create a temp_grid which is an empty grid used to map
-# some of the movements such as move right or left
-# this was done to avoid a collision between the pieces, represented by a a nested list
-# of '*'
-# if we wanted to move the piece * * * * to the right. Each * is moved 1 by 1 to the right
-# by n+1 and would thus override the piece infront of it
-# thus temp_grid is used to map the piece onto a blank grid and easily map it back to the
-# grid being used for the game
-def create_grid():
-    return [[' ' for _ in range(columns)] for _ in range(rows)]
-
 # Draw the grid and pieces
 # draw_grid takes to parameters: display_surface and grid
 # display_surface will be used by pygame to draw our game window
 # we use grid to dictate which blocks to fill in on our game window
-def draw_grid(display_surface, grid, score):
-    # we iterate through all of our rows and columns to get the 
+# cell_size can be changed for bigger boards, which need smaller cells to fit
+# upcoming holds the piece numbers that come next, we draw them in a panel to
+# the right of our grid
+def draw_grid(display_surface, grid, score, cell_size=cell_size, upcoming=()):
+    # we iterate through all of the rows and columns of our grid to get the 
     # correct number of boxes for our grid
-    for row in range(rows):
-        for col in range(columns):
+    for row in range(len(grid)):
+        for col in range(len(grid[0])):
 
             # https://www.pygame.org/docs/ref/rect.html
             # we use py.Rect() to store our rectangle coordinates
@@ -112,6 +116,10 @@ def draw_grid(display_surface, grid, score):
             #
             if grid[row][col] == '*' or grid[row][col] == '0':
                 py.draw.rect(display_surface, LIGHTER_GREEN, rect)
+            # '+' is our ghost piece, it shows where our piece will land, so we
+            # only draw an outline 2 pixels thick inside the box
+            elif grid[row][col] == '+':
+                py.draw.rect(display_surface, LIGHT_GREEN, rect.inflate(-4, -4), 2)
     
     # This section is for our Game Over display
     #https://www.pygame.org/docs/ref/font.html#pygame.font.Font
@@ -127,449 +135,231 @@ def draw_grid(display_surface, grid, score):
     # variable score_text and the area that was passed to .blit()
     display_surface.blit(score_text, (10, 10))
 
-# Tetris pieces
-# Tetris is composed of seven pieces represented by the letters I, O, S, Z, L, J, T
-# we define each one of these pieces as a nested list
-# we represent the piece as a ' ' or '*' within its nest to define the 'shape' of the piece
-# since the nested list alone has no shape, it is up to us to correctly map the 'piece' onto
-# our grid. Thus these 'pieces' were created to help us do this
-def new_pieces():
-    I = [['*'], ['*'], ['*'], ['*']]
-    O = [['*','*'], ['*','*']]
-    S = [[' ','*','*'], ['*','*',' ']]
-    Z = [['*','*'], [' ','*','*']]
-    L = [['*',' '], ['*',' '], ['*','*']]
-    J = [[' ','*'], [' ','*'], ['*','*']]
-    T = [['*','*','*'], [' ','*',' ']]
-    return [I, O, S, Z, L, J, T]
-
-# Randomly select a piece
-# we wanted a random piece to be generated after every old piece is locked
-# https://numpy.org/doc/stable/reference/random/generated/numpy.random.choice.html
-# we use random.choice() from the random library to achieve this
-# choice() takes an array and generates a random sample
-# we store all seven of our 'pieces' created in function new_pieces() and store
-# them in variable pieces
-# we then call random.choice() on our pieces, which are just seven nested lists
-# and random will randomly generate one of these seven pieces after each new piece is
-# locked and stored as a '0'
-import random
-def random_piece():
-    pieces = new_pieces()
-    return random.choice(pieces)
-
-# Map the piece onto the grid
-# our map_to_grid function takes four paramaters, two of which are default arguements
-# our two default arugments are start_row and start_col and gaurentee that our piece starts
-# at position (0,4) on our grid
-def map_to_grid(piece, grid, start_row=0, start_col=4):
-    for i in range(len(piece)):
-        for j in range(len(piece[i])):
-            # we iterate through our piece and if we find a '*' and the '*' is within the bounds
-            # of our row and column after adjusting for the starting position, then we map that
-            # '*' to the starting position plus the i or j location in the row and column of the
-            # piece
-            if piece[i][j] == '*':
-                if start_row + i < len(grid) and start_col + j < len(grid[0]):
-                    grid[start_row + i][start_col + j] = '*'
-# The key note is that each '*' is iterated through and individually mapped on to our grid one by one
-# at our starting grid posiiton of (0,4)
-# Thus we have our 'piece', which is simply a collection of '*' mapped on to our grid.
-# Recall that by our condition in the draw_grid() function; if the function detects a '*', 
-# py.draw.rect() will fill in all of the green box denoting our piece 
-
-
-# we have many move functions such as move_right, move_left and move_down
-# these functions deal with the managmeent of our piece on the grid.
-# Everytime we 'move' a piece we have to clear its previous place on the grid 
-# defined by '*'
-# to do this, clear_piece takes the parameter grid
-def clear_piece(grid):
-    # we iterate through our entire grid
-     for r in range(len(grid)):
-        for c in range(len(grid[0])): 
-            # if we find a '*' on our grid we replace it with ' '
-            if grid[r][c] == '*':
-                grid[r][c] = ' '
-# thus our piece is cleared from its previous positon
-
-# our move_right function takes two arguments: grid and temp_grid
-# we use temp_grid to prevent '*' in our piece from colliding and leading to a disfigured piece on grid.
-# Thus when we move right we will map each '*' individually onto the empty temp_grid so we have no collisions.
-# We then clear our game grid of any '*' and we then map the piece from our temp_grid back on to our 
-# game grid.
-def move_right(grid, temp_grid):
-    # we set moved to False
-    # if no piece is moved right we return False
-    # if a piece does move right then we will return True
-    moved = False
-    # grid_width stores the full length of the column length
-    grid_width = len(grid[0])
-    
-    # Blocking condtions
-    # in our loop we iterate over our grid by in the reverse direction starting from right to left
-    for r in range(len(grid)):
-        for c in range(len(grid[0])-1, -1, -1): 
-            # When we detect an '*' in our piece we must check for two conditions before we move it right
-            # the first condition is if our piece is outside of the right most parameter of our grid, denoted
-            # by grid_width - 1 
-            # The second condition is to check if there is a locked piece in our way
-            # Since the pieces are moved by individual '*'; we check if there is an individual '0' in our way
-            # 
-            # recall that our locked pieces are deonated by '0'
-            # to check if there is a locked piece in our way we denoted this by grid[r][c+1] == '0'
-            # if either of these conditions are met then we CANNOT move our piece right and we
-            # return False
-            if grid[r][c] == '*' and (c == grid_width - 1 or grid[r][c + 1] == '0'):
-                return False  
-    
-    # In the case when we can move our piece we have to 'clear out temp_grid by iterating through
-    # ensuring that each box on the grid is held by an empty space ' ' 
-    for r in range(len(temp_grid)):
-        for c in range(len(temp_grid[0])):
-            temp_grid[r][c] = ' '
-
-    # we then iterate through our game grid starting from the right side
-    for r in range(len(grid)):
-        for c in range(len(grid[0])-1, -1, -1):
-            # we check for the position of '*' in our gam grid to get our piece
-            if grid[r][c] == '*':
-                # we check to see if there is space to the right of our piece denoted by c+1 
-                # we ensure we're still in bounds when its less than our grid_width
-                # then check if the space to the right is empty denoted by ' '
-                # if it is we move our '*' to the right by 1 in our temp_grid
-                # we then change moved to True
-                if c + 1 < grid_width:
-                    if grid[r][c + 1] == ' ':
-                        temp_grid[r][c + 1] = '*'
-                        moved = True
-                
-                    else:
-                        # if we cannot right we will keep the '*' in our current temp_grid position
-                        temp_grid[r][c] = '*'
-                        # this conditional will help in the when we have collisions with other '*'
-                        # so our piece doesn't run into itself
-                    # [ ' ', ' ', '*', ' ', ' ' ]     [ ' ', ' ', ' ', '*', ' ' ]
-                    # [ ' ', '*', '*', ' ', ' ' ] ->  [ ' ', ' ', '*', '*', ' ' ]
-                    # [ ' ', ' ', '*', ' ', ' ' ]     [ ' ', ' ', ' ', '*', ' ' ]
-                    # recall that we iterate from the right for this loop to reduce the chance for colliding
-                    # with its own piece
-                else:
-                    # this last condition handles for when our piece is at its right most bound
-                    temp_grid[r][c] = '*'
-                    # [ ' ', ' ', '*' ]     [ ' ', ' ', '*' ]
-                    # [ ' ', ' ', '*' ] ->  [ ' ', ' ', '*' ]
-                    # [ ' ', ' ', '*' ]     [ ' ', ' ', '*' ]
-
-                # regardless of the conditional  outcome we will clear our grid
-                grid[r][c] = ' '
-
-    # once we've ensure that the right space is open and it is not an edge we will map our temp_grid '*'
-    # to our game grid with this loop
-    for r in range(len(grid)):
-        for c in range(len(grid[0])):
-            if temp_grid[r][c] == '*':
-                grid[r][c] = '*'
-
-    # if the piece '*' was able to be move then in our conditional statement above
-    # temp_grid would have been updated and moved would have been changed to True
-    # so we return moved
-    #
-    # if we ran into any collisions in our initial loop, such as colliding with the wall or locked piece
-    # our function would immediately return False thus not executing the movement
-    return moved
-
-# The logic for move left is similar to move right. 
-# We define our grid_width as the length of our columns and we set our variable moved to False
-def move_left(grid, temp_grid):
-    moved = False
-    grid_width = len(grid[0])
-    
-    # We start with checking for the conditions of out of bounds or collision with a locked piece
-    # if any of our '*' collide with a locked '0' or go out of bounds we return False and prevent 
-    # the left movement from occuring
-    for r in range(len(grid)):
-        for c in range(len(grid[0])): 
-            # our left most bound is when c == 0 and a left psoition collision is
-            # defined by grid[r][c-1] == '0'
-            # we check see if we're at our left bound or if there is a locked piece
-            # in the left position that we intend to move to
-            # we return False anytime this case occurs to stop the left mvoement
-            if grid[r][c] == '*' and (c == 0 or grid[r][c - 1] == '0'):
-                return False  
-    
-    # We clear our temp_grid so that we don't have any collisions
-    for r in range(len(temp_grid)):
-        for c in range(len(temp_grid[0])):
-            temp_grid[r][c] = ' '
-
-    # we iterate through our grid and look for individual piece components denoted by '*'
-    for r in range(len(grid)):
-        for c in range(len(grid[0])):
-            if grid[r][c] == '*':
-                # Store in temp if left space is available
-                # if c-1 is 0 or greater we are within the bounds of our grid
-                # if grid[r][c-1] == ' ' then there is space on our grid to move left
-                # so we map to this left position on our temp_grid and change moved to True 
-                # so that our function can execute
-                if c - 1 >= 0 and grid[r][c - 1] == ' ':
-                    temp_grid[r][c - 1] = '*'
-                    moved = True            
-
-                # We then clear our original grid of the previous '*' so that they can be place in the 
-                # new left position
-                grid[r][c] = ' '
-
-    # We finally map the new position from our tem_grid to our game grid
-    for r in range(len(grid)):
-        for c in range(len(grid[0])):
-            if temp_grid[r][c] == '*':
-                grid[r][c] = '*'
-
-    # we return moved that is now True so that our function executes
-    return moved
-
-
-# we define a move_down function to move our piece down 1 row
-def move_down(grid, temp_grid):
-    # we set moved to False and should_lock to False to prevent our function from running if
-    # its conditions aren't met
-    # we define our row and column length by grid_height and grid_width
-    moved = False
-    grid_height = len(grid)
-    grid_width = len(grid[0])
-    should_lock = False
-
-    # We iterate through our grid and check to see if we in the last row or if there is a locked 
-    # piece below
-    for c in range(grid_width):
-        for r in range(grid_height):
-            if grid[r][c] == '*':
-            # the last row is defined by grid_height - 1 
-            # a locked peice below is defined by grid[r+1][c]
-            # if any of the '*' in our piece meets this condition we change should_lock to True and
-            # break out of this loop
-                if r == grid_height - 1 or grid[r + 1][c] == '0':
-                    should_lock = True
-                    break
-        if should_lock:
-            break
-
-    # we clear our temp grid like we did in move_left and move_right
-    for r in range(len(temp_grid)):
-        for c in range(len(temp_grid[0])):
-            temp_grid[r][c] = ' '
-
-    # We iterate through our grid starting from the bottom
-    for c in range(grid_width):
-        for r in range(grid_height - 1, -1, -1): 
-            if grid[r][c] == '*':
-                # if our piece denoted by '*' does not meet our locking condition and
-                # is not in our last row denoted by r+1 < grid_height and there is 
-                # an empty space below denoted by grid[r+1][c] == ' '
-                # then we move the piece down on our temp_grid and change moved to True
-                if not should_lock and r + 1 < grid_height and grid[r + 1][c] == ' ':
-                    temp_grid[r + 1][c] = '*'
-                    moved = True
-                else:
-                # otherwise we keep the piece in the same position and map it to our temp_grid
-                    temp_grid[r][c] = '*'
-                # we then clear our grid of the old piece position
-                grid[r][c] = ' '
-
-    # Finally, we map the moved down piece from our temp_grid back onto our game grid
-    for r in range(grid_height):
-        for c in range(grid_width):
-            if temp_grid[r][c] == '*':
-                grid[r][c] = '*'
-
-    # if the piece should lock we call our lock_pieces function and return False so that
-    # our move_down function doesn't execute
-    if should_lock:
-        lock_pieces(grid)
-        return False
-
-    # presuming there is space for our piece to move down, then moved is changed to True and our 
-    # move_down function is executed
-    return moved
-
-
-
-
-
-
-
-
-# since our section that we want to rotate is small compared to the big grid
-# we need to create a subgrid around our 'piece' to allow for a rotation
-# where the pieces do not end in the wrong parts of the grid
-def subgrid_bound(grid):
-    rows, cols = len(grid), len(grid[0])
-    min_row, max_row = rows, 0
-    min_col, max_col = cols, 0
-
-    # we iterate through our grid to the boundaries of our subgrid
-    # we use the min row, col and max row, col variables to do this
-    # the min and max function min(n1,n2..) take any number n and return
-    # the highest or lowest number n
-    # we thus get our boundary for our subgrid
-    for r in range(rows):
-        for c in range(cols):
-            if grid[r][c] == '*':
-                # min_row is set to the total number of rows
-                # r is when this iteration finds a '*' 
-                # if r is less than min_row, min_row then becomes r
-                # we repeat this until we have the smallest value for row
-                # our max_row starts at 0. As we iterate through our row and
-                # replace max_row with our greatest r
-                #
-                # we do this with our columns as well
-                min_row = min(min_row, r)
-                max_row = max(max_row, r)
-                min_col = min(min_col, c)
-                max_col = max(max_col, c)
-
-    # we then return all for values
-    return min_row, max_row, min_col, max_col
-
-# we want to isolate our subgrid from our game grid
-# we pass the arguements grid, min_row, max_row, min_col, max_col
-def isolate_subgrid(grid, min_row, max_row, min_col, max_col):
-
-    # we iterator through our min and max boundaries to get our subgrid matrix
-    # that we will use to rotate
-    subgrid = [row[min_col:max_col+1] for row in grid[min_row:max_row+1]]
-    return subgrid
-
-
-
-
-# we then use this subgrid to perform our matrix operations for the rotation
-def rotate(subgrid):
-
-    # we create a variable that can hold empty places for our transpose matrix
-    transpose = [[0] * len(subgrid) for _ in range(len(subgrid[0]))]
-
-    # we then iterate through our subgrid and switch the cols and rows or switch the x-y axis
-    for r in range(len(subgrid)):
-        for c in range(len(subgrid[0])):
-            transpose[c][r] = subgrid[r][c]
-    # We have
-    # [' ','*']
-    # ['*','*']
-    # ['*',' ']
-    # We get
-    # ['*','*',' ']
-    # [' ','*','*']
-
-
-    # We then reverse our rows in the transposed matrix
-    rotated = [row[::-1] for row in transpose]
-    # We then get
-    # [' ','*','*']
-    # ['*','*',' ']
-    # thus our piece is rotate 
-
-    return rotated
-
-
-
-
-
-
-
-# we clear our grid then map our rotated subgrid to our main grid
-def map_rotate_to_grid(grid, rotated, min_row, min_col):
-
-    # check if rotated is empty or has empty rows then return the unchanged grid
-    if not rotated or not rotated[0]: 
-        return grid 
-
-    # we get the length of the rows and columns for both the grid and rotated matrix
-    grid_rows, grid_cols = len(grid), len(grid[0])
-    rotated_rows, rotated_cols = len(rotated), len(rotated[0])
-    
-    # we need to prevent our rotated piece from going out of bounds
-    # we will add the starting point, the min_row and col and add the roated row and col
-    # which includes the length of the rotated row or column
-    # if either of these are greater we will subtract rotated_rows from our grid
-    # and start at the new min_row and min_col so that 
-    # our rotated piece does not go out of bounds
-    if min_row + rotated_rows > grid_rows:
-        min_row = grid_rows - rotated_rows
-    
-    if min_col + rotated_cols > grid_cols:
-        min_col = grid_cols - rotated_cols
-
-    # we clear our previous non rotated piece to allow for the rotation to be mapped to our grid
-    for r in range(len(grid)):
-        for c in range(len(grid[0])):
-            if grid[r][c] == '*':
-                grid[r][c] = ' '
-
-    for r in range(len(rotated)):
-        for c in range(len(rotated[0])):
-            # our mapping begins at our min row and colum
-            # # we map the length of rotated piece's row and column to our grid
-            grid[min_row + r][min_col + c] = rotated[r][c]
-
-
-
-
-def clear_lines(grid):
-    # we create a temporary place holder for cleared rows
-    new_grid = []
-    # we set our cleared rows counter to zero
-    lines_cleared = 0
-    # we define the length of our row on our grid
-    row_length = len(grid[0])
-
-    for row in grid:
-        # check to see if the row is filled denoted by '0'
-        if all(cell == '0' for cell in row):
-            # if the row is filled then increase the lines cleared counter
-            lines_cleared += 1
+    if upcoming:
+        draw_preview(display_surface, upcoming, len(grid[0]) * cell_size + 40, cell_size)
+
+
+# Next piece panel
+# the panel sits left pixels from the left of our window, to the right of our
+# grid. Every upcoming piece gets a slot 5 half size cells high, enough for the
+# standing I piece, and is centered in it
+def preview_rect(left, cell_size, count):
+    small = cell_size // 2
+    return py.Rect(left, 10, 6 * small, count * 5 * small)
+
+
+def draw_preview(display_surface, upcoming, left, cell_size):
+    small = cell_size // 2
+    for slot, kind in enumerate(upcoming):
+        state = ROTATIONS[kind][0]
+        piece_left = left + (6 - state.width) * small // 2
+        piece_top = 10 + slot * 5 * small + (5 - state.height) * small // 2
+        for i, j in state.cells:
+            rect = py.Rect(piece_left + j * small, piece_top + i * small, small, small)
+            py.draw.rect(display_surface, LIGHTER_GREEN, rect)
+            py.draw.rect(display_surface, DARK_GREEN, rect, 1)
+
+
+# Renderer
+# draw_grid() draws all 200 cells, builds a new font and renders the score text
+# every frame, and then the whole window is pushed to the screen even when nothing
+# moved. The Renderer draws the same picture, but it
+#   - draws our grid lines once onto a background surface
+#   - keeps one filled cell surface, our font and the rendered score text
+#   - remembers the grid it drew last, so it only redraws the cells that changed
+# draw() gives back the rectangles it changed, and we pass only those to
+# py.display.update()
+#
+# The renderer draws a view of view_rows by view_columns cells. On our normal
+# board that is the whole board, on a big board it is the window of the board
+# around our piece, so drawing a frame costs the same however big the board is
+#
+# preview is how many upcoming pieces the next piece panel holds, the panel is
+# only drawn again when a new piece is dealt
+class Renderer:
+    def __init__(self, display_surface, view_columns=columns, view_rows=rows, cell_size=cell_size, preview=0):
+        self.display_surface = display_surface
+        self.view_columns = view_columns
+        self.view_rows = view_rows
+        self.cell_size = cell_size
+        self.preview_left = view_columns * cell_size + 40
+        self.preview_rect = preview_rect(self.preview_left, cell_size, preview)
+        self.last_upcoming = None
+
+        # our background is black with the grid lines drawn on it once
+        self.background = py.Surface(display_surface.get_size())
+        self.background.fill(BLACK)
+        for row in range(view_rows):
+            for col in range(view_columns):
+                py.draw.rect(self.background, DARK_GREEN, self.cell_rect(row, col), 1)
+
+        # a cell filled with our piece color, blitted for every '*' and '0'
+        self.block = py.Surface((cell_size, cell_size))
+        self.block.fill(LIGHTER_GREEN)
+        # the outline of a ghost cell, blitted for every '+'. Black is see
+        # through so the grid line under it still shows
+        self.ghost_block = py.Surface((cell_size, cell_size))
+        self.ghost_block.set_colorkey(BLACK)
+        py.draw.rect(self.ghost_block, LIGHT_GREEN, py.Rect(2, 2, cell_size - 4, cell_size - 4), 2)
+
+        self.font = py.font.Font(None, 36)
+        self.score = None
+        self.score_text = None
+        self.score_rect = py.Rect(10, 10, 0, 0)
+
+        # the grid we drew last, None until our first frame is drawn
+        self.last_grid = None
+
+    # the rectangle of a cell, with the same offsets as draw_grid()
+    def cell_rect(self, row, col):
+        size = self.cell_size
+        return py.Rect(col * size + 20, row * size + 10, size, size)
+
+    # the cells that sit under a rectangle, used to redraw the cells under our score
+    def cells_under(self, rect):
+        size = self.cell_size
+        first_col = max((rect.left - 20) // size, 0)
+        last_col = min((rect.right - 20) // size, self.view_columns - 1)
+        first_row = max((rect.top - 10) // size, 0)
+        last_row = min((rect.bottom - 10) // size, self.view_rows - 1)
+        return [(row, col) for row in range(first_row, last_row + 1)
+                for col in range(first_col, last_col + 1)]
+
+    # forget what we drew, so the next draw() redraws the whole window
+    # we need this when the window has been covered or restored
+    def invalidate(self):
+        self.last_grid = None
+        self.last_upcoming = None
+
+    # forget the cells under rect, so the next draw() redraws them. Used when
+    # something else has been drawn on top of them
+    def forget(self, rect):
+        if self.last_grid is None:
+            return
+        for row, col in self.cells_under(rect):
+            self.last_grid[row][col] = None
+
+    def draw(self, grid, score, upcoming=()):
+        surface = self.display_surface
+
+        # on our first frame we draw everything
+        if self.last_grid is None:
+            surface.blit(self.background, (0, 0))
+            dirty_cells = [(row, col) for row in range(self.view_rows)
+                           for col in range(self.view_columns)]
+            score_changed = True
+            dirty = [surface.get_rect()]
         else:
-            # if the row is NOT cleared then we append that row to our new_grid
-            new_grid.append(row.copy())
-
-    # Add new empty rows to the top of new_grid to replace the cleared rows
-    for _ in range(lines_cleared):
-        new_grid.insert(0, [' ' for _ in range(row_length)])
-
-    return new_grid, lines_cleared
-    
-
-
-
-# we iterate through our grid
-# if we encounter a '*' on our grid we change it to a '0', which 
-# locks our piece
-def lock_pieces(grid):
-    rows, cols = len(grid), len(grid[0])
-    for r in range(rows):
-        for c in range(cols):
-            if grid[r][c] == '*':
-                grid[r][c] = '0'
-
-
-# score increase based on the amount of lines_cleared in one move
-def calculate_score(lines_cleared):
-    if lines_cleared == 1:
-        return 100
-    elif lines_cleared == 2:
-        return 300
-    elif lines_cleared == 3:
-        return 500
-    elif lines_cleared == 4:
-        return 800
-    else:
-        return 0
+            # we compare whole rows first, which is quick, and only look at the
+            # cells of the rows that changed
+            dirty_cells = []
+            for row in range(self.view_rows):
+                if grid[row] != self.last_grid[row]:
+                    last_row = self.last_grid[row]
+                    dirty_cells.extend((row, col) for col in range(self.view_columns)
+                                       if grid[row][col] != last_row[col])
+            score_changed = score != self.score
+            dirty = []
+
+        # we only render our score text again when the score changes
+        text_area = self.score_rect
+        if score_changed:
+            self.score = score
+            self.score_text = self.font.render(f"Score: {score}", True, WHITE)
+            self.score_rect = self.score_text.get_rect(topleft=(10, 10))
+            text_area = text_area.union(self.score_rect)
+
+        # our score is drawn on top of the grid, and its text is see through at
+        # the edges, so when the score changes or a cell under it changes we
+        # redraw everything under the old and new text before blitting it again
+        redraw_score = score_changed or any(
+            self.cell_rect(row, col).colliderect(text_area) for row, col in dirty_cells
+        )
+        if redraw_score:
+            surface.blit(self.background, text_area, text_area)
+            dirty.append(text_area)
+            dirty_cells = set(dirty_cells).union(self.cells_under(text_area))
+
+        for row, col in dirty_cells:
+            rect = self.cell_rect(row, col)
+            surface.blit(self.background, rect, rect)
+            if grid[row][col] == '*' or grid[row][col] == '0':
+                surface.blit(self.block, rect)
+            elif grid[row][col] == '+':
+                surface.blit(self.ghost_block, rect)
+            dirty.append(rect)
+
+        if redraw_score:
+            surface.blit(self.score_text, self.score_rect)
+
+        upcoming = tuple(upcoming)
+        if upcoming != self.last_upcoming:
+            self.last_upcoming = upcoming
+            surface.blit(self.background, self.preview_rect, self.preview_rect)
+            draw_preview(surface, upcoming, self.preview_left, self.cell_size)
+            dirty.append(self.preview_rect)
+
+        self.last_grid = [list(row) for row in grid]
+        return dirty
+
+
+# Profiler overlay
+# when profiling is on we show the profiler's numbers in a see through box at
+# the bottom left of our grid. We render the text again every few frames, and
+# every frame we blit the box over our cells and make the renderer forget the
+# cells under it, so they are drawn fresh under the next frame's box
+class ProfileOverlay:
+    def __init__(self, display_surface, renderer, profiler, every=15):
+        self.display_surface = display_surface
+        self.renderer = renderer
+        self.profiler = profiler
+        self.every = every
+        self.font = py.font.Font(None, 20)
+        self.box = None
+
+    def draw(self, frame):
+        if self.box is None or frame % self.every == 0:
+            lines = [self.font.render(line, True, WHITE) for line in self.profiler.overlay_lines()]
+            grid_width = self.renderer.view_columns * self.renderer.cell_size
+            width = min(max(line.get_width() for line in lines) + 8, grid_width)
+            height = sum(line.get_height() for line in lines) + 8
+            self.box = py.Surface((width, height), py.SRCALPHA)
+            self.box.fill((0, 0, 0, 190))
+            y = 4
+            for line in lines:
+                self.box.blit(line, (4, y))
+                y += line.get_height()
+        grid_bottom = self.renderer.view_rows * self.renderer.cell_size + 10
+        rect = self.box.get_rect(bottomleft=(20, grid_bottom))
+        self.display_surface.blit(self.box, rect)
+        self.renderer.forget(rect)
+        return rect
+
+
+# Viewport
+# on a board bigger than our window we only show view_rows by view_columns
+# cells. We move the view when our piece gets within a quarter of the view of
+# its edge, and keep it still otherwise so the renderer has little to redraw.
+# We give back the new top row and left column of the view
+def follow_piece(board, top, left, view_rows, view_columns):
+    piece = board.piece
+    if piece is None:
+        return top, left
+    state = piece.state
+    margin = view_rows // 4
+    if piece.row < top + margin:
+        top = piece.row - margin
+    elif piece.row + state.height > top + view_rows - margin:
+        top = piece.row + state.height - view_rows + margin
+    margin = view_columns // 4
+    if piece.col < left + margin:
+        left = piece.col - margin
+    elif piece.col + state.width > left + view_columns - margin:
+        left = piece.col + state.width - view_columns + margin
+    top = max(0, min(top, board.rows - view_rows))
+    left = max(0, min(left, board.columns - view_columns))
+    return top, left
 
-# we define our game over condition in this function
-def game_over_condition(grid):
-    # Check if any cell in the top row contains a locked piece
-    return any(cell == '0' for cell in grid[0])
 
 def game_over(display_surface):
     font = py.font.SysFont('Arial', 26)
@@ -597,14 +387,56 @@ def game_over(display_surface):
 
 
 
-def game_loop():
+# gravity_curve holds the seconds between gravity steps for every level, see
+# GRAVITY_CURVE in tetris/engine.py
+# seed picks our pieces, a random one is chosen when it is None
+# record is the path of a replay archive, when it is set the game is appended
+# to it as a replay once the game ends or the window is closed
+# autoplay lets the computer play the game, making a move every autoplay_delay
+# seconds. True or 'heuristic' plays with our heuristic player and 'planner'
+# with the lookahead planner, which also uses the next piece panel
+# columns and rows set the size of our board. Boards bigger than the window are
+# shown through a view of at most view_rows by view_columns cells that follows
+# our piece, and cell_size is picked so the view fits on the screen
+# randomizer picks how our pieces are dealt, see tetris/randomizer.py, and
+# preview is how many of the next pieces we show, 0 hides the panel
+# profile times every frame and shows the timings on screen, see
+# tetris/profiling.py. It is also turned on by TETRIS_PROFILE=1 and by giving
+# profile_json or profile_trace, the files we export the timings to when the
+# window is closed
+# das and arr are the seconds a held key waits before it repeats and between
+# its repeats, see tetris/input.py
+def game_loop(gravity_curve=GRAVITY_CURVE, seed=None, record=None, autoplay=False, autoplay_delay=0.05,
+              columns=columns, rows=rows, cell_size=None, view_columns=None, view_rows=None,
+              randomizer='bag', preview=PREVIEW, profile=False, profile_json=None, profile_trace=None,
+              das=DAS, arr=ARR, save=None, autosave_every=5.0):
     py.init()
+
+    # when we have a checkpoint from a game that was closed we carry on with
+    # it, on its board and with its pieces, so we load it before we size our
+    # window. Its timers are how far gravity and autoplay had got
+    resumed = None
+    timers = ()
+    if save and os.path.exists(save):
+        resumed, timers = load_checkpoint(save)
+        columns, rows = resumed.columns, resumed.rows
+        randomizer, preview = resumed.randomizer, resumed.preview
+
+    # on our normal board the view is the whole board with 40 pixel cells
+    view_rows = view_rows or min(rows, MAX_VIEW_ROWS)
+    view_columns = view_columns or min(columns, MAX_VIEW_COLUMNS)
+    cell_size = cell_size or min(40, 800 // view_rows, 1200 // view_columns)
+    view_top = view_left = 0
+
     #https://www.pygame.org/docs/ref/display.html#pygame.display.set_mode
     # display.set_mode() intializes our game window and generate our display surface
     # we pass display.set_mode() our size denated by a pair of numbers our height and width
     # recall that we have a game width of 400 pixels and height of 800 pixels
     # we add 40 pixels of additional space to our height and width
-    display_surface = py.display.set_mode((game_width + 40, game_height + 40))
+    # the next piece panel takes 3 more cells to the right of our grid
+    panel_width = preview_rect(0, cell_size, preview).width + 20 if preview else 0
+    display_surface = py.display.set_mode((view_columns * cell_size + 40 + panel_width,
+                                           view_rows * cell_size + 40))
     # https://www.pygame.org/docs/ref/display.html#pygame.display.set_caption
     # display.set_caption() takes our title arguement and returns it in our display
     # window. So we pass it the title of our game, 'Tetris'
@@ -612,204 +444,237 @@ def game_loop():
 
     clock = py.time.Clock()
 
-    # initialize score
-    global score
-    score = 0
-
-
-    # we initialize our grid for our playing game
-    grid = create_grid()
-    # we initialize our temp_grid to manage the pieces of our game
-    temp_grid = create_grid()
-    # we generate a random piece and store it in variable piece
-    piece = random_piece()
-    # we then map our piece to game
-    map_to_grid(piece, grid)
-
-    kill_game = False
-
-    # we define our auto_move_down function in our game loop that will
-    # access our variables and thread functions
-    def auto_move_down(delay = 0.4):
-        # we access our global variable score so that we can modify it inside of
-        # this function
-        global score
-        # we call the nonlocal kill_game because we want to modify it in this function, 
-        # but not affect outside of this function
-        nonlocal kill_game
-        # when kill_game is True our game will cease and call game over
-        # so when we pass while not kill_game; our function will continue to
-        # run. 
-        while not kill_game:
-            # https://www.geeksforgeeks.org/sleep-in-python/
-            # the function sleep() in our time library suspends the execution of our
-            # function for a set amount of seconds. We need this function to properly
-            # pass our function to Thread which is needed to continuously call auto_move_down
-            # while all of our other functions are called
-            time.sleep(delay)
-            # if our conditions for move_down are met we set moved = move_down since
-            # move_down will return True
-            moved = move_down(grid, temp_grid)
-            # However if we can not move down we need to pass a couple of other functions.
-            # these functions must account for locking a piece, clearing_lines, scoring,
-            # generating random pieces, mapping them to grid and ending the game if the
-            # game over conditions are met.
-            if not moved:
-                # if we cannot move we first lock our piece which involves changing all
-                # '*' to '0'
-                lock_pieces(grid)
-                # we set our function clear_lines equal to our nested list new_grid and
-                # lines_cleared, which counts how many lines need to be cleared
-                new_grid, lines_cleared = clear_lines(grid)
-                # we then update our grid with the grid that has the lines cleared denoted
-                # by new_grid
-                grid[:] = new_grid
-                # we pass lines cleared to our calculate_score function on store the value in
-                # score_increase
-                score_increase = calculate_score(lines_cleared)
-                # we then add value to our score
-                score += score_increase
-                # we then check our game_over_condition, where there any '0' in row 0
-                # and if this condtion is met we set kill_game to True which will terminate
-                # our while loop and stop the pieces from moving
-                if game_over_condition(grid):
-                    kill_game = True
-                # however, if the game over condition is not met we will generate a new piece
-                # and map it to our grid
-                else:
-                    piece = random_piece()
-                    map_to_grid(piece, grid)
-    # https://www.geeksforgeeks.org/multithreading-python-set-1/
-    # we use threading to achieve multitasking
-    # we use the function Thread(target, args) which takes the target - function
-    # to be executed and arguments being passed to the target function
-    # as we can see our time delay of 0.4 is passed
-    auto_move_thread = threading.Thread(target=lambda: auto_move_down(delay=0.4))    
-    auto_move_thread.daemon = True
-    
-    # we then call start() on our thread to being multithreading so that auto_move_down
-    # is always running in our background while the game is still running
-    auto_move_thread.start()
+    # our engine holds the board, the piece and the score of our game
+    # it handles locking, clearing lines, scoring and spawning new pieces, so
+    # our game loop only has to pass it actions and draw what it holds
+    # we always start from a known seed so that a recorded game can be replayed
+    if resumed:
+        engine = resumed
+    else:
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        engine = TetrisEngine(seed, columns, rows, randomizer, preview)
+
+    # the recorder remembers every action and gravity tick with its frame number
+    # a replay plays a game from its first piece, so a resumed game isn't recorded
+    recorder = ReplayRecorder(engine) if record and not resumed else None
+    frame = 0
+
+    # we save our replay once, either when the game ends or when the window closes
+    def save_replay():
+        nonlocal recorder
+        if recorder:
+            recorder.save(record)
+            recorder = None
+
+    # we map our keys to the actions our engine understands
+    key_actions = {
+        py.K_LEFT: LEFT,
+        py.K_RIGHT: RIGHT,
+        py.K_DOWN: DOWN,
+        py.K_SPACE: ROTATE,
+        py.K_UP: HARD_DROP,
+    }
+
+    # our renderer only redraws the cells that changed since the last frame
+    renderer = Renderer(display_surface, view_columns, view_rows, cell_size, preview)
+    # we only draw our game over box once, it stays on screen after that
+    game_over_shown = False
+
+    # with profiling off there is no profiler, and every check for it below
+    # is a single comparison with None
+    profiler = None
+    if profile or profile_json or profile_trace or profiling_requested():
+        profiler = FrameProfiler()
+        overlay = ProfileOverlay(display_surface, renderer, profiler)
+
+    def export_profile():
+        if profile_json:
+            profiler.export_json(profile_json)
+        if profile_trace:
+            profiler.export_chrome_trace(profile_trace)
+
+    # every action we pass to our engine, from a key or from our player, is
+    # recorded and counted the same way
+    def apply(action):
+        if recorder and not engine.game_over:
+            recorder.record(frame, action)
+        if profiler and not engine.game_over:
+            profiler.action(action)
+        engine.step(action)
+
+    # Input
+    # key presses and releases go into our input buffer with the time we read
+    # them. The buffer repeats held keys and gives the actions back in order
+    # on the simulation tick they are due
+    inputs = InputBuffer(das, arr)
+
+    # Simulation
+    # our game runs on a single thread, so gravity and key presses never change
+    # the board at the same time. The game moves forward in fixed ticks of TICK
+    # seconds, sim_time is the time our last tick ended. Every frame we run the
+    # ticks that fit up to now, and every tick first applies its actions and
+    # then adds TICK to gravity_time. Every time gravity_time holds a full
+    # gravity delay we take the delay off and move our piece down a row with
+    # engine.tick(). The delay comes from our gravity curve and gets shorter as
+    # the level goes up
+    sim_time = perf_counter()
+    gravity_time = timers[0] if timers else 0.0
+
+    # in autoplay mode our player makes a move every time autoplay_time holds
+    # a full autoplay_delay, the same way gravity works
+    if autoplay == 'planner':
+        player = PlannerPolicy()
+    else:
+        player = HeuristicPolicy() if autoplay else None
+    autoplay_time = timers[1] if len(timers) > 1 else 0.0
+
+    # Saving
+    # with a save file we write a checkpoint of our game every autosave_every
+    # seconds and when the window closes. A checkpoint takes microseconds, so
+    # autosaving doesn't cost us a frame. A finished game has nothing to
+    # resume, so at game over we delete the file
+    autosave_time = perf_counter() + autosave_every
+
+    def save_game():
+        if save and not engine.game_over:
+            save_checkpoint(save, engine, (gravity_time, autoplay_time))
 
     # we create a while loop to handle the functions of our game
     # we want our game to continue to run until we reach our game over condition
     while True:
+        if profiler:
+            profiler.start_frame()
         # https://www.youtube.com/watch?v=KR2zP6yuWAs
         # https://www.pygame.org/docs/ref/event.html
         # pygame.event.get() will get all of the events and store them as a list
         # our event handler users a for loop to iterate through our event list
         # if the event is one that we need then we catch it with an if statement
         #
+        now = perf_counter()
         for event in py.event.get():
             # close game
             # if the user presses quit on our game window this will exit our window
             # and close our game
             # we uses even.type to look for the event py.QUIT to close our game
             if event.type == py.QUIT:
+                save_replay()
+                save_game()
+                if profiler:
+                    export_profile()
                 py.quit()
                 exit()
-            # Move piece and run if game over condition NOT met denoted
-            # by  kill_game
-            # this is our outter elif statement since while our game is running
-            # it needs to accept events Left key, Right key, Down key, and Space key
-            # to allow our pieces to move and rotate
-            # we achieve this with py.KEYDOWN denoted the keys that will be pressed down 
-            # to trigger our function
-            elif event.type == py.KEYDOWN and not kill_game:
-                # we start will our Right Key event to move our piece right
-                # if this event is called we simply call our move_right() function
-                # recall that our move_right function() handles the out of
-                # bounds and collision cases
-                if event.key == py.K_RIGHT:  
-                    move_right(grid, temp_grid)
-                # we set the condition for our left key event and pass
-                # our move left function
-                elif event.key == py.K_LEFT: 
-                    move_left(grid, temp_grid)
-                # our condition for move down takes many functions
-                # consider that when we reach the bottom of our tetris grid
-                # we cannot move down anymore so we will need to lock our piece
-                # and map the new piece to the grid so we can continue to uses
-                # move down also hands our clear lines, scoring and come over conditions
-                elif event.key == py.K_DOWN:
-                    # if our piece cannot move down we must:
-                    # 1. lock our piece
-                    # 2. clear our row if possible (the if conditon is built
-                    # into clear_lines() to check if the conditions are met)
-                    #   - update our grid with new rows if we cleared a row
-                    #   - calculate our score increase if we cleared a row
-                    #   - and finally increase our score
-                    #
-                    # we then check to see if our game over condition is met
-                    # if it is not we genderate a new piece and map it to our
-                    # grid
-                    if not move_down(grid, temp_grid):
-                        # lock piece
-                        lock_pieces(grid)
-                        # clear line if row filled
-                        new_grid, lines_cleared = clear_lines(grid)
-                        # generate our new grid with the cleared row gone
-                        grid[:] = new_grid
-                        # calculate our score
-                        score_increase = calculate_score(lines_cleared)
-                        # increase our score
-                        score += score_increase
-
-                        # check game over condition
-                        if game_over_condition(grid):
-                            # we change kill_game to kill to stop all of the events under our 
-                            # left key, right key, down key, and space key event
-                            # recall that the elif condition containing all of these events is
-                            # elif event.type == py.KEYDOWN and not kill_game:
-                            # so once kill_game is True then all of these events stop and we
-                            # call our game over display further down in this code
-                            kill_game = True
-                        else:
-                            # if our game over condition isn't met; since we have locked
-                            # our piece in the above event call and check the other conditions
-                            # it is time to generate a new piece and map it to the grid
-                            piece = random_piece() 
-                            map_to_grid(piece, grid)
-                # our space key handles the rotate peiece event
-                elif event.key == py.K_SPACE: 
-                    # when we call rotate we must call our subgrid_bound()function to
-                    # get the min and max row and column matrix values
-                    min_row, max_row, min_col, max_col = subgrid_bound(grid)
-                    # we then isolate our subgrid and store it in a variable subgrid
-                    # so we have
-                    # [' ',' ',' ',' ',' ',' ']
-                    # [' ',' ',' ',['*','*'],' ']
-                    # [' ',' ',['*','*'],' ',' ']
-                    # [' ',' ',' ',' ',' ',' ']
-                    # [' ',' ',' ',' ',' ',' ']
-                    # the subgrid within our game grid
-                    subgrid = isolate_subgrid(grid, min_row, max_row, min_col, max_col)
-                    # we then pass our subgrid to the rotate() fundtion in store in 
-                    # in variable rotate
-                    rotated = rotate(subgrid)
-                    # then clear the non rotated piece from our grid
-                    clear_piece(grid) 
-                    # last we map our rotated piece to our grid using
-                    # our map_rotate_to_grid() function 
-                    map_rotate_to_grid(grid, rotated, min_row, min_col)
-        
-        # Fill background
-        display_surface.fill(BLACK)
+            # the Left key, Right key, Down key and Space key move and rotate our
+            # piece, and the Up key drops it. We look up the action for the key
+            # and put it in our input buffer, holding Left, Right or Down repeats
+            # it until the key comes up again
+            elif event.type == py.KEYDOWN and event.key in key_actions:
+                inputs.press(key_actions[event.key], now)
+            elif event.type == py.KEYUP and event.key in key_actions:
+                inputs.release(key_actions[event.key], now)
+            # we don't see keys come up while our window doesn't have the focus
+            elif event.type == py.WINDOWFOCUSLOST:
+                inputs.release_all(now)
+            # if our window was hidden or restored its contents may be gone, so
+            # we draw everything again
+            elif event.type in (py.WINDOWEXPOSED, py.WINDOWRESTORED):
+                renderer.invalidate()
+                game_over_shown = False
+        if profiler:
+            profiler.lap('input')
+
+        # We never run more than MAX_CATCH_UP, a quarter of a second, of ticks
+        # per frame, so if the window is dragged or paused our piece doesn't
+        # drop many rows at once. The key presses waiting in our buffer are
+        # kept and the next tick applies them all, held keys only repeat for
+        # the same quarter of a second
+        now = perf_counter()
+        sim_time = max(sim_time, now - MAX_CATCH_UP)
+        catch_up_start = sim_time
+        while sim_time + TICK <= now:
+            sim_time += TICK
+            if player and not engine.game_over:
+                autoplay_time += TICK
+                while autoplay_time >= autoplay_delay and not engine.game_over:
+                    autoplay_time -= autoplay_delay
+                    apply(player.act(engine))
+
+            for action in inputs.take(sim_time, catch_up_start):
+                apply(action)
+
+            # we move our piece down once for every gravity delay that has passed
+            if not engine.game_over:
+                gravity_time += TICK
+                delay = gravity_delay(engine.level, gravity_curve)
+                while gravity_time >= delay and not engine.game_over:
+                    gravity_time -= delay
+                    if recorder:
+                        recorder.tick(frame)
+                    if profiler:
+                        profiler.count('ticks')
+                    engine.tick()
+        if save and now >= autosave_time:
+            save_game()
+            autosave_time = now + autosave_every
+        if profiler:
+            profiler.observe(engine)
+            profiler.lap('update')
 
         # Draw grid with pieces
-        draw_grid(display_surface, grid, score)
-        
+        # engine.grid() maps our locked cells to '0', our piece to '*' and the
+        # ghost showing where our piece will land to '+'. The board finds the
+        # landing row from its column heights, so the ghost costs no scanning
+        # the renderer draws the cells that changed and tells us where they are
+        # on a big board we only build and draw the cells inside our view
+        view_top, view_left = follow_piece(engine.board, view_top, view_left, view_rows, view_columns)
+        view = engine.grid(view_top, view_left, view_rows, view_columns, ghost=True)
+        dirty = renderer.draw(view, engine.score, engine.upcoming())
+        if profiler:
+            dirty.append(overlay.draw(frame))
+            profiler.lap('render')
+
+        # Update display
+        # we only push the changed rectangles to the screen
+        if dirty:
+            py.display.update(dirty)
+        if profiler:
+            profiler.lap('present')
+            profiler.end_frame()
+
         # if our game over condition is met all key board and auto move down
         # events will end and we will display our game over surface
-        if kill_game:
+        # game_over() flips the whole display itself
+        if engine.game_over and not game_over_shown:
+            save_replay()
+            if save and os.path.exists(save):
+                os.remove(save)
             game_over(display_surface)
-
-
-        # Update display
-        py.display.update()
+            game_over_shown = True
 
         # Cap the frame rate
         clock.tick(60)
+        frame += 1
 
 if __name__ == '__main__':
-    game_loop()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Play Tetris.')
+    parser.add_argument('--seed', type=int, help='seed for the pieces')
+    parser.add_argument('--record', metavar='FILE', help='append a replay of the game to FILE')
+    parser.add_argument('--autoplay', nargs='?', const='heuristic', choices=['heuristic', 'planner'],
+                        help='let the computer play, with the heuristic player or the lookahead planner')
+    parser.add_argument('--columns', type=int, default=columns, help='width of the board')
+    parser.add_argument('--rows', type=int, default=rows, help='height of the board')
+    parser.add_argument('--cell-size', type=int, help='size of a cell in pixels')
+    parser.add_argument('--randomizer', choices=list(RANDOMIZERS), default='bag', help='how pieces are dealt')
+    parser.add_argument('--preview', type=int, default=PREVIEW, help='how many next pieces to show')
+    parser.add_argument('--das', type=float, default=DAS, help='seconds a held key waits before it repeats')
+    parser.add_argument('--arr', type=float, default=ARR, help='seconds between the repeats of a held key')
+    parser.add_argument('--save', metavar='FILE', help='resume the game saved in FILE and save it there on exit')
+    parser.add_argument('--profile', action='store_true', help='time every frame and show the timings')
+    parser.add_argument('--profile-json', metavar='FILE', help='save a summary of the timings to FILE on exit')
+    parser.add_argument('--profile-trace', metavar='FILE', help='save a Chrome trace of the last frames to FILE on exit')
+    args = parser.parse_args()
+    game_loop(seed=args.seed, record=args.record, autoplay=args.autoplay,
+              columns=args.columns, rows=args.rows, cell_size=args.cell_size,
+              randomizer=args.randomizer, preview=args.preview, profile=args.profile,
+              profile_json=args.profile_json, profile_trace=args.profile_trace,
+              das=args.das, arr=args.arr, save=args.save)
\ No newline at end of file
@@ -0,0 +1,502 @@
+# Benchmarks
+#
+# Times the hot paths of the game on fixed, seeded boards and reports how many
+# operations we can do per second and the peak bytes of one operation: the
+# most memory it had allocated at once, as tracemalloc sees it. That is not a
+# count of allocations, CPython doesn't count those for us, but an operation
+# that allocates nothing peaks at 0 bytes and one that builds a new grid
+# peaks at the size of the grid. We measure both the nested list grid
+# functions from tetris/grid.py and the bitboard the game now plays on, so we
+# can see what one costs against the other.
+#
+# The boards we measure on:
+#   empty:    a new game, the piece at the top of an empty board
+#   near_full: 16 locked rows with one gap in each row
+#   cascade:  4 full rows except for column 0, with an I piece above the gap,
+#             so dropping it clears 4 lines at once
+#
+# We also play whole headless games to get games per second, and when pygame is
+# installed we time draw_grid() and the Renderer on an offscreen SDL window.
+# Moving, gravity and drawing a frame through the view are timed on boards from
+# 10x20 up to 200x1000, their cost should stay flat as the board grows.
+#
+#   python benchmarks/bench.py --save baseline.json
+#   python benchmarks/bench.py --compare baseline.json
+#
+# A comparison run fails when any benchmark gets more than --tolerance slower
+# than the baseline, 25% by default.
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tetris import ai, grid  # noqa: E402
+from tetris.bitboard import Bitboard  # noqa: E402
+from tetris.checkpoint import decode_checkpoint, encode_checkpoint  # noqa: E402
+from tetris.engine import ACTIONS, LEFT, RIGHT, TetrisEngine  # noqa: E402
+from tetris.input import TICK, InputBuffer  # noqa: E402
+from tetris.policies import HeuristicPolicy, PlannerPolicy  # noqa: E402
+from tetris.profiling import PHASES, FrameProfiler  # noqa: E402
+from tetris.randomizer import RANDOMIZERS, PieceQueue  # noqa: E402
+from tetris.shared import BoardExport  # noqa: E402
+from tetris.stream import StateEncoder, json_frame  # noqa: E402
+
+I_PIECE = 0
+BOARD_SIZES = [(10, 20), (100, 400), (200, 1000)]
+
+
+# Boards
+
+def empty_board():
+    board = Bitboard()
+    board.spawn(random.Random(0).choice(range(7)))
+    return board
+
+
+def near_full_board():
+    rng = random.Random(1)
+    board = Bitboard()
+    for row in range(4, board.rows):
+        board.locked[row] = board.full_row & ~(1 << rng.randrange(board.columns))
+    board.rebuild_heights()
+    board.spawn(5)
+    return board
+
+
+def cascade_board():
+    board = Bitboard()
+    for row in range(board.rows - 4, board.rows):
+        board.locked[row] = board.full_row & ~1
+    board.rebuild_heights()
+    board.spawn(I_PIECE, start_col=0)
+    return board
+
+
+SCENARIOS = {
+    'empty': empty_board,
+    'near_full': near_full_board,
+    'cascade': cascade_board,
+}
+
+
+
+
+# Measuring
+# every benchmark is a setup function that builds a fresh state and an
+# operation that runs on it. Only the operation is timed, and we take off what
+# the timer itself costs
+
+def timer_overhead():
+    clock = time.perf_counter_ns
+    samples = []
+    for _ in range(1000):
+        start = clock()
+        samples.append(clock() - start)
+    return min(samples)
+
+
+def measure(setup, operation, seconds):
+    clock = time.perf_counter_ns
+    overhead = timer_overhead()
+    total = 0
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline or count < 10:
+        state = setup()
+        start = clock()
+        operation(state)
+        total += max(clock() - start - overhead, 1)
+        count += 1
+
+    # the peak bytes of one operation, measured on its own so the
+    # tracing doesn't slow down the timing above
+    state = setup()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    operation(state)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return {'ops_per_sec': count * 1e9 / total, 'peak_bytes': peak}
+
+
+# Benchmarks
+
+def grid_setup(make_board):
+    template = make_board().to_grid()
+
+    def setup():
+        return [row[:] for row in template], grid.create_grid()
+    return setup
+
+
+def grid_rotate(state):
+    board, _ = state
+    min_row, max_row, min_col, max_col = grid.subgrid_bound(board)
+    rotated = grid.rotate(grid.isolate_subgrid(board, min_row, max_row, min_col, max_col))
+    grid.clear_piece(board)
+    grid.map_rotate_to_grid(board, rotated, min_row, min_col)
+
+
+def grid_drop_and_clear(state):
+    board, temp = state
+    while grid.move_down(board, temp):
+        pass
+    grid.lock_pieces(board)
+    new_grid, _ = grid.clear_lines(board)
+    board[:] = new_grid
+
+
+def board_setup(make_board):
+    template = make_board()
+    return template.clone
+
+
+def board_drop_and_clear(board):
+    board.hard_drop()
+    board.clear_lines()
+
+
+# a board together with a snapshot of a different board to restore on it
+def snapshot_setup(make_board):
+    snapshot = make_board().snapshot()
+    return lambda: (Bitboard(), snapshot)
+
+
+def operation_benchmarks():
+    benchmarks = {}
+    for scenario, make_board in SCENARIOS.items():
+        grid_state = grid_setup(make_board)
+        board_state = board_setup(make_board)
+        benchmarks.update({
+            f'grid.move_down[{scenario}]': (grid_state, lambda s: grid.move_down(*s)),
+            f'grid.move_left[{scenario}]': (grid_state, lambda s: grid.move_left(*s)),
+            f'grid.move_right[{scenario}]': (grid_state, lambda s: grid.move_right(*s)),
+            f'grid.rotate[{scenario}]': (grid_state, grid_rotate),
+            f'grid.drop_and_clear_lines[{scenario}]': (grid_state, grid_drop_and_clear),
+            f'bitboard.move_down[{scenario}]': (board_state, Bitboard.move_down),
+            f'bitboard.move_left[{scenario}]': (board_state, Bitboard.move_left),
+            f'bitboard.move_right[{scenario}]': (board_state, Bitboard.move_right),
+            f'bitboard.rotate[{scenario}]': (board_state, Bitboard.rotate),
+            f'bitboard.drop_and_clear_lines[{scenario}]': (board_state, board_drop_and_clear),
+            f'bitboard.ghost[{scenario}]': (board_state, Bitboard.ghost),
+            f'bitboard.clone[{scenario}]': (board_state, Bitboard.clone),
+            f'bitboard.snapshot[{scenario}]': (board_state, Bitboard.snapshot),
+            f'bitboard.restore[{scenario}]': (snapshot_setup(make_board), lambda s: s[0].restore(s[1])),
+            f'ai.placements[{scenario}]': (board_state, ai.placements),
+        })
+    return benchmarks
+
+
+# we play whole games headless, one with random keys and one with the heuristic
+# player, and count games per second
+def game_benchmarks():
+    def random_game(seed):
+        engine = TetrisEngine(seed)
+        rng = random.Random(seed)
+        while not engine.game_over:
+            engine.step(rng.choice(ACTIONS))
+            engine.tick()
+
+    def heuristic_game(seed):
+        engine = TetrisEngine(seed)
+        player = HeuristicPolicy()
+        while not engine.game_over and engine.pieces <= 100:
+            engine.step(player.act(engine))
+
+    # the planner without a time budget, so it always does the same work
+    def planner_game(seed):
+        engine = TetrisEngine(seed)
+        player = PlannerPolicy(time_budget=None, max_depth=2)
+        while not engine.game_over and engine.pieces <= 20:
+            engine.step(player.act(engine))
+
+    seeds = iter(range(10 ** 9))
+    return {
+        'game.random': (lambda: next(seeds), random_game),
+        'game.heuristic_100_pieces': (lambda: next(seeds), heuristic_game),
+        'game.planner_depth2_20_pieces': (lambda: next(seeds), planner_game),
+    }
+
+
+# dealing one piece from each randomizer with a full preview queue
+def randomizer_benchmarks():
+    benchmarks = {}
+    for name in RANDOMIZERS:
+        queue = PieceQueue(0, name)
+        benchmarks[f'pieces.next[{name}]'] = (lambda queue=queue: queue, PieceQueue.next)
+    return benchmarks
+
+
+# what profiling adds to one frame of game_loop()
+def profiler_benchmarks():
+    profiler = FrameProfiler()
+
+    def profiled_frame(profiler):
+        profiler.start_frame()
+        for phase in PHASES:
+            profiler.lap(phase)
+        profiler.end_frame()
+
+    return {'profile.frame_overhead': (lambda: profiler, profiled_frame)}
+
+
+# encoding the frame of one gravity tick for spectators, with the state
+# stream and as the whole grid in JSON
+def stream_benchmarks():
+    def setup():
+        engine = TetrisEngine(0)
+        encoder = StateEncoder(engine.columns, engine.rows)
+        encoder.encode(engine)
+        engine.tick()
+        return engine, encoder
+
+    def encode_tick(state):
+        engine, encoder = state
+        encoder.encode(engine)
+
+    def json_tick(state):
+        json_frame(state[0])
+
+    return {
+        'stream.encode_tick': (setup, encode_tick),
+        'stream.json_tick': (setup, json_tick),
+    }
+
+
+# writing the state after a gravity tick into a shared board export, and
+# reading a clean copy of it back. We write into a bytearray, which costs the
+# same as shared memory and needs no cleaning up
+def shared_benchmarks():
+    def setup():
+        engine = TetrisEngine(0)
+        export = BoardExport(engine.columns, engine.rows,
+                             buffer=bytearray(BoardExport.size(engine.columns, engine.rows)))
+        export.write(engine)
+        engine.tick()
+        return engine, export
+
+    def write_tick(state):
+        engine, export = state
+        export.write(engine)
+
+    def read(state):
+        state[1].read()
+
+    return {
+        'shared.write_tick': (setup, write_tick),
+        'shared.read': (setup, read),
+    }
+
+
+# saving a game in the middle of play as a checkpoint and loading it again,
+# and taking and rolling back to a checkpoint in memory
+def checkpoint_benchmarks():
+    def setup():
+        engine = TetrisEngine(0)
+        policy = HeuristicPolicy()
+        while engine.pieces < 30:
+            engine.step(policy.act(engine))
+        return engine, encode_checkpoint(engine, (0.5, 0.0)), engine.checkpoint()
+
+    def encode(state):
+        encode_checkpoint(state[0], (0.5, 0.0))
+
+    def decode(state):
+        decode_checkpoint(state[1])
+
+    def checkpoint(state):
+        state[0].checkpoint()
+
+    def rollback(state):
+        state[0].rollback(state[2])
+
+    return {
+        'checkpoint.encode': (setup, encode),
+        'checkpoint.decode': (setup, decode),
+        'engine.checkpoint': (setup, checkpoint),
+        'engine.rollback': (setup, rollback),
+    }
+
+
+# one second of simulation ticks taking actions from the input buffer while
+# left is held and auto repeats
+def input_benchmarks():
+    def held_second(inputs):
+        inputs.press(LEFT, inputs.time)
+        start = inputs.time
+        for tick in range(1, 121):
+            inputs.take(start + tick * TICK)
+        inputs.release(LEFT, start + 1)
+        inputs.take(start + 1)
+
+    return {'input.held_key_second': (InputBuffer, held_second)}
+
+
+# every operation moves the piece sideways and lets gravity move it down, on
+# boards of growing size
+def board_size_benchmarks():
+    benchmarks = {}
+    for columns, rows in BOARD_SIZES:
+        engine = TetrisEngine(0, columns, rows)
+
+        def setup(engine=engine):
+            if engine.game_over:
+                engine.reset(0)
+            return engine
+
+        def move_and_tick(engine):
+            engine.step(LEFT if engine.ticks % 2 else RIGHT)
+            engine.tick()
+
+        benchmarks[f'engine.move_and_tick[{columns}x{rows}]'] = (setup, move_and_tick)
+    return benchmarks
+
+
+# one step of the Gymnasium environment in both modes, when Gymnasium is
+# installed
+def env_benchmarks():
+    try:
+        from tetris.env import TetrisEnv
+    except ImportError:
+        return {}
+
+    benchmarks = {}
+    for mode in ('low', 'placement'):
+        env = TetrisEnv(mode=mode)
+        env.reset(seed=0)
+
+        def next_env(env=env):
+            if env.engine.game_over:
+                env.reset()
+            return env
+
+        benchmarks[f'env.step[{mode}]'] = (next_env, lambda env: env.step(0))
+    return benchmarks
+
+
+# we draw on an offscreen window with SDL's dummy video driver. Every frame
+# moves the piece one row, like a gravity tick does
+def render_benchmarks():
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    try:
+        import pygame as py
+    except ImportError:
+        return {}
+    import Tetris
+
+    py.init()
+    surface = py.display.set_mode((Tetris.game_width + 40, Tetris.game_height + 40))
+    renderer = Tetris.Renderer(surface)
+    engine = TetrisEngine(0)
+
+    def next_frame():
+        engine.tick()
+        if engine.game_over:
+            engine.reset(0)
+        return engine
+
+    def draw_grid_frame(engine):
+        surface.fill(Tetris.BLACK)
+        Tetris.draw_grid(surface, engine.grid(), engine.score)
+        py.display.update()
+
+    def renderer_frame(engine):
+        dirty = renderer.draw(engine.grid(), engine.score)
+        py.display.update(dirty)
+
+    benchmarks = {
+        'render.draw_grid_frame': (next_frame, draw_grid_frame),
+        'render.renderer_frame': (next_frame, renderer_frame),
+    }
+
+    # the same 10x20 view on boards of growing size, with the view following
+    # the piece like it does in game_loop()
+    for columns, rows in BOARD_SIZES:
+        big = TetrisEngine(0, columns, rows)
+        view = {'renderer': Tetris.Renderer(surface, 10, 20), 'top': 0, 'left': 0}
+
+        def next_big_frame(big=big):
+            big.step(LEFT if big.ticks % 2 else RIGHT)
+            big.tick()
+            if big.game_over:
+                big.reset(0)
+            return big
+
+        def viewport_frame(big, view=view):
+            view['top'], view['left'] = Tetris.follow_piece(big.board, view['top'], view['left'], 20, 10)
+            cells = big.grid(view['top'], view['left'], 20, 10)
+            py.display.update(view['renderer'].draw(cells, big.score))
+
+        benchmarks[f'render.viewport_frame[{columns}x{rows}]'] = (next_big_frame, viewport_frame)
+    return benchmarks
+
+
+def run(selected, seconds):
+    benchmarks = {}
+    benchmarks.update(operation_benchmarks())
+    benchmarks.update(game_benchmarks())
+    benchmarks.update(randomizer_benchmarks())
+    benchmarks.update(profiler_benchmarks())
+    benchmarks.update(input_benchmarks())
+    benchmarks.update(stream_benchmarks())
+    benchmarks.update(shared_benchmarks())
+    benchmarks.update(checkpoint_benchmarks())
+    benchmarks.update(env_benchmarks())
+    benchmarks.update(board_size_benchmarks())
+    benchmarks.update(render_benchmarks())
+    results = {}
+    for name, (setup, operation) in benchmarks.items():
+        if selected and not any(text in name for text in selected):
+            continue
+        result = measure(setup, operation, seconds)
+        results[name] = result
+        print(f'{name:45} {result["ops_per_sec"]:14,.0f} ops/s '
+              f'{1e6 / result["ops_per_sec"]:10.2f} us/op {result["peak_bytes"]:9,} peak bytes')
+    return results
+
+
+# we fail every benchmark that is more than tolerance slower than its baseline
+def compare(results, baseline, tolerance):
+    failures = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]['ops_per_sec']
+        change = result['ops_per_sec'] / before - 1
+        if change < -tolerance:
+            failures.append(name)
+            print(f'SLOWER {name}: {before:,.0f} -> {result["ops_per_sec"]:,.0f} ops/s ({change:+.0%})')
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the hot paths of the game.')
+    parser.add_argument('filter', nargs='*', help='only run benchmarks whose name contains one of these')
+    parser.add_argument('--seconds', type=float, default=0.3, help='time spent on every benchmark')
+    parser.add_argument('--save', metavar='FILE', help='save the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='fail if slower than this JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown, 0.25 is 25%%')
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, args.seconds)
+    if args.save:
+        with open(args.save, 'w') as stream:
+            json.dump(results, stream, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as stream:
+            failures = compare(results, json.load(stream), args.tolerance)
+        if failures:
+            print(f'{len(failures)} benchmarks got slower')
+            return 1
+        print('no benchmark got slower')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
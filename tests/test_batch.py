@@ -0,0 +1,43 @@
+import random
+
+import numpy as np
+import pytest
+
+from tetris.batch import BatchTetris
+from tetris.engine import ACTIONS, TetrisEngine
+
+
+# every board of a batch plays the same game as a TetrisEngine with its seed
+# and its actions
+@pytest.mark.parametrize('randomizer', ['bag', 'history', 'uniform'])
+def test_batch_matches_engine(randomizer):
+    n = 8
+    batch = BatchTetris(n, seeds=list(range(n)), randomizer=randomizer)
+    engines = [TetrisEngine(seed, randomizer=randomizer) for seed in range(n)]
+    rng = random.Random(0)
+    for step in range(400):
+        actions = [rng.choice(ACTIONS) for _ in range(n)]
+        rewards = batch.step(actions)
+        if step % 3 == 2:
+            rewards = rewards + batch.tick()
+        for index, engine in enumerate(engines):
+            if engine.game_over:
+                continue
+            reward = engine.step(actions[index])
+            if step % 3 == 2:
+                reward += engine.tick()
+            assert rewards[index] == reward
+            assert bool(batch.game_over[index]) == engine.game_over
+            assert (batch.score[index], batch.lines[index], batch.pieces[index], batch.ticks[index]) == (
+                engine.score, engine.lines, engine.pieces, engine.ticks)
+            if not engine.game_over:
+                assert batch.grid(index) == engine.grid()
+
+
+def test_numpy_seeds():
+    batch = BatchTetris(4, seeds=np.arange(4))
+    assert batch.seeds == [0, 1, 2, 3]
+    assert list(batch.kind) == [TetrisEngine(seed).board.piece.kind for seed in range(4)]
+    batch.reset_board(2, np.int64(7))
+    assert batch.seeds[2] == 7
+    assert batch.kind[2] == TetrisEngine(7).board.piece.kind
@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+from tetris.bitboard import Bitboard, pack_rows, unpack_rows
+from tetris.engine import ACTIONS, TetrisEngine
+
+
+# a board with the same locked rows whose heights and hash are worked out
+# from scratch
+def rebuilt(board):
+    copy = Bitboard(board.columns, board.rows)
+    copy.locked = list(board.locked)
+    copy.rebuild_heights()
+    copy.piece = board.piece.moved() if board.piece is not None else None
+    return copy
+
+
+# the heights and hash kept up to date move by move match the ones worked out
+# from the locked rows, on every board size
+@pytest.mark.parametrize('columns, rows', [(10, 20), (4, 8), (17, 31), (80, 40)])
+def test_incremental_state(columns, rows):
+    for seed in range(3):
+        engine = TetrisEngine(seed, columns, rows)
+        rng = random.Random(seed)
+        for _ in range(400):
+            engine.step(rng.choice(ACTIONS))
+            engine.tick()
+            board = engine.board
+            assert board.heights == rebuilt(board).heights
+            assert board.zobrist_hash() == rebuilt(board).zobrist_hash()
+            if engine.game_over:
+                break
+
+
+def test_clear_lines():
+    board = Bitboard(10, 6)
+    board.locked = [0, 0, board.full_row, 0b1, board.full_row, 0b11]
+    board.rebuild_heights()
+    assert board.clear_lines() == 2
+    assert board.locked == [0, 0, 0, 0, 0b1, 0b11]
+    assert board.heights == rebuilt(board).heights
+
+
+# a hard drop locks the piece where its ghost is, under an overhang too
+def test_hard_drop_lands_on_the_ghost():
+    rng = random.Random(0)
+    for _ in range(300):
+        board = Bitboard(10, 20)
+        board.locked = [0] * 10 + [rng.getrandbits(10) & ~(1 << rng.randrange(10)) for _ in range(10)]
+        board.rebuild_heights()
+        if not board.spawn(rng.randrange(7)):
+            continue
+        for _ in range(rng.randrange(6)):
+            rng.choice((board.move_left, board.move_right, board.rotate, board.move_down))()
+        if board.piece is None:
+            continue
+        ghost = board.ghost()
+        assert board.fits(ghost.kind, ghost.rotation, ghost.row, ghost.col)
+        assert not board.fits(ghost.kind, ghost.rotation, ghost.row + 1, ghost.col)
+        board.hard_drop()
+        for row, col in ghost.cells():
+            assert board.locked[row] >> col & 1
+
+
+# a clone shares the locked rows until one of the boards changes them
+def test_clone_is_independent():
+    engine = TetrisEngine(4)
+    for _ in range(40):
+        engine.step(ACTIONS[-1])
+    board = engine.board
+    before = board.snapshot()
+    copy = board.clone()
+    copy.hard_drop()
+    copy.clear_lines()
+    assert board.snapshot() == before
+    assert copy.snapshot() != before
+    after = copy.snapshot()
+    board.spawn(0)
+    board.hard_drop()
+    assert copy.snapshot() == after
+
+
+def test_snapshot_and_restore():
+    engine = TetrisEngine(5)
+    rng = random.Random(5)
+    for _ in range(200):
+        engine.step(rng.choice(ACTIONS))
+    snapshot = engine.board.snapshot()
+    restored = Bitboard.from_snapshot(snapshot)
+    assert restored.to_grid(ghost=True) == engine.board.to_grid(ghost=True)
+    assert restored.zobrist_hash() == engine.board.zobrist_hash() == snapshot.zobrist
+    with pytest.raises(ValueError):
+        Bitboard(12, 20).restore(snapshot)
+
+
+@pytest.mark.parametrize('columns, rows', [(10, 20), (3, 3), (13, 7), (200, 5)])
+def test_pack_rows_round_trip(columns, rows):
+    rng = random.Random(columns)
+    locked = [rng.getrandbits(columns) for _ in range(rows)]
+    data = pack_rows(locked, columns)
+    assert len(data) == (columns * rows + 7) // 8
+    assert unpack_rows(data, columns, rows) == locked
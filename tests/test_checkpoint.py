@@ -0,0 +1,101 @@
+import random
+
+import pytest
+
+from tetris.checkpoint import (
+    MAGIC, VERSION, decode_checkpoint, encode_checkpoint, load_checkpoint, save_checkpoint,
+)
+from tetris.engine import ACTIONS, TetrisEngine
+
+
+def played(seed, randomizer='bag', steps=200, **options):
+    engine = TetrisEngine(seed, randomizer=randomizer, **options)
+    rng = random.Random(seed)
+    for _ in range(steps):
+        engine.step(rng.choice(ACTIONS))
+        engine.tick()
+        if engine.game_over:
+            break
+    return engine
+
+
+def same_game(a, b):
+    return (a.grid() == b.grid() and a.upcoming() == b.upcoming() and a.board.piece == b.board.piece
+            and (a.score, a.lines, a.pieces, a.ticks, a.game_over) == (b.score, b.lines, b.pieces, b.ticks, b.game_over))
+
+
+# a decoded checkpoint is the same game, and goes on the same way
+@pytest.mark.parametrize('randomizer', ['uniform', 'bag', 'history'])
+@pytest.mark.parametrize('seed', [0, 1, -3, None])
+def test_round_trip(randomizer, seed):
+    engine = played(seed, randomizer)
+    copy, timers = decode_checkpoint(encode_checkpoint(engine, (0.25, 0.5)))
+    assert timers == [0.25, 0.5]
+    assert copy.seed == engine.seed
+    assert same_game(copy, engine)
+    rng = random.Random(7)
+    for _ in range(200):
+        action = rng.choice(ACTIONS)
+        engine.step(action)
+        copy.step(action)
+        engine.tick()
+        copy.tick()
+    assert same_game(copy, engine)
+
+
+def test_round_trip_of_other_boards():
+    engine = played(4, columns=17, rows=31, preview=2, steps=400)
+    copy, timers = decode_checkpoint(encode_checkpoint(engine))
+    assert timers == []
+    assert (copy.columns, copy.rows, copy.preview) == (17, 31, 2)
+    assert same_game(copy, engine)
+
+
+def test_round_trip_after_game_over():
+    engine = TetrisEngine(2)
+    while not engine.game_over:
+        engine.step(ACTIONS[-1])
+    copy, _ = decode_checkpoint(encode_checkpoint(engine))
+    assert copy.game_over and same_game(copy, engine)
+
+
+def test_save_and_load(tmp_path):
+    engine = played(5)
+    path = str(tmp_path / 'game.tckp')
+    save_checkpoint(path, engine, (0.1,))
+    copy, timers = load_checkpoint(path)
+    assert timers == [0.1] and same_game(copy, engine)
+    assert [entry.name for entry in tmp_path.iterdir()] == ['game.tckp']
+
+
+def test_rejects():
+    data = encode_checkpoint(played(6))
+    with pytest.raises(ValueError, match='not a checkpoint'):
+        decode_checkpoint(b'XXXX' + data[len(MAGIC):])
+    with pytest.raises(ValueError, match='not a checkpoint'):
+        decode_checkpoint(data[:6])
+    with pytest.raises(ValueError, match='version'):
+        decode_checkpoint(MAGIC + bytes((VERSION + 1,)) + data[len(MAGIC) + 1:])
+    # every flipped bit fails the CRC
+    for pos in range(len(MAGIC) + 1, len(data)):
+        damaged = bytearray(data)
+        damaged[pos] ^= 1
+        with pytest.raises(ValueError, match='damaged'):
+            decode_checkpoint(bytes(damaged))
+    with pytest.raises(ValueError):
+        decode_checkpoint(data[:-1])
+
+
+# checkpoint() and rollback() put the engine back, and the checkpoint is not
+# changed by the game going on after it
+def test_engine_checkpoint_and_rollback():
+    engine = played(8)
+    saved = encode_checkpoint(engine)
+    checkpoint = engine.checkpoint()
+    for _ in range(3):
+        rng = random.Random(9)
+        for _ in range(100):
+            engine.step(rng.choice(ACTIONS))
+            engine.tick()
+        engine.rollback(checkpoint)
+        assert encode_checkpoint(engine) == saved
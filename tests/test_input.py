@@ -0,0 +1,36 @@
+from tetris.engine import DOWN
+from tetris.input import ARR, MAX_CATCH_UP, TICK, InputBuffer
+
+
+# a held key repeats for at most MAX_CATCH_UP seconds after a stall, however
+# long the stall was
+def test_held_repeats_after_stall_are_clamped():
+    inputs = InputBuffer()
+    inputs.press(DOWN, 0.0)
+    assert inputs.take(0.0) == [DOWN]
+    actions = inputs.take(3.0)
+    assert actions == [DOWN] * (int(MAX_CATCH_UP / ARR) + 1)
+
+
+# the game loop runs its catch up ticks one take() at a time from the start
+# of the window, and all of them together repeat for one window
+def test_catch_up_ticks_repeat_for_one_window():
+    inputs = InputBuffer()
+    inputs.press(DOWN, 0.0)
+    inputs.take(0.0)
+    start = sim_time = 3.0 - MAX_CATCH_UP
+    actions = []
+    while sim_time + TICK <= 3.0:
+        sim_time += TICK
+        actions += inputs.take(sim_time, start)
+    assert len(actions) <= int(MAX_CATCH_UP / ARR) + 1
+
+
+# without a stall every repeat is given out
+def test_held_repeats_without_stall():
+    inputs = InputBuffer()
+    inputs.press(DOWN, 0.0)
+    actions = []
+    for tick in range(121):
+        actions += inputs.take(tick * TICK)
+    assert len(actions) == 1 + int((1 - inputs.das) / ARR) + 1
@@ -0,0 +1,31 @@
+from tetris.grid import new_pieces
+from tetris.pieces import PIECE_KINDS, ROTATIONS, piece_kind, rotate_shape
+
+
+# every rotation holds the 4 cells of its piece, and its masks, size, tops and
+# bottoms all describe those cells
+def test_rotation_tables():
+    assert len(ROTATIONS) == 7
+    for states in ROTATIONS:
+        assert len(states) == 4
+        for state in states:
+            cells = set(state.cells)
+            assert len(cells) == 4
+            assert {(i, j) for i, mask in enumerate(state.masks)
+                    for j in range(state.width) if mask >> j & 1} == cells
+            assert state.height == len(state.matrix) and state.width == len(state.matrix[0])
+            for j in range(state.width):
+                rows = [i for i, col in cells if col == j]
+                assert (state.tops[j], state.bottoms[j]) == (min(rows), max(rows))
+
+
+# turning a piece four times brings it back, one turn is the next rotation
+def test_rotations_cycle():
+    for states in ROTATIONS:
+        for rotation, state in enumerate(states):
+            turned = tuple(tuple(row) for row in rotate_shape(state.matrix))
+            assert turned == states[(rotation + 1) % 4].matrix
+
+
+def test_piece_kind_of_new_pieces():
+    assert [piece_kind(piece) for piece in new_pieces()] == list(PIECE_KINDS)
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from tetris.engine import TetrisEngine
+from tetris.randomizer import RANDOMIZERS, PieceQueue, PieceRandom
+
+
+# NumPy integer seeds deal the same pieces as the same Python int
+@pytest.mark.parametrize('seed', [np.int64(3), np.uint64(2 ** 64 - 1), np.int32(-7)])
+def test_numpy_seeds(seed):
+    assert [PieceRandom(seed).next() for _ in range(3)] == [PieceRandom(int(seed)).next() for _ in range(3)]
+    engine = TetrisEngine(seed)
+    assert engine.upcoming() == TetrisEngine(int(seed)).upcoming()
+    assert type(engine.seed) is int
+
+
+@pytest.mark.parametrize('randomizer', sorted(RANDOMIZERS))
+def test_queue_state_round_trip(randomizer):
+    queue = PieceQueue(5, randomizer)
+    for _ in range(10):
+        queue.next()
+    state = queue.getstate()
+    dealt = [queue.next() for _ in range(30)]
+    queue.setstate(state)
+    assert [queue.next() for _ in range(30)] == dealt
+
+
+# every bag of 7 pieces holds each piece once
+def test_bag_deals_every_piece_once_per_bag():
+    queue = PieceQueue(1, 'bag', 0)
+    for _ in range(10):
+        assert sorted(queue.next() for _ in range(7)) == list(range(7))
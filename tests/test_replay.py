@@ -0,0 +1,79 @@
+import io
+import random
+
+import pytest
+
+from tetris.engine import ACTIONS, TetrisEngine
+from tetris.replay import (
+    MAGIC, VERSION, ReplayRecorder, encode_replay, read_replays, verify_replay,
+)
+from tetris.varint import decode_varint, encode_varint, read_varint
+
+
+@pytest.mark.parametrize('value', [0, 1, 127, 128, 300, 2 ** 32, 2 ** 64 - 1, 2 ** 100])
+def test_varint_round_trip(value):
+    out = bytearray(b'x')
+    encode_varint(value, out)
+    assert decode_varint(out, 1) == (value, len(out))
+    assert read_varint(io.BytesIO(bytes(out[1:]))) == value
+
+
+def test_varint_rejects():
+    with pytest.raises(ValueError):
+        encode_varint(-1, bytearray())
+    out = bytearray()
+    encode_varint(300, out)
+    with pytest.raises(ValueError):
+        decode_varint(out[:-1], 0)
+
+
+# a recorded game with frames, actions and gravity ticks
+def recorded_game(seed, randomizer='bag', steps=300):
+    engine = TetrisEngine(seed, randomizer=randomizer)
+    recorder = ReplayRecorder(engine)
+    rng = random.Random(seed)
+    frame = 0
+    while not engine.game_over and frame < steps:
+        frame += rng.randrange(4)
+        action = rng.choice(ACTIONS)
+        recorder.record(frame, action)
+        engine.step(action)
+        if rng.random() < 0.3:
+            recorder.tick(frame)
+            engine.tick()
+    return recorder.finish()
+
+
+@pytest.mark.parametrize('randomizer', ['uniform', 'bag', 'history'])
+def test_replay_round_trip(randomizer):
+    replays = [recorded_game(seed, randomizer) for seed in range(5)]
+    archive = io.BytesIO(b''.join(encode_replay(replay) for replay in replays))
+    decoded = list(read_replays(archive))
+    assert len(decoded) == len(replays)
+    for replay, copy in zip(replays, decoded):
+        assert (copy.seed, copy.columns, copy.rows, copy.randomizer) == (
+            replay.seed, replay.columns, replay.rows, replay.randomizer)
+        assert copy.events == replay.events
+        assert (copy.score, copy.digest) == (replay.score, replay.digest)
+        assert verify_replay(copy)
+
+
+def test_replay_with_a_negative_seed():
+    replay = recorded_game(-5)
+    assert verify_replay(next(read_replays(io.BytesIO(encode_replay(replay)))))
+
+
+def test_replay_verify_fails_on_other_actions():
+    replay = recorded_game(1)
+    replay.events = replay.events[:-20]
+    assert not verify_replay(replay)
+
+
+def test_replay_rejects():
+    data = encode_replay(recorded_game(2))
+    with pytest.raises(ValueError, match='not a replay'):
+        list(read_replays(io.BytesIO(b'XXXX' + data[len(MAGIC):])))
+    with pytest.raises(ValueError, match='version'):
+        list(read_replays(io.BytesIO(MAGIC + bytes((VERSION + 1,)) + data[len(MAGIC) + 1:])))
+    with pytest.raises(ValueError, match='truncated'):
+        list(read_replays(io.BytesIO(data[:-3])))
@@ -0,0 +1,41 @@
+import csv
+
+import pytest
+
+from tetris.run import finished_seeds, main, play_game
+
+
+# a move can spawn a piece in the middle of a tick, the cap still holds
+@pytest.mark.parametrize('seed', [0, 14, 18, 21])
+@pytest.mark.parametrize('max_pieces', [1, 10, 50])
+def test_play_game_stops_at_max_pieces(seed, max_pieces):
+    assert play_game(seed, 'heuristic', max_pieces=max_pieces)[3] <= max_pieces
+
+
+def run(tmp_path, *options):
+    return main(['--games', '3', '--workers', '1', '--max-pieces', '20',
+                 '--out', str(tmp_path / 'results.csv'), *options])
+
+
+# every row says how its game was played, and resuming with other settings
+# is refused instead of mixing games from both runs in one file
+def test_rows_hold_their_settings(tmp_path):
+    run(tmp_path, '--policy', 'heuristic')
+    with open(tmp_path / 'results.csv', newline='') as stream:
+        rows = list(csv.DictReader(stream))
+    assert len(rows) == 3
+    assert {(row['policy'], row['max_pieces'], row['randomizer']) for row in rows} == {('heuristic', '20', 'bag')}
+
+
+def test_resume_with_the_same_settings(tmp_path):
+    run(tmp_path, '--policy', 'heuristic')
+    assert run(tmp_path, '--policy', 'heuristic', '--games', '5') == 0
+    assert finished_seeds(str(tmp_path / 'results.csv'), ['heuristic', 4, 20, 'bag']) == set(range(5))
+
+
+def test_resume_with_other_settings_is_refused(tmp_path):
+    run(tmp_path, '--policy', 'heuristic')
+    with pytest.raises(SystemExit):
+        run(tmp_path, '--policy', 'random')
+    with pytest.raises(ValueError):
+        finished_seeds(str(tmp_path / 'results.csv'), ['heuristic', 4, 30, 'bag'])
@@ -0,0 +1,61 @@
+import random
+
+import numpy as np
+import pytest
+
+from tetris.engine import ACTIONS, TetrisEngine
+from tetris.pieces import ROTATIONS
+from tetris.shared import EMPTY, LOCKED, PIECE, BoardExport
+
+
+@pytest.fixture
+def export():
+    export = BoardExport(10, 20)
+    yield export
+    export.close()
+    export.unlink()
+
+
+# a reader that attaches before the first write sees the size of the board
+def test_attach_before_first_write(export):
+    reader = BoardExport.attach(export.name)
+    try:
+        assert (reader.columns, reader.rows) == (10, 20)
+        assert reader.array().shape == (20, 10)
+        state = reader.read()
+        assert (state.columns, state.rows, state.piece) == (10, 20, None)
+        assert state.cells == bytearray(200)
+    finally:
+        reader.close()
+
+
+# every clean read holds the cells and header of the engine it was written from
+def test_read_matches_engine(export):
+    reader = BoardExport.attach(export.name)
+    cells = np.empty((20, 10), np.uint8)
+    engine = TetrisEngine(3)
+    rng = random.Random(3)
+    try:
+        for _ in range(500):
+            engine.step(rng.choice(ACTIONS))
+            engine.tick()
+            if engine.game_over:
+                engine.reset(rng.randrange(100))
+            generation = export.write(engine)
+            state = reader.read(cells)
+            assert state.generation == generation
+            assert (state.score, state.lines, state.pieces, state.ticks) == (
+                engine.score, engine.lines, engine.pieces, engine.ticks)
+            expected = np.full((20, 10), EMPTY, np.uint8)
+            for row, mask in enumerate(engine.board.locked):
+                for col in range(10):
+                    if mask >> col & 1:
+                        expected[row, col] = LOCKED
+            piece = engine.board.piece
+            if piece is not None:
+                assert state.piece == (piece.kind, piece.rotation, piece.row, piece.col)
+                for i, j in ROTATIONS[piece.kind][piece.rotation].cells:
+                    expected[piece.row + i, piece.col + j] = PIECE
+            assert (cells == expected).all()
+    finally:
+        reader.close()
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from tetris.engine import ACTIONS, TetrisEngine
+from tetris.policies import HeuristicPolicy
+from tetris.stream import KEYFRAME, PIECE_FELL, StateDecoder, StateEncoder
+
+
+def follow(engine, encoder, decoder, pending=0):
+    data = encoder.encode(engine, pending)
+    if data is not None:
+        assert decoder.apply(data) == len(data)
+    assert decoder.grid(ghost=True) == engine.grid(ghost=True)
+    assert (decoder.score, decoder.lines, decoder.pending, decoder.game_over) == (
+        engine.score, engine.lines, pending, engine.game_over)
+    return data
+
+
+# the decoder follows random games and heuristic games that clear lines, frame
+# by frame, with garbage coming up now and then
+@pytest.mark.parametrize('player', ['random', 'heuristic'])
+def test_round_trip(player):
+    for seed in range(3):
+        engine = TetrisEngine(seed)
+        encoder = StateEncoder(engine.columns, engine.rows)
+        decoder = StateDecoder()
+        policy = HeuristicPolicy() if player == 'heuristic' else None
+        rng = random.Random(seed)
+        assert follow(engine, encoder, decoder)[0] & KEYFRAME
+        pending = 0
+        while not engine.game_over and engine.pieces < 150:
+            engine.step(policy.act(engine) if policy else rng.choice(ACTIONS))
+            follow(engine, encoder, decoder, pending)
+            engine.tick()
+            follow(engine, encoder, decoder, pending)
+            if rng.random() < 0.02:
+                pending = rng.randrange(1, 4)
+                follow(engine, encoder, decoder, pending)
+                engine.add_garbage(pending, rng.randrange(engine.columns))
+                pending = 0
+                follow(engine, encoder, decoder, pending)
+        assert engine.game_over or engine.pieces == 150
+
+
+def test_gravity_tick_is_one_byte():
+    engine = TetrisEngine(0)
+    encoder = StateEncoder(engine.columns, engine.rows)
+    encoder.encode(engine)
+    engine.tick()
+    assert encoder.encode(engine) == bytes((PIECE_FELL,))
+    assert encoder.encode(engine) is None
+
+
+# a keyframe of the state we sent lets a late decoder join, and the deltas
+# after it carry on from there
+def test_late_join():
+    engine = TetrisEngine(1)
+    encoder = StateEncoder(engine.columns, engine.rows)
+    early = StateDecoder()
+    rng = random.Random(1)
+    for _ in range(100):
+        engine.step(rng.choice(ACTIONS))
+        data = encoder.encode(engine)
+        if data is not None:
+            early.apply(data)
+    late = StateDecoder()
+    late.apply(encoder.keyframe())
+    assert late.grid() == early.grid()
+    for _ in range(100):
+        engine.step(rng.choice(ACTIONS))
+        data = encoder.encode(engine)
+        if data is not None:
+            early.apply(data)
+            late.apply(data)
+    assert late.grid() == early.grid() == engine.grid()
+
+
+def test_delta_needs_a_keyframe():
+    with pytest.raises(ValueError):
+        StateDecoder().apply(bytes((PIECE_FELL,)))
@@ -0,0 +1,3 @@
+# The tetris package holds the game rules without any pygame code so they can
+# be used by the Tetris.py window as well as by scripts that run games headless
+from tetris.bitboard import Bitboard
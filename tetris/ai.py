@@ -0,0 +1,171 @@
+# Placement enumerator and heuristic player
+#
+# placements() lists every place the active piece can end up: every rotation
+# we can reach by rotating where the piece is, every column we can slide it to
+# from there, and the row it lands on when we hard drop it. For every placement
+# we work out a few features of the board it leaves behind:
+#
+#   lines:            lines the placement clears
+#   holes:            empty cells with a locked cell somewhere above them
+#   aggregate_height: the heights of all columns added up
+#   bumpiness:        how much the heights of neighbouring columns differ
+#   landing_height:   how high up the board the piece lands
+#
+# We don't copy the board for any of this. The piece is OR'd into the locked
+# rows, the features are read off the rows, and the piece is taken out again.
+#
+# evaluate() scores a placement as a weighted sum of its features, like the
+# Dellacherie and El-Tetris players, and best_placement() picks the highest.
+from tetris.engine import HARD_DROP, LEFT, RIGHT, ROTATE
+from tetris.pieces import ROTATIONS
+
+# weights for evaluate(), tuned for these features by Yiyuan Lee's Tetris AI
+WEIGHTS = {
+    'lines': 0.760666,
+    'holes': -0.35663,
+    'aggregate_height': -0.510066,
+    'bumpiness': -0.184483,
+    'landing_height': 0.0,
+}
+
+
+class Placement:
+    __slots__ = ('rotation', 'col', 'row', 'rotations', 'start_col', 'lines', 'holes',
+                 'aggregate_height', 'bumpiness', 'landing_height')
+
+    def __init__(self, rotation, col, row, rotations, start_col):
+        self.rotation = rotation
+        self.col = col
+        self.row = row
+        # how many times we have to press rotate to get this rotation, and the
+        # column the piece is in once it has been rotated
+        self.rotations = rotations
+        self.start_col = start_col
+
+    # the actions that take the active piece from where it is now to this
+    # placement: rotate, slide and hard drop
+    def actions(self):
+        shift = self.col - self.start_col
+        slide = [RIGHT] * shift if shift > 0 else [LEFT] * -shift
+        return [ROTATE] * self.rotations + slide + [HARD_DROP]
+
+    def __repr__(self):
+        return (f'Placement(rotation={self.rotation}, col={self.col}, row={self.row}, '
+                f'lines={self.lines}, holes={self.holes})')
+
+
+# we measure the board in place. The piece masks are OR'd into the locked rows
+# while we look at them and taken out again before we return, so a clone
+# sharing the rows never sees the change. Full rows are skipped as if they had
+# been cleared already
+def measure(board, placement, masks):
+    locked = board.locked
+    full_row = board.full_row
+    row, col = placement.row, placement.col
+    for i, mask in enumerate(masks):
+        locked[row + i] |= mask << col
+
+    lines = 0
+    for i in range(len(masks)):
+        if locked[row + i] == full_row:
+            lines += 1
+
+    # a cell in kept row k (counting only rows that are not cleared) ends up
+    # with a height of kept_rows - k once the full rows are gone
+    kept_rows = board.rows - lines
+    heights = [0] * board.columns
+    holes = 0
+    seen = 0
+    k = 0
+    for mask in locked:
+        if mask == full_row:
+            continue
+        if mask or seen:
+            holes += (seen & ~mask).bit_count()
+            new = mask & ~seen
+            while new:
+                low = new & -new
+                heights[low.bit_length() - 1] = kept_rows - k
+                new ^= low
+            seen |= mask
+        k += 1
+
+    for i, mask in enumerate(masks):
+        locked[row + i] &= ~(mask << col)
+
+    placement.lines = lines
+    placement.holes = holes
+    placement.aggregate_height = sum(heights)
+    placement.bumpiness = sum(abs(a - b) for a, b in zip(heights, heights[1:]))
+    placement.landing_height = board.rows - row - len(masks)
+    return placement
+
+
+# every placement the active piece on board can reach, with its features.
+# Rotations that leave the piece covering the same cells, like the O piece
+# turned around, only appear once
+def placements(board):
+    piece = board.piece
+    if piece is None:
+        return []
+    kind = piece.kind
+    states = ROTATIONS[kind]
+    rotation, row, col = piece.rotation, piece.row, piece.col
+    locked = board.locked
+    heights = board.heights
+    found = []
+    seen = set()
+    for turns in range(4):
+        if turns:
+            # the same clamp Bitboard.rotate() uses
+            rotation = (rotation + 1) % 4
+            max_row, max_col = board.max_origin[kind][rotation]
+            row, col = min(row, max_row), min(col, max_col)
+            if not board.fits(kind, rotation, row, col):
+                break
+        state = states[rotation]
+        # slide left and right from here for as long as the piece fits
+        left = col
+        while board.fits(kind, rotation, row, left - 1):
+            left -= 1
+        right = col
+        while board.fits(kind, rotation, row, right + 1):
+            right += 1
+        # we drop the piece in every column. The skyline gives the landing row
+        # like it does in Bitboard.drop_row(), and when the piece is under an
+        # overhang we check the shifted piece masks against the rows below it
+        # until one of them overlaps or we hit the floor
+        lowest = board.rows - state.height
+        bottoms = list(enumerate(state.bottoms))
+        for target in range(left, right + 1):
+            landing = board.rows - 1 - max(heights[target + j] + bottom for j, bottom in bottoms)
+            if landing < row:
+                shifted = [mask << target for mask in state.masks]
+                landing = row
+                while landing < lowest:
+                    below = landing + 1
+                    if any(locked[below + i] & mask for i, mask in enumerate(shifted)):
+                        break
+                    landing = below
+            key = (state.matrix, landing, target)
+            if key in seen:
+                continue
+            seen.add(key)
+            placement = Placement(rotation, target, landing, turns, col)
+            found.append(measure(board, placement, state.masks))
+    return found
+
+
+def evaluate(placement, weights=WEIGHTS):
+    return (weights['lines'] * placement.lines
+            + weights['holes'] * placement.holes
+            + weights['aggregate_height'] * placement.aggregate_height
+            + weights['bumpiness'] * placement.bumpiness
+            + weights['landing_height'] * placement.landing_height)
+
+
+def best_placement(board, weights=WEIGHTS):
+    candidates = placements(board)
+    if not candidates:
+        return None
+    return max(candidates, key=lambda placement: evaluate(placement, weights))
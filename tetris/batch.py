@@ -0,0 +1,218 @@
+# Vectorized batch environment
+#
+# BatchTetris plays N games at once. Every board is stored the same way as a
+# Bitboard, one integer mask per row, but all N boards sit in one NumPy array so
+# a single step() moves, rotates, locks and clears lines on every board with a
+# handful of array operations instead of N Python calls.
+#
+# Each board has its own PieceQueue and draws its pieces the same way
+# TetrisEngine does, so board i of a BatchTetris seeded with seeds[i] plays
+# exactly the same game as TetrisEngine(seeds[i]) given the same actions and
+# randomizer.
+#
+# This module needs NumPy, which the rest of the package does not, so it is not
+# imported by tetris/__init__.py
+import numpy as np
+
+from tetris.engine import DOWN, HARD_DROP, LEFT, RIGHT, ROTATE
+from tetris.grid import calculate_score, columns, rows
+from tetris.pieces import ROTATIONS
+from tetris.randomizer import PieceQueue
+
+# the tallest a piece can be, we keep this many extra full rows below every
+# board so a piece that falls through the floor collides with them
+PIECE_ROWS = 4
+
+# score for clearing 0, 1, 2, 3 and 4 lines at once
+SCORE_TABLE = np.array([calculate_score(n) for n in range(PIECE_ROWS + 1)], dtype=np.int64)
+
+
+# we copy the row masks, heights and widths of every rotation from the tables in
+# tetris/pieces.py into arrays, so we can look them up with arrays of piece and
+# rotation numbers
+def piece_tables():
+    masks = np.zeros((len(ROTATIONS), 4, PIECE_ROWS), dtype=np.int64)
+    heights = np.zeros((len(ROTATIONS), 4), dtype=np.int64)
+    widths = np.zeros((len(ROTATIONS), 4), dtype=np.int64)
+    for kind, states in enumerate(ROTATIONS):
+        for state in states:
+            masks[kind, state.rotation, :state.height] = state.masks
+            heights[kind, state.rotation] = state.height
+            widths[kind, state.rotation] = state.width
+    return masks, heights, widths
+
+
+MASKS, HEIGHTS, WIDTHS = piece_tables()
+
+
+class BatchTetris:
+    def __init__(self, n, seeds=None, columns=columns, rows=rows, randomizer='bag'):
+        # every row mask has to fit in a signed 64 bit integer
+        if columns > 62:
+            raise ValueError('BatchTetris supports at most 62 columns')
+        self.n = n
+        self.columns = columns
+        self.rows = rows
+        self.randomizer = randomizer
+        self.full_row = (1 << columns) - 1
+        self.reset(seeds)
+
+    # start N new games, seeds is a list or an array with one seed for every
+    # board. We keep them as Python ints, NumPy integers would overflow in the
+    # seeding of our queues
+    def reset(self, seeds=None):
+        n = self.n
+        if seeds is None:
+            seeds = [None] * n
+        if len(seeds) != n:
+            raise ValueError(f'expected {n} seeds, got {len(seeds)}')
+        self.seeds = [None if seed is None else int(seed) for seed in seeds]
+        # we don't show a preview, so the queues deal straight from the randomizer
+        self.queues = [PieceQueue(seed, self.randomizer, 0) for seed in self.seeds]
+        # the locked rows of every board followed by the full floor rows
+        self.locked = np.zeros((n, self.rows + PIECE_ROWS), dtype=np.int64)
+        self.locked[:, self.rows:] = self.full_row
+        self.kind = np.zeros(n, dtype=np.int64)
+        self.rotation = np.zeros(n, dtype=np.int64)
+        self.piece_row = np.zeros(n, dtype=np.int64)
+        self.piece_col = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.lines = np.zeros(n, dtype=np.int64)
+        self.pieces = np.zeros(n, dtype=np.int64)
+        self.ticks = np.zeros(n, dtype=np.int64)
+        self.game_over = np.zeros(n, dtype=bool)
+        self.spawn(np.arange(n))
+        return self
+
+    # start a new game on a single board, the others keep playing
+    def reset_board(self, index, seed=None):
+        seed = None if seed is None else int(seed)
+        self.seeds[index] = seed
+        self.queues[index] = PieceQueue(seed, self.randomizer, 0)
+        self.locked[index, :self.rows] = 0
+        for counter in (self.score, self.lines, self.pieces, self.ticks):
+            counter[index] = 0
+        self.game_over[index] = False
+        self.spawn(np.array([index]))
+
+    # check which of the boards in index can hold their piece at the given
+    # rotation, row and column. Rows outside the board hit the full floor rows
+    def fits(self, index, kind, rotation, row, col):
+        inside = (col >= 0) & (col + WIDTHS[kind, rotation] <= self.columns) & (row >= 0)
+        offsets = np.clip(row, 0, self.rows)[:, None] + np.arange(PIECE_ROWS)
+        board_rows = self.locked[index[:, None], offsets]
+        piece_rows = MASKS[kind, rotation] << np.maximum(col, 0)[:, None]
+        return inside & ~(board_rows & piece_rows).any(axis=1)
+
+    # deal the next piece for every board in index from its own queue and put
+    # it at the top. Boards without room for it are over
+    def spawn(self, index):
+        if len(index) == 0:
+            return
+        self.kind[index] = [self.queues[i].next() for i in index]
+        self.rotation[index] = 0
+        self.piece_row[index] = 0
+        self.piece_col[index] = self.columns // 2 - 1
+        ok = self.fits(index, self.kind[index], self.rotation[index],
+                       self.piece_row[index], self.piece_col[index])
+        self.pieces[index[ok]] += 1
+        self.game_over[index[~ok]] = True
+
+    # apply one action to every board, actions is an array of N actions.
+    # We return the score every board gained with this step
+    def step(self, actions):
+        actions = np.asarray(actions)
+        playing = ~self.game_over
+        reward = np.zeros(self.n, dtype=np.int64)
+
+        for action, offset in ((LEFT, -1), (RIGHT, 1)):
+            index = np.flatnonzero(playing & (actions == action))
+            col = self.piece_col[index] + offset
+            ok = self.fits(index, self.kind[index], self.rotation[index], self.piece_row[index], col)
+            self.piece_col[index[ok]] = col[ok]
+
+        # rotate clockwise and push the piece back inside the bottom and right
+        # side of the board, just like Bitboard.rotate()
+        index = np.flatnonzero(playing & (actions == ROTATE))
+        kind = self.kind[index]
+        rotation = (self.rotation[index] + 1) % 4
+        row = np.minimum(self.piece_row[index], self.rows - HEIGHTS[kind, rotation])
+        col = np.minimum(self.piece_col[index], self.columns - WIDTHS[kind, rotation])
+        ok = self.fits(index, kind, rotation, row, col)
+        index = index[ok]
+        self.rotation[index] = rotation[ok]
+        self.piece_row[index] = row[ok]
+        self.piece_col[index] = col[ok]
+
+        index = np.flatnonzero(playing & (actions == DOWN))
+        row = self.piece_row[index] + 1
+        ok = self.fits(index, self.kind[index], self.rotation[index], row, self.piece_col[index])
+        self.piece_row[index[ok]] = row[ok]
+        landed = index[~ok]
+
+        # hard drop moves every dropping piece down a row at a time until none
+        # of them can move any further
+        dropping = np.flatnonzero(playing & (actions == HARD_DROP))
+        falling = dropping
+        while len(falling):
+            row = self.piece_row[falling] + 1
+            ok = self.fits(falling, self.kind[falling], self.rotation[falling], row, self.piece_col[falling])
+            falling = falling[ok]
+            self.piece_row[falling] = row[ok]
+        landed = np.concatenate([landed, dropping])
+
+        if len(landed):
+            self.lock(landed)
+            reward[landed] = self.settle(landed)
+        return reward
+
+    # gravity moves every piece down one row
+    def tick(self):
+        self.ticks += 1
+        return self.step(np.full(self.n, DOWN))
+
+    # OR the piece masks of the boards in index into their locked rows
+    def lock(self, index):
+        masks = MASKS[self.kind[index], self.rotation[index]] << self.piece_col[index][:, None]
+        for k in range(PIECE_ROWS):
+            self.locked[index, self.piece_row[index] + k] |= masks[:, k]
+
+    # clear the full rows of the boards in index, score them and spawn the next
+    # piece or end the game, the same order of events as TetrisEngine.settle()
+    def settle(self, index):
+        board = self.locked[index, :self.rows]
+        full = board == self.full_row
+        lines_cleared = full.sum(axis=1)
+        cleared = np.flatnonzero(lines_cleared)
+        if len(cleared):
+            # a stable sort puts the full rows first and keeps the other rows in
+            # order, then we empty the first lines_cleared rows
+            order = np.argsort(~full[cleared], axis=1, kind='stable')
+            compacted = np.take_along_axis(board[cleared], order, axis=1)
+            compacted[np.arange(self.rows) < lines_cleared[cleared][:, None]] = 0
+            self.locked[index[cleared], :self.rows] = compacted
+        score_increase = SCORE_TABLE[lines_cleared]
+        self.lines[index] += lines_cleared
+        self.score[index] += score_increase
+        topped_out = self.locked[index, 0] != 0
+        self.game_over[index[topped_out]] = True
+        self.spawn(index[~topped_out])
+        return score_increase
+
+    # the cells of every board as a (N, rows, columns) uint8 array with 0 for
+    # empty cells, 1 for locked cells and 2 for the active piece
+    def cells(self):
+        piece = np.zeros_like(self.locked)
+        playing = np.flatnonzero(~self.game_over)
+        masks = MASKS[self.kind[playing], self.rotation[playing]] << self.piece_col[playing][:, None]
+        for k in range(PIECE_ROWS):
+            piece[playing, self.piece_row[playing] + k] |= masks[:, k]
+        bits = np.arange(self.columns)
+        locked = (self.locked[:, :self.rows, None] >> bits) & 1
+        piece = (piece[:, :self.rows, None] >> bits) & 1
+        return (locked + 2 * piece).astype(np.uint8)
+
+    # the nested list grid of one board for draw_grid()
+    def grid(self, index):
+        symbols = (' ', '0', '*')
+        return [[symbols[cell] for cell in row] for row in self.cells()[index]]
@@ -0,0 +1,494 @@
+# Bitboard grid engine
+#
+# The nested list grid from create_grid() stores every cell as a ' ', '*' or '0'
+# string, so every move has to scan all 200 cells to find the piece and check for
+# collisions. Here we store the board the way the bits fit naturally:
+#
+#   - every locked row is a single integer, bit c is set when column c is locked
+#   - the active piece is not written into the board at all, we only keep its
+#     piece number, its origin (row, col) and how many times it has been rotated
+#
+# A collision check then becomes an AND between a handful of piece row masks and
+# the locked rows they overlap, and clearing a line is a comparison against a
+# full row mask. Nothing scans the whole grid anymore.
+#
+# For example, the S piece at column 4 looks like this as row masks
+#   [' ','*','*']  ->  0b110 << 4
+#   ['*','*',' ']  ->  0b011 << 4
+# remember that bit 0 is the left most column so the masks read right to left
+#
+# The masks of every rotation come from the tables in tetris/pieces.py, so the
+# active piece is just an ActivePiece record of a piece number, a rotation and
+# an origin. Every move only looks at the four cells of that record
+#
+# We also keep the height of every column, the skyline, counted in cells up
+# from the floor. It changes only when a piece locks or lines are cleared, and
+# with it we find the row a piece lands on from the few columns it covers
+# instead of moving it down a row at a time. That makes hard drop and the ghost
+# piece cheap enough to work out every frame
+#
+# Search
+# a bot looking ahead clones the board for every move it tries. clone() gives
+# back a new board that shares the locked rows and heights with this one, and
+# whichever board changes them first takes its own copy, so a clone that is
+# only looked at never copies anything. snapshot() freezes the board into a
+# BoardSnapshot that can be used as a dict key and restore() puts a board back
+# the way a snapshot saw it.
+#
+# Snapshots are hashed Zobrist style: the hash of a board is the XOR of a
+# random looking 64 bit key for every row and one for the piece. A row's key is
+# its mask mixed with two random numbers of its own, (mask + add) * mult with
+# an odd mult, which gives every mask of a row a different key, and the
+# piece's key is the XOR of random keys for its kind and rotation, its row and
+# its column. Once a board has worked out its hash, lock() keeps it up to date
+# by swapping the keys of the rows the piece covers. Clearing lines moves every
+# row above the cleared ones, so then we work the hash out again the next time
+# we need it
+import hashlib
+from collections import namedtuple
+
+from tetris.pieces import PIECE_KINDS, ROTATIONS, ActivePiece, max_origins
+from tetris.randomizer import MASK_64, PieceRandom
+
+ZobristKeys = namedtuple('ZobristKeys', ['row_adds', 'row_mults', 'pieces', 'rows', 'columns'])
+
+# rows wider than 64 columns are folded into 64 bits modulo this prime
+PRIME_64 = (1 << 64) - 59
+
+# the keys for every board size we have hashed, made on first use
+zobrist_tables = {}
+
+
+# the same board size always gets the same keys, so hashes can be compared
+# between boards and between runs
+def zobrist_keys(columns, rows):
+    keys = zobrist_tables.get((columns, rows))
+    if keys is None:
+        rng = PieceRandom(columns << 32 | rows)
+        keys = ZobristKeys(
+            tuple(rng.next() for _ in range(rows)),
+            tuple(rng.next() | 1 for _ in range(rows)),
+            tuple(tuple(rng.next() for _ in range(4)) for _ in PIECE_KINDS),
+            tuple(rng.next() for _ in range(rows)),
+            tuple(rng.next() for _ in range(columns)),
+        )
+        zobrist_tables[columns, rows] = keys
+    return keys
+
+
+def row_key(keys, row, mask):
+    if mask > MASK_64:
+        mask %= PRIME_64
+    return ((mask + keys.row_adds[row]) * keys.row_mults[row]) & MASK_64
+
+
+def piece_key(keys, kind, rotation, row, col):
+    return keys.pieces[kind][rotation] ^ keys.rows[row] ^ keys.columns[col]
+
+
+# Packed cells
+# streams and checkpoints store the locked rows as one bit per cell, row 0
+# first and column 0 in the lowest bit, in packed_size() bytes
+def packed_size(columns, rows):
+    return (columns * rows + 7) // 8
+
+
+def pack_rows(locked, columns):
+    bits = 0
+    for row, mask in enumerate(locked):
+        bits |= mask << (row * columns)
+    return bits.to_bytes(packed_size(columns, len(locked)), 'little')
+
+
+def unpack_rows(data, columns, rows):
+    bits = int.from_bytes(data[:packed_size(columns, rows)], 'little')
+    full_row = (1 << columns) - 1
+    return [bits >> (row * columns) & full_row for row in range(rows)]
+
+
+# A frozen board. locked and heights are tuples, piece is (kind, rotation,
+# row, col) or None, and zobrist is the hash of all of it. The hash comes
+# first, so two different snapshots almost always compare unequal on the first
+# field
+class BoardSnapshot(namedtuple('BoardSnapshot', ['zobrist', 'columns', 'rows', 'locked', 'heights', 'piece'])):
+    __slots__ = ()
+
+    def __hash__(self):
+        return self.zobrist
+
+
+class Bitboard:
+    def __init__(self, columns=10, rows=20):
+        self.columns = columns
+        self.rows = rows
+        # a row with every column locked, used to detect cleared lines
+        self.full_row = (1 << columns) - 1
+        # one integer per row for the locked '0' cells, row 0 is the top row
+        self.locked = [0] * rows
+        # the active piece as an ActivePiece, or None when there is no piece
+        # in play
+        self.piece = None
+        # the furthest origin of every rotation, used to keep rotations inside
+        self.max_origin = max_origins(columns, rows)
+        # the rows our last locked piece landed on, as (first, last). Only these
+        # rows can have become full, so clear_lines() only checks them
+        self.touched = None
+        # the height of every column, 0 for an empty column and rows for a
+        # column locked all the way to the top
+        self.heights = [0] * columns
+        # the Zobrist hash of our locked cells, None until we need it
+        self.zobrist = None
+        # True when locked and heights may be shared with a clone
+        self._shared = False
+
+    # the table entry for the rotation our piece is in
+    def piece_state(self):
+        return self.piece.state
+
+    # check if a piece fits on the board with its top left corner at
+    # (row, col). The piece fits when every row is inside the grid and none of its
+    # row masks overlap a locked row
+    def fits(self, kind, rotation, row, col):
+        state = ROTATIONS[kind][rotation]
+        if row < 0 or col < 0 or col + state.width > self.columns:
+            return False
+        if row + state.height > self.rows:
+            return False
+        locked = self.locked
+        for i, mask in enumerate(state.masks):
+            if locked[row + i] & (mask << col):
+                return False
+        return True
+
+    # we place a new piece on the board, by default at the top just left of the
+    # middle, which is position (0,4) on our 10 column board just like
+    # map_to_grid(). kind is the number of the piece in new_pieces(). We return
+    # False when the piece collides with locked cells so the caller can end the game
+    def spawn(self, kind, start_row=0, start_col=None):
+        if start_col is None:
+            start_col = self.columns // 2 - 1
+        self.piece = ActivePiece(kind, 0, start_row, start_col)
+        return self.fits(kind, 0, start_row, start_col)
+
+    # move_left and move_right shift the piece origin by one column if the
+    # shifted piece still fits, otherwise nothing happens and we return False
+    def move_left(self):
+        return self.shift(-1)
+
+    def move_right(self):
+        return self.shift(1)
+
+    def shift(self, offset):
+        piece = self.piece
+        if piece is None:
+            return False
+        if not self.fits(piece.kind, piece.rotation, piece.row, piece.col + offset):
+            return False
+        piece.col += offset
+        return True
+
+    # move_down keeps the semantics of the grid version: if the piece can not
+    # move down because it is on the last row or on top of a locked cell, the
+    # piece is locked in place and we return False
+    def move_down(self):
+        piece = self.piece
+        if piece is None:
+            return False
+        if self.fits(piece.kind, piece.rotation, piece.row + 1, piece.col):
+            piece.row += 1
+            return True
+        self.lock()
+        return False
+
+    # the lowest row our piece can fall to from where it is now, in the rotation
+    # and column it has now
+    #
+    # The lowest cell of the piece in every column it covers has to stay above
+    # the top locked cell of that column, so the skyline gives us the landing
+    # row straight away. That only holds when the piece is above the skyline to
+    # begin with. A piece slid in under an overhang is below it, and then we
+    # move it down a row at a time like before
+    def drop_row(self):
+        piece = self.piece
+        state = piece.state
+        heights = self.heights
+        col = piece.col
+        row = self.rows - 1 - max(heights[col + j] + bottom for j, bottom in enumerate(state.bottoms))
+        if row >= piece.row:
+            return row
+        row = piece.row
+        while self.fits(piece.kind, piece.rotation, row + 1, piece.col):
+            row += 1
+        return row
+
+    # the ghost is our piece moved down to where a hard drop would lock it, or
+    # None when there is no piece in play
+    def ghost(self):
+        if self.piece is None:
+            return None
+        return self.piece.moved(row=self.drop_row())
+
+    # hard drop moves our piece straight down as far as it goes and locks it
+    # there. We return how many rows it fell
+    def hard_drop(self):
+        piece = self.piece
+        if piece is None:
+            return 0
+        row = self.drop_row()
+        dropped = row - piece.row
+        piece.row = row
+        self.lock()
+        return dropped
+
+    # we rotate the piece clockwise around the top left corner of its bounding
+    # box. Like map_rotate_to_grid() we push the rotated piece back inside the
+    # grid when it sticks out of the bottom or right side. Unlike the grid version
+    # we refuse rotations that would overwrite locked cells
+    def rotate(self):
+        piece = self.piece
+        if piece is None:
+            return False
+        rotation = (piece.rotation + 1) % 4
+        max_row, max_col = self.max_origin[piece.kind][rotation]
+        row = min(piece.row, max_row)
+        col = min(piece.col, max_col)
+        if not self.fits(piece.kind, rotation, row, col):
+            return False
+        piece.rotation = rotation
+        piece.row = row
+        piece.col = col
+        return True
+
+    # lock the active piece into the locked rows, the same as turning every '*'
+    # into a '0' in lock_pieces()
+    def lock(self):
+        piece = self.piece
+        if piece is None:
+            return
+        self._own()
+        row, col = piece.row, piece.col
+        state = piece.state
+        locked = self.locked
+        if self.zobrist is None:
+            for i, mask in enumerate(state.masks):
+                locked[row + i] |= mask << col
+        else:
+            keys = zobrist_keys(self.columns, self.rows)
+            value = self.zobrist
+            for i, mask in enumerate(state.masks):
+                value ^= row_key(keys, row + i, locked[row + i])
+                locked[row + i] |= mask << col
+                value ^= row_key(keys, row + i, locked[row + i])
+            self.zobrist = value
+        # the top cell of the piece in every column it covers may be the new
+        # top of that column
+        heights = self.heights
+        for j, top in enumerate(state.tops):
+            height = self.rows - row - top
+            if height > heights[col + j]:
+                heights[col + j] = height
+        self.touched = (row, row + state.height - 1)
+        self.piece = None
+
+    # remove every full row and add empty rows on top, we return how many lines
+    # were cleared so the caller can pass it to calculate_score()
+    #
+    # A row can only become full when a piece locks on it, so we only look at the
+    # rows our last piece touched instead of the whole board. A row's filled cell
+    # count is the number of bits set in its mask, so a full row is simply a row
+    # equal to full_row. We clear the rows in place from the top down: deleting a
+    # row moves the rows above it down by one and leaves the rows below where
+    # they are, so the next full row keeps its index. Both the delete and the new
+    # empty row on top are a single move of the list in C, no rows are copied
+    def clear_lines(self):
+        if self.touched is None:
+            first, last = 0, self.rows - 1
+        else:
+            first, last = self.touched
+            self.touched = None
+        full_row = self.full_row
+        locked = self.locked
+        lines_cleared = 0
+        for row in range(first, last + 1):
+            if locked[row] == full_row:
+                if self._shared:
+                    self._own()
+                    locked = self.locked
+                del locked[row]
+                locked.insert(0, 0)
+                lines_cleared += 1
+        if lines_cleared:
+            self.lower_heights(lines_cleared)
+            self.zobrist = None
+        return lines_cleared
+
+    # a full row has every column locked, so every cleared row was at or below
+    # the top of every column. When the top cell of a column was not cleared it
+    # has moved down by lines_cleared. When it was, the new top is further down
+    # still, under the empty cells the cleared rows were covering, and we walk
+    # down to it
+    def lower_heights(self, lines_cleared):
+        rows = self.rows
+        locked = self.locked
+        heights = self.heights
+        for col in range(self.columns):
+            height = heights[col] - lines_cleared
+            while height > 0 and not locked[rows - height] >> col & 1:
+                height -= 1
+            heights[col] = height
+
+    # work out every column height from the locked rows. Only needed when the
+    # locked rows were written directly instead of by lock() and clear_lines(),
+    # and then our hash has to be worked out again too
+    def rebuild_heights(self):
+        self.zobrist = None
+        rows = self.rows
+        heights = [0] * self.columns
+        seen = 0
+        for row, mask in enumerate(self.locked):
+            new = mask & ~seen
+            while new:
+                low = new & -new
+                heights[low.bit_length() - 1] = rows - row
+                new ^= low
+            seen |= mask
+        self.heights = heights
+
+    # Garbage
+    # in a multiplayer game the lines our opponents clear come up from the
+    # bottom of our board. We push the locked rows up by lines and fill the
+    # bottom with rows that have every column locked except hole, so they can
+    # be cleared again. A piece in play that now overlaps locked cells is
+    # pushed up too, as far as it has to. We return False when locked cells
+    # were pushed off the top or the piece has no room left, which ends the game
+    def add_garbage(self, lines, hole):
+        if lines <= 0:
+            return True
+        lines = min(lines, self.rows)
+        self._own()
+        locked = self.locked
+        overflow = any(locked[:lines])
+        del locked[:lines]
+        locked.extend([self.full_row & ~(1 << hole)] * lines)
+        # every row moved, so clear_lines() has to look at all of them and
+        # our heights and hash are worked out again
+        self.touched = None
+        self.rebuild_heights()
+        piece = self.piece
+        if piece is not None:
+            row = piece.row
+            while row > 0 and not self.fits(piece.kind, piece.rotation, row, piece.col):
+                row -= 1
+            piece.row = row
+            if not self.fits(piece.kind, piece.rotation, row, piece.col):
+                return False
+        return not overflow
+
+    # the game is over when a locked cell reaches the top row
+    def game_over_condition(self):
+        return self.locked[0] != 0
+
+    # Clone, snapshot and restore
+
+    # before we change locked or heights we take our own copy of them if a
+    # clone may still be using them
+    def _own(self):
+        if self._shared:
+            self.locked = list(self.locked)
+            self.heights = list(self.heights)
+            self._shared = False
+
+    # a new board in the same state as this one. The locked rows and heights
+    # are shared until one of the two boards changes them
+    def clone(self):
+        copy = Bitboard.__new__(Bitboard)
+        copy.__dict__.update(self.__dict__)
+        if self.piece is not None:
+            copy.piece = self.piece.moved()
+        self._shared = copy._shared = True
+        return copy
+
+    # the Zobrist hash of our locked cells and our piece
+    def zobrist_hash(self):
+        keys = zobrist_keys(self.columns, self.rows)
+        if self.zobrist is None:
+            value = 0
+            if self.columns <= 64:
+                for mask, add, mult in zip(self.locked, keys.row_adds, keys.row_mults):
+                    value ^= ((mask + add) * mult) & MASK_64
+            else:
+                for row, mask in enumerate(self.locked):
+                    value ^= row_key(keys, row, mask)
+            self.zobrist = value
+        piece = self.piece
+        if piece is None:
+            return self.zobrist
+        return self.zobrist ^ piece_key(keys, piece.kind, piece.rotation, piece.row, piece.col)
+
+    def snapshot(self):
+        piece = self.piece
+        if piece is not None:
+            piece = (piece.kind, piece.rotation, piece.row, piece.col)
+        return BoardSnapshot(self.zobrist_hash(), self.columns, self.rows,
+                             tuple(self.locked), tuple(self.heights), piece)
+
+    # put the board back the way snapshot saw it
+    def restore(self, snapshot):
+        if (snapshot.columns, snapshot.rows) != (self.columns, self.rows):
+            raise ValueError(f'snapshot of a {snapshot.columns}x{snapshot.rows} board '
+                             f'restored on a {self.columns}x{self.rows} board')
+        self.locked = list(snapshot.locked)
+        self.heights = list(snapshot.heights)
+        self._shared = False
+        self.touched = None
+        if snapshot.piece is None:
+            self.piece = None
+            self.zobrist = snapshot.zobrist
+        else:
+            self.piece = ActivePiece(*snapshot.piece)
+            keys = zobrist_keys(self.columns, self.rows)
+            self.zobrist = snapshot.zobrist ^ piece_key(keys, *snapshot.piece)
+        return self
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls(snapshot.columns, snapshot.rows).restore(snapshot)
+
+    # an 8 byte fingerprint of the locked cells. Two boards with the same locked
+    # cells always have the same digest, on every machine and every run, so we
+    # can store it in a replay and check it later
+    def digest(self):
+        row_bytes = (self.columns + 7) // 8
+        data = b''.join(mask.to_bytes(row_bytes, 'little') for mask in self.locked)
+        return hashlib.blake2b(data, digest_size=8).digest()
+
+    # we give back the cells the active piece covers as (row, col) pairs
+    def piece_cells(self):
+        if self.piece is None:
+            return []
+        return self.piece.cells()
+
+    # Adapter for draw_grid()
+    # we build the nested list grid that draw_grid() expects, with '0' for locked
+    # cells, '*' for the active piece and ' ' everywhere else. With ghost=True
+    # the cells where our piece would land are marked with '+'
+    #
+    # On a big board we only want the part we can see, so top, left, height and
+    # width pick a window of the board. By default we get the whole board
+    def to_grid(self, top=0, left=0, height=None, width=None, ghost=False):
+        if height is None:
+            height = self.rows - top
+        if width is None:
+            width = self.columns - left
+        grid = []
+        for mask in self.locked[top:top + height]:
+            mask >>= left
+            grid.append(['0' if mask >> c & 1 else ' ' for c in range(width)])
+        if ghost and self.piece is not None:
+            for r, c in self.ghost().cells():
+                if top <= r < top + height and left <= c < left + width:
+                    grid[r - top][c - left] = '+'
+        for r, c in self.piece_cells():
+            if top <= r < top + height and left <= c < left + width:
+                grid[r - top][c - left] = '*'
+        return grid
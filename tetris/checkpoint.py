@@ -0,0 +1,142 @@
+# Checkpoints
+#
+# A checkpoint is a game saved as bytes, so it can be picked up again after
+# the window was closed. Unlike a replay it doesn't play the game again, it
+# holds the game as it is:
+#
+#   b'TCKP'  version  body  crc32 of everything before it, 4 bytes
+#
+# and the body is
+#
+#   varints:  flags  columns  rows  randomizer  preview  seed  score  lines
+#             pieces  ticks
+#   piece:    kind  rotation  row  col, when flags has HAS_PIECE
+#   queue:    varint count, then the count varints of PieceQueue.getstate():
+#             the random number generator, the upcoming pieces and what the
+#             randomizer remembers
+#   timers:   varint count, then every timer as an 8 byte little endian double
+#   cells:    the locked rows packed into bits, see pack_rows()
+#
+# randomizer is the position of its name in RANDOMIZER_NAMES like in a
+# replay. The timers are whatever the game loop needs to carry on where it
+# stopped, game_loop() saves how far gravity and autoplay have got towards
+# their next step.
+#
+# A checkpoint of a normal game is under 100 bytes, most of them the state of
+# the random number generator, and takes tens of microseconds to make, far
+# less than a frame, so the game loop can autosave every few seconds without a
+# hitch. The checkpoint.* benchmarks in benchmarks/bench.py time encoding and
+# decoding. For search and rollback in memory there is no need for bytes at
+# all, see TetrisEngine.checkpoint() and rollback()
+import os
+import struct
+import zlib
+
+from tetris.bitboard import pack_rows, packed_size, unpack_rows
+from tetris.engine import TetrisEngine
+from tetris.pieces import ActivePiece
+from tetris.replay import RANDOMIZER_NAMES
+from tetris.varint import decode_varint, encode_varint
+
+MAGIC = b'TCKP'
+VERSION = 1
+
+GAME_OVER = 1
+HAS_PIECE = 2
+HAS_SEED = 4
+
+TIMER = struct.Struct('<d')
+CRC = struct.Struct('<I')
+
+
+def encode_checkpoint(engine, timers=()):
+    board = engine.board
+    piece = board.piece
+    flags = ((GAME_OVER if engine.game_over else 0) | (HAS_PIECE if piece is not None else 0)
+             | (HAS_SEED if engine.seed is not None else 0))
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+    for value in (flags, engine.columns, engine.rows, RANDOMIZER_NAMES.index(engine.randomizer),
+                  engine.preview, engine.seed or 0, engine.score, engine.lines, engine.pieces, engine.ticks):
+        encode_varint(value, out)
+    if piece is not None:
+        for value in (piece.kind, piece.rotation, piece.row, piece.col):
+            encode_varint(value, out)
+    queue = engine.queue.getstate()
+    encode_varint(len(queue), out)
+    for value in queue:
+        encode_varint(value, out)
+    encode_varint(len(timers), out)
+    for timer in timers:
+        out += TIMER.pack(timer)
+    out += pack_rows(board.locked, board.columns)
+    out += CRC.pack(zlib.crc32(out))
+    return bytes(out)
+
+
+# the engine and the timers a checkpoint holds
+def decode_checkpoint(data):
+    if len(data) < len(MAGIC) + 1 + CRC.size or data[:len(MAGIC)] != MAGIC:
+        raise ValueError('not a checkpoint')
+    if data[len(MAGIC)] != VERSION:
+        raise ValueError(f'unsupported checkpoint version {data[len(MAGIC)]}')
+    if CRC.unpack_from(data, len(data) - CRC.size)[0] != zlib.crc32(data[:-CRC.size]):
+        raise ValueError('damaged checkpoint')
+    pos = len(MAGIC) + 1
+    values = []
+    for _ in range(10):
+        value, pos = decode_varint(data, pos)
+        values.append(value)
+    flags, columns, rows, randomizer, preview, seed, score, lines, pieces, ticks = values
+    if randomizer >= len(RANDOMIZER_NAMES):
+        raise ValueError(f'unknown randomizer {randomizer}')
+    piece = None
+    if flags & HAS_PIECE:
+        pose = []
+        for _ in range(4):
+            value, pos = decode_varint(data, pos)
+            pose.append(value)
+        piece = ActivePiece(*pose)
+    count, pos = decode_varint(data, pos)
+    queue = []
+    for _ in range(count):
+        value, pos = decode_varint(data, pos)
+        queue.append(value)
+    count, pos = decode_varint(data, pos)
+    timers = []
+    for _ in range(count):
+        timers.append(TIMER.unpack_from(data, pos)[0])
+        pos += TIMER.size
+    if pos + packed_size(columns, rows) + CRC.size != len(data):
+        raise ValueError('damaged checkpoint')
+
+    # the new engine deals its first pieces, and then we put the queue, the
+    # board and the counters back the way they were saved
+    engine = TetrisEngine(seed if flags & HAS_SEED else None, columns, rows,
+                          RANDOMIZER_NAMES[randomizer], preview)
+    engine.queue.setstate(tuple(queue))
+    board = engine.board
+    board.locked = unpack_rows(data[pos:pos + packed_size(columns, rows)], columns, rows)
+    board.rebuild_heights()
+    board.piece = piece
+    engine.score = score
+    engine.lines = lines
+    engine.pieces = pieces
+    engine.ticks = ticks
+    engine.game_over = bool(flags & GAME_OVER)
+    return engine, timers
+
+
+# we write to a file next to path and move it over path, so a game that is
+# closed in the middle of an autosave still has its last checkpoint
+def save_checkpoint(path, engine, timers=()):
+    data = encode_checkpoint(engine, timers)
+    partial = path + '.partial'
+    with open(partial, 'wb') as stream:
+        stream.write(data)
+    os.replace(partial, path)
+
+
+def load_checkpoint(path):
+    with open(path, 'rb') as stream:
+        return decode_checkpoint(stream.read())
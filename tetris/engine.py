@@ -0,0 +1,167 @@
+# Headless game engine
+#
+# TetrisEngine owns everything a game of Tetris needs: the board, the score and
+# the random pieces. It doesn't import pygame, so a game can run on a server or
+# in CI without a display. game_loop() in Tetris.py only turns key presses into
+# actions, calls tick() for gravity and draws what the engine holds.
+#
+#   engine = TetrisEngine()
+#   engine.reset(seed=7)
+#   while not engine.game_over:
+#       engine.step(DOWN)
+from collections import namedtuple
+
+from tetris.bitboard import Bitboard
+from tetris.grid import calculate_score, columns, rows
+from tetris.randomizer import MASK_64, PieceQueue
+
+
+# Actions
+# every input the player can make is one of these numbers, step() takes them
+NOOP = 0
+LEFT = 1
+RIGHT = 2
+DOWN = 3
+ROTATE = 4
+HARD_DROP = 5
+ACTIONS = (NOOP, LEFT, RIGHT, DOWN, ROTATE, HARD_DROP)
+
+# Gravity
+# every LINES_PER_LEVEL cleared lines we go up a level, and the higher the level
+# the faster our piece falls. GRAVITY_CURVE holds the seconds between gravity
+# ticks for every level, starting at the 0.4 seconds the game has always used.
+# Levels past the end of the curve keep the last delay
+LINES_PER_LEVEL = 10
+GRAVITY_CURVE = tuple(round(max(0.4 * 0.85 ** level, 0.05), 3) for level in range(15))
+
+
+def gravity_delay(level, curve=GRAVITY_CURVE):
+    return curve[min(level, len(curve) - 1)]
+
+
+# everything that decides how a game goes on from a point in it. board is a
+# clone of the engine's board and queue is PieceQueue.getstate()
+EngineCheckpoint = namedtuple('EngineCheckpoint', [
+    'board', 'queue', 'score', 'lines', 'pieces', 'ticks', 'game_over',
+])
+
+
+# randomizer is one of the names in RANDOMIZERS in tetris/randomizer.py and
+# preview is how many of the pieces after the current one we can see
+class TetrisEngine:
+    def __init__(self, seed=None, columns=columns, rows=rows, randomizer='bag', preview=5):
+        self.columns = columns
+        self.rows = rows
+        self.randomizer = randomizer
+        self.preview = preview
+        self.reset(seed)
+
+    # start a new game. With the same seed we get the same pieces in the same
+    # order, so two engines given the same seed and actions play the same game.
+    # Our random numbers only use the low 64 bits of the seed, so we keep just
+    # those: a negative seed plays the same pieces and replays and checkpoints
+    # can still write it as a varint
+    def reset(self, seed=None):
+        if seed is not None:
+            seed = int(seed) & MASK_64
+        self.seed = seed
+        self.queue = PieceQueue(seed, self.randomizer, self.preview)
+        self.board = Bitboard(self.columns, self.rows)
+        self.score = 0
+        # lines we have cleared, pieces we have spawned and gravity ticks so far
+        self.lines = 0
+        self.pieces = 0
+        self.ticks = 0
+        self.game_over = False
+        self.spawn()
+        return self
+
+    # we deal the next piece from our queue and place it at the top of the
+    # board, if there is no room for it the game is over
+    def spawn(self):
+        if self.board.spawn(self.queue.next()):
+            self.pieces += 1
+        else:
+            self.game_over = True
+
+    # apply one action to the game. We return the score we gained with this
+    # action, which is only more than 0 when a piece locks and clears lines
+    def step(self, action):
+        if self.game_over:
+            return 0
+        board = self.board
+        if action == LEFT:
+            board.move_left()
+        elif action == RIGHT:
+            board.move_right()
+        elif action == ROTATE:
+            board.rotate()
+        elif action == DOWN:
+            if not board.move_down():
+                return self.settle()
+        elif action == HARD_DROP:
+            board.hard_drop()
+            return self.settle()
+        return 0
+
+    # the piece numbers that come after our piece, the first one is next
+    def upcoming(self):
+        return list(self.queue.upcoming)
+
+    # the level we are on, which decides how fast gravity is
+    @property
+    def level(self):
+        return self.lines // LINES_PER_LEVEL
+
+    # gravity moves the piece down one row, the same as pressing down
+    def tick(self):
+        self.ticks += 1
+        return self.step(DOWN)
+
+    # our piece has been locked, so we clear the full rows, add to our score and
+    # either spawn the next piece or end the game
+    def settle(self):
+        lines_cleared = self.board.clear_lines()
+        score_increase = calculate_score(lines_cleared)
+        self.lines += lines_cleared
+        self.score += score_increase
+        if self.board.game_over_condition():
+            self.game_over = True
+        else:
+            self.spawn()
+        return score_increase
+
+    # an opponent sent us lines garbage lines with an empty cell in column
+    # hole, see Bitboard.add_garbage(). The game ends when they push our
+    # blocks off the top
+    def add_garbage(self, lines, hole):
+        if self.game_over:
+            return
+        if not self.board.add_garbage(lines, hole):
+            self.game_over = True
+
+    # Checkpoints
+    # checkpoint() remembers the game as it is now and rollback() puts it back
+    # there, for search and for rollback netcode that replays late inputs.
+    # The board is a clone that shares its rows until one of the boards
+    # changes, so a checkpoint costs about as much as clone() and we can take
+    # one every step. tetris/checkpoint.py turns the game into bytes for files
+    def checkpoint(self):
+        return EngineCheckpoint(self.board.clone(), self.queue.getstate(), self.score, self.lines,
+                                self.pieces, self.ticks, self.game_over)
+
+    # a checkpoint can be rolled back to any number of times
+    def rollback(self, checkpoint):
+        self.board = checkpoint.board.clone()
+        self.queue.setstate(checkpoint.queue)
+        self.score = checkpoint.score
+        self.lines = checkpoint.lines
+        self.pieces = checkpoint.pieces
+        self.ticks = checkpoint.ticks
+        self.game_over = checkpoint.game_over
+
+    # the nested list grid for draw_grid(), or the window of it that starts at
+    # row top and column left, see Bitboard.to_grid(). With ghost=True it also
+    # shows where our piece would land
+    def grid(self, top=0, left=0, height=None, width=None, ghost=False):
+        return self.board.to_grid(top, left, height, width, ghost)
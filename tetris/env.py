@@ -0,0 +1,227 @@
+# Gymnasium environment
+#
+# TetrisEnv wraps a TetrisEngine in the reset()/step() interface of Gymnasium,
+# so training code can play our game like any other environment. It plays in
+# one of two ways:
+#
+#   low:       every action is one of the actions of tetris/engine.py, NOOP,
+#              LEFT, RIGHT, DOWN, ROTATE or HARD_DROP, and gravity moves the
+#              piece down a row after every actions_per_tick actions
+#   placement: every action is where to put the piece, rotation * columns +
+#              col. We play the rotations, slides and hard drop that get it
+#              there, like HeuristicPolicy does. info['action_mask'] marks the
+#              placements the piece can reach, any other action drops the
+#              piece where it is
+#
+# The reward is the score the step gained, calculate_score() of the lines it
+# cleared. The observation is a dict:
+#
+#   board:    rows by columns uint8 cells, 0 empty, 1 locked and 2 the
+#             active piece, the same cells tetris/shared.py exports
+#   piece:    the kind of the active piece
+#   upcoming: the kinds of the next preview pieces
+#
+# render_mode='rgb_array' draws the game with draw_grid() from Tetris.py on an
+# offscreen surface and gives back the pixels.
+#
+# make_vector_env() makes a SyncVectorEnv or, with asynchronous=True, an
+# AsyncVectorEnv that steps every environment in a process of its own. Both
+# reset an environment by themselves when its game ends.
+#
+#   python -m tetris.env --envs 1 8 64
+#
+# measures steps per second of both vector environments with 1, 8 and 64
+# environments.
+#
+# This module needs Gymnasium and NumPy, which the rest of the package does
+# not, so it is not imported by tetris/__init__.py
+import argparse
+import os
+import sys
+import time
+
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+
+from tetris.ai import placements
+from tetris.engine import ACTIONS, HARD_DROP, TetrisEngine
+from tetris.grid import columns, rows
+from tetris.pieces import PIECE_KINDS
+from tetris.shared import PIECE, BoardExport
+
+MODES = ('low', 'placement')
+ENV_ID = 'tetris/Tetris-v0'
+
+
+class TetrisEnv(gym.Env):
+    metadata = {'render_modes': ['rgb_array'], 'render_fps': 60}
+
+    def __init__(self, mode='low', columns=columns, rows=rows, randomizer='bag', preview=5,
+                 actions_per_tick=1, max_steps=None, render_mode=None, cell_size=20):
+        if mode not in MODES:
+            raise ValueError(f'unknown mode {mode!r}')
+        if render_mode is not None and render_mode not in self.metadata['render_modes']:
+            raise ValueError(f'unknown render mode {render_mode!r}')
+        self.mode = mode
+        self.columns = columns
+        self.rows = rows
+        self.randomizer = randomizer
+        self.preview = preview
+        self.actions_per_tick = actions_per_tick
+        self.max_steps = max_steps
+        self.render_mode = render_mode
+        self.cell_size = cell_size
+
+        board = spaces.Box(0, PIECE, (rows, columns), np.uint8)
+        piece = spaces.Discrete(len(PIECE_KINDS))
+        upcoming = spaces.MultiDiscrete([len(PIECE_KINDS)] * preview)
+        self.observation_space = spaces.Dict({'board': board, 'piece': piece, 'upcoming': upcoming})
+        if mode == 'low':
+            self.action_space = spaces.Discrete(len(ACTIONS))
+        else:
+            self.action_space = spaces.Discrete(4 * columns)
+
+        self.engine = None
+        self.steps = 0
+        # in placement mode, the placements our piece can reach by their
+        # action, worked out once per piece for the mask and the next step
+        self.reachable = {}
+        # we build the board cells with a BoardExport into memory of our own,
+        # it only writes the rows that changed since the last step
+        self.export = BoardExport(columns, rows, buffer=bytearray(BoardExport.size(columns, rows)))
+        # the offscreen surface render() draws on, made on the first render()
+        self.surface = None
+
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        # the game's pieces come from our np_random, so the same seed to the
+        # first reset() plays the same games from then on
+        self.engine = TetrisEngine(int(self.np_random.integers(2 ** 63)), self.columns, self.rows,
+                                   self.randomizer, self.preview)
+        self.steps = 0
+        return self.observation(), self.info()
+
+    def step(self, action):
+        engine = self.engine
+        reward = 0
+        if self.mode == 'low':
+            reward += engine.step(int(action))
+            self.steps += 1
+            if self.actions_per_tick and self.steps % self.actions_per_tick == 0:
+                reward += engine.tick()
+        else:
+            for low in self.placement_actions(int(action)):
+                reward += engine.step(low)
+            self.steps += 1
+        terminated = engine.game_over
+        truncated = not terminated and self.max_steps is not None and self.steps >= self.max_steps
+        return self.observation(), reward, terminated, truncated, self.info()
+
+    # the actions that take our piece to the placement action stands for, or a
+    # hard drop when the piece can't get there
+    def placement_actions(self, action):
+        placement = self.reachable.get(action)
+        return placement.actions() if placement else [HARD_DROP]
+
+    # the placements our piece can reach, as a mask over the placement actions
+    def action_mask(self):
+        self.reachable = {placement.rotation * self.columns + placement.col: placement
+                          for placement in placements(self.engine.board)}
+        mask = np.zeros(4 * self.columns, np.int8)
+        mask[list(self.reachable)] = 1
+        return mask
+
+    def observation(self):
+        board = self.engine.board
+        self.export.write(self.engine)
+        piece = board.piece.kind if board.piece is not None else 0
+        return {
+            'board': self.export.array().copy(),
+            'piece': np.int64(piece),
+            'upcoming': np.array(self.engine.upcoming(), np.int64),
+        }
+
+    def info(self):
+        engine = self.engine
+        info = {'score': engine.score, 'lines': engine.lines, 'pieces': engine.pieces}
+        if self.mode == 'placement':
+            info['action_mask'] = self.action_mask()
+        return info
+
+    # the game drawn by draw_grid() as a (height, width, 3) array of pixels.
+    # pygame and Tetris.py are only imported the first time we render
+    def render(self):
+        if self.render_mode != 'rgb_array':
+            return None
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        import pygame as py
+
+        from Tetris import BLACK, draw_grid, preview_rect
+
+        if self.surface is None:
+            py.font.init()
+            panel = preview_rect(0, self.cell_size, self.preview).width + 20 if self.preview else 0
+            self.surface = py.Surface((self.columns * self.cell_size + 40 + panel,
+                                       self.rows * self.cell_size + 40))
+        self.surface.fill(BLACK)
+        engine = self.engine
+        draw_grid(self.surface, engine.grid(ghost=True), engine.score, self.cell_size, engine.upcoming())
+        return py.surfarray.array3d(self.surface).transpose(1, 0, 2)
+
+    def close(self):
+        self.surface = None
+
+
+gym.register(ENV_ID, entry_point=TetrisEnv)
+
+
+# count copies of TetrisEnv(**options), stepped one after another or each in
+# a process of its own
+def make_vector_env(count, asynchronous=False, **options):
+    makers = [lambda: TetrisEnv(**options) for _ in range(count)]
+    if asynchronous:
+        return gym.vector.AsyncVectorEnv(makers)
+    return gym.vector.SyncVectorEnv(makers)
+
+
+# Benchmark
+# random actions, or random placements the piece can reach, for seconds on
+# every vector environment
+
+def steps_per_second(vector, mode, seconds):
+    vector.reset(seed=0)
+    rng = np.random.default_rng(0)
+    count = vector.num_envs
+    steps = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        if mode == 'low':
+            actions = rng.integers(len(ACTIONS), size=count)
+        else:
+            # random placements, not all of them reachable
+            actions = rng.integers(vector.single_action_space.n, size=count)
+        vector.step(actions)
+        steps += count
+    return steps / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure steps per second of the vector environments.')
+    parser.add_argument('--envs', type=int, nargs='+', default=[1, 8, 64], help='environments per vector')
+    parser.add_argument('--mode', choices=MODES, default='low', help='low level actions or placements')
+    parser.add_argument('--seconds', type=float, default=3, help='seconds to step every vector for')
+    args = parser.parse_args(argv)
+
+    for count in args.envs:
+        for asynchronous in (False, True):
+            vector = make_vector_env(count, asynchronous, mode=args.mode)
+            rate = steps_per_second(vector, args.mode, args.seconds)
+            vector.close()
+            kind = 'async' if asynchronous else 'sync'
+            print(f'{count:4} envs {kind:5} {args.mode:9} {rate:12,.0f} steps/s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,479 @@
+# Grid rules
+#
+# These are the functions that operate on our nested list game grid. They don't
+# need pygame, so they live here where headless scripts can import them without
+# opening a window. Tetris.py imports them back for the game.
+import random
+
+
+# Game settings
+# our game grid will include 20 rows and 10 columns
+columns = 10
+rows = 20
+
+
+# Create the grid (2D array)
+# we use a list compression to create a nested list for our game grid
+# our game grid will include 20 rows and 10 columns
+# we will use a function called draw_grid to draw physical map of our game grid 
+# using pygame
+# additionally, the design of this game will rely on functions such as move left,
+# move down, etc. So our create_grid() will store the grid that all of the functions
+# will operate on
+#
+# create grid is also used to create a temp_grid which is an empty grid used to map
+# some of the movements such as move right or left
+# this was done to avoid a collision between the pieces, represented by a a nested list
+# of '*'
+# if we wanted to move the piece * * * * to the right. Each * is moved 1 by 1 to the right
+# by n+1 and would thus override the piece infront of it
+# thus temp_grid is used to map the piece onto a blank grid and easily map it back to the
+# grid being used for the game
+def create_grid():
+    return [[' ' for _ in range(columns)] for _ in range(rows)]
+
+# Tetris pieces
+# Tetris is composed of seven pieces represented by the letters I, O, S, Z, L, J, T
+# we define each one of these pieces as a nested list
+# we represent the piece as a ' ' or '*' within its nest to define the 'shape' of the piece
+# since the nested list alone has no shape, it is up to us to correctly map the 'piece' onto
+# our grid. Thus these 'pieces' were created to help us do this
+def new_pieces():
+    I = [['*'], ['*'], ['*'], ['*']]
+    O = [['*','*'], ['*','*']]
+    S = [[' ','*','*'], ['*','*',' ']]
+    Z = [['*','*'], [' ','*','*']]
+    L = [['*',' '], ['*',' '], ['*','*']]
+    J = [[' ','*'], [' ','*'], ['*','*']]
+    T = [['*','*','*'], [' ','*',' ']]
+    return [I, O, S, Z, L, J, T]
+
+# Randomly select a piece
+# we wanted a random piece to be generated after every old piece is locked
+# https://numpy.org/doc/stable/reference/random/generated/numpy.random.choice.html
+# we use random.choice() from the random library to achieve this
+# choice() takes an array and generates a random sample
+# we store all seven of our 'pieces' created in function new_pieces() and store
+# them in variable pieces
+# we then call random.choice() on our pieces, which are just seven nested lists
+# and random will randomly generate one of these seven pieces after each new piece is
+# locked and stored as a '0'
+#
+# rng defaults to the random module, a game that wants to be reproducible passes
+# its own seeded random.Random() instead
+def random_piece(rng=random):
+    pieces = new_pieces()
+    return rng.choice(pieces)
+
+# Map the piece onto the grid
+# our map_to_grid function takes four paramaters, two of which are default arguements
+# our two default arugments are start_row and start_col and gaurentee that our piece starts
+# at position (0,4) on our grid
+def map_to_grid(piece, grid, start_row=0, start_col=4):
+    for i in range(len(piece)):
+        for j in range(len(piece[i])):
+            # we iterate through our piece and if we find a '*' and the '*' is within the bounds
+            # of our row and column after adjusting for the starting position, then we map that
+            # '*' to the starting position plus the i or j location in the row and column of the
+            # piece
+            if piece[i][j] == '*':
+                if start_row + i < len(grid) and start_col + j < len(grid[0]):
+                    grid[start_row + i][start_col + j] = '*'
+# The key note is that each '*' is iterated through and individually mapped on to our grid one by one
+# at our starting grid posiiton of (0,4)
+# Thus we have our 'piece', which is simply a collection of '*' mapped on to our grid.
+# Recall that by our condition in the draw_grid() function; if the function detects a '*', 
+# py.draw.rect() will fill in all of the green box denoting our piece 
+
+
+# we have many move functions such as move_right, move_left and move_down
+# these functions deal with the managmeent of our piece on the grid.
+# Everytime we 'move' a piece we have to clear its previous place on the grid 
+# defined by '*'
+# to do this, clear_piece takes the parameter grid
+def clear_piece(grid):
+    # we iterate through our entire grid
+     for r in range(len(grid)):
+        for c in range(len(grid[0])): 
+            # if we find a '*' on our grid we replace it with ' '
+            if grid[r][c] == '*':
+                grid[r][c] = ' '
+# thus our piece is cleared from its previous positon
+
+# our move_right function takes two arguments: grid and temp_grid
+# we use temp_grid to prevent '*' in our piece from colliding and leading to a disfigured piece on grid.
+# Thus when we move right we will map each '*' individually onto the empty temp_grid so we have no collisions.
+# We then clear our game grid of any '*' and we then map the piece from our temp_grid back on to our 
+# game grid.
+def move_right(grid, temp_grid):
+    # we set moved to False
+    # if no piece is moved right we return False
+    # if a piece does move right then we will return True
+    moved = False
+    # grid_width stores the full length of the column length
+    grid_width = len(grid[0])
+    
+    # Blocking condtions
+    # in our loop we iterate over our grid by in the reverse direction starting from right to left
+    for r in range(len(grid)):
+        for c in range(len(grid[0])-1, -1, -1): 
+            # When we detect an '*' in our piece we must check for two conditions before we move it right
+            # the first condition is if our piece is outside of the right most parameter of our grid, denoted
+            # by grid_width - 1 
+            # The second condition is to check if there is a locked piece in our way
+            # Since the pieces are moved by individual '*'; we check if there is an individual '0' in our way
+            # 
+            # recall that our locked pieces are deonated by '0'
+            # to check if there is a locked piece in our way we denoted this by grid[r][c+1] == '0'
+            # if either of these conditions are met then we CANNOT move our piece right and we
+            # return False
+            if grid[r][c] == '*' and (c == grid_width - 1 or grid[r][c + 1] == '0'):
+                return False  
+    
+    # In the case when we can move our piece we have to 'clear out temp_grid by iterating through
+    # ensuring that each box on the grid is held by an empty space ' ' 
+    for r in range(len(temp_grid)):
+        for c in range(len(temp_grid[0])):
+            temp_grid[r][c] = ' '
+
+    # we then iterate through our game grid starting from the right side
+    for r in range(len(grid)):
+        for c in range(len(grid[0])-1, -1, -1):
+            # we check for the position of '*' in our gam grid to get our piece
+            if grid[r][c] == '*':
+                # we check to see if there is space to the right of our piece denoted by c+1 
+                # we ensure we're still in bounds when its less than our grid_width
+                # then check if the space to the right is empty denoted by ' '
+                # if it is we move our '*' to the right by 1 in our temp_grid
+                # we then change moved to True
+                if c + 1 < grid_width:
+                    if grid[r][c + 1] == ' ':
+                        temp_grid[r][c + 1] = '*'
+                        moved = True
+                
+                    else:
+                        # if we cannot right we will keep the '*' in our current temp_grid position
+                        temp_grid[r][c] = '*'
+                        # this conditional will help in the when we have collisions with other '*'
+                        # so our piece doesn't run into itself
+                    # [ ' ', ' ', '*', ' ', ' ' ]     [ ' ', ' ', ' ', '*', ' ' ]
+                    # [ ' ', '*', '*', ' ', ' ' ] ->  [ ' ', ' ', '*', '*', ' ' ]
+                    # [ ' ', ' ', '*', ' ', ' ' ]     [ ' ', ' ', ' ', '*', ' ' ]
+                    # recall that we iterate from the right for this loop to reduce the chance for colliding
+                    # with its own piece
+                else:
+                    # this last condition handles for when our piece is at its right most bound
+                    temp_grid[r][c] = '*'
+                    # [ ' ', ' ', '*' ]     [ ' ', ' ', '*' ]
+                    # [ ' ', ' ', '*' ] ->  [ ' ', ' ', '*' ]
+                    # [ ' ', ' ', '*' ]     [ ' ', ' ', '*' ]
+
+                # regardless of the conditional  outcome we will clear our grid
+                grid[r][c] = ' '
+
+    # once we've ensure that the right space is open and it is not an edge we will map our temp_grid '*'
+    # to our game grid with this loop
+    for r in range(len(grid)):
+        for c in range(len(grid[0])):
+            if temp_grid[r][c] == '*':
+                grid[r][c] = '*'
+
+    # if the piece '*' was able to be move then in our conditional statement above
+    # temp_grid would have been updated and moved would have been changed to True
+    # so we return moved
+    #
+    # if we ran into any collisions in our initial loop, such as colliding with the wall or locked piece
+    # our function would immediately return False thus not executing the movement
+    return moved
+
+# The logic for move left is similar to move right. 
+# We define our grid_width as the length of our columns and we set our variable moved to False
+def move_left(grid, temp_grid):
+    moved = False
+    grid_width = len(grid[0])
+    
+    # We start with checking for the conditions of out of bounds or collision with a locked piece
+    # if any of our '*' collide with a locked '0' or go out of bounds we return False and prevent 
+    # the left movement from occuring
+    for r in range(len(grid)):
+        for c in range(len(grid[0])): 
+            # our left most bound is when c == 0 and a left psoition collision is
+            # defined by grid[r][c-1] == '0'
+            # we check see if we're at our left bound or if there is a locked piece
+            # in the left position that we intend to move to
+            # we return False anytime this case occurs to stop the left mvoement
+            if grid[r][c] == '*' and (c == 0 or grid[r][c - 1] == '0'):
+                return False  
+    
+    # We clear our temp_grid so that we don't have any collisions
+    for r in range(len(temp_grid)):
+        for c in range(len(temp_grid[0])):
+            temp_grid[r][c] = ' '
+
+    # we iterate through our grid and look for individual piece components denoted by '*'
+    for r in range(len(grid)):
+        for c in range(len(grid[0])):
+            if grid[r][c] == '*':
+                # Store in temp if left space is available
+                # if c-1 is 0 or greater we are within the bounds of our grid
+                # if grid[r][c-1] == ' ' then there is space on our grid to move left
+                # so we map to this left position on our temp_grid and change moved to True 
+                # so that our function can execute
+                if c - 1 >= 0 and grid[r][c - 1] == ' ':
+                    temp_grid[r][c - 1] = '*'
+                    moved = True            
+
+                # We then clear our original grid of the previous '*' so that they can be place in the 
+                # new left position
+                grid[r][c] = ' '
+
+    # We finally map the new position from our tem_grid to our game grid
+    for r in range(len(grid)):
+        for c in range(len(grid[0])):
+            if temp_grid[r][c] == '*':
+                grid[r][c] = '*'
+
+    # we return moved that is now True so that our function executes
+    return moved
+
+
+# we define a move_down function to move our piece down 1 row
+def move_down(grid, temp_grid):
+    # we set moved to False and should_lock to False to prevent our function from running if
+    # its conditions aren't met
+    # we define our row and column length by grid_height and grid_width
+    moved = False
+    grid_height = len(grid)
+    grid_width = len(grid[0])
+    should_lock = False
+
+    # We iterate through our grid and check to see if we in the last row or if there is a locked 
+    # piece below
+    for c in range(grid_width):
+        for r in range(grid_height):
+            if grid[r][c] == '*':
+            # the last row is defined by grid_height - 1 
+            # a locked peice below is defined by grid[r+1][c]
+            # if any of the '*' in our piece meets this condition we change should_lock to True and
+            # break out of this loop
+                if r == grid_height - 1 or grid[r + 1][c] == '0':
+                    should_lock = True
+                    break
+        if should_lock:
+            break
+
+    # we clear our temp grid like we did in move_left and move_right
+    for r in range(len(temp_grid)):
+        for c in range(len(temp_grid[0])):
+            temp_grid[r][c] = ' '
+
+    # We iterate through our grid starting from the bottom
+    for c in range(grid_width):
+        for r in range(grid_height - 1, -1, -1): 
+            if grid[r][c] == '*':
+                # if our piece denoted by '*' does not meet our locking condition and
+                # is not in our last row denoted by r+1 < grid_height and there is 
+                # an empty space below denoted by grid[r+1][c] == ' '
+                # then we move the piece down on our temp_grid and change moved to True
+                if not should_lock and r + 1 < grid_height and grid[r + 1][c] == ' ':
+                    temp_grid[r + 1][c] = '*'
+                    moved = True
+                else:
+                # otherwise we keep the piece in the same position and map it to our temp_grid
+                    temp_grid[r][c] = '*'
+                # we then clear our grid of the old piece position
+                grid[r][c] = ' '
+
+    # Finally, we map the moved down piece from our temp_grid back onto our game grid
+    for r in range(grid_height):
+        for c in range(grid_width):
+            if temp_grid[r][c] == '*':
+                grid[r][c] = '*'
+
+    # if the piece should lock we call our lock_pieces function and return False so that
+    # our move_down function doesn't execute
+    if should_lock:
+        lock_pieces(grid)
+        return False
+
+    # presuming there is space for our piece to move down, then moved is changed to True and our 
+    # move_down function is executed
+    return moved
+
+
+
+
+
+
+
+
+# since our section that we want to rotate is small compared to the big grid
+# we need to create a subgrid around our 'piece' to allow for a rotation
+# where the pieces do not end in the wrong parts of the grid
+def subgrid_bound(grid):
+    rows, cols = len(grid), len(grid[0])
+    min_row, max_row = rows, 0
+    min_col, max_col = cols, 0
+
+    # we iterate through our grid to the boundaries of our subgrid
+    # we use the min row, col and max row, col variables to do this
+    # the min and max function min(n1,n2..) take any number n and return
+    # the highest or lowest number n
+    # we thus get our boundary for our subgrid
+    for r in range(rows):
+        for c in range(cols):
+            if grid[r][c] == '*':
+                # min_row is set to the total number of rows
+                # r is when this iteration finds a '*' 
+                # if r is less than min_row, min_row then becomes r
+                # we repeat this until we have the smallest value for row
+                # our max_row starts at 0. As we iterate through our row and
+                # replace max_row with our greatest r
+                #
+                # we do this with our columns as well
+                min_row = min(min_row, r)
+                max_row = max(max_row, r)
+                min_col = min(min_col, c)
+                max_col = max(max_col, c)
+
+    # we then return all for values
+    return min_row, max_row, min_col, max_col
+
+# we want to isolate our subgrid from our game grid
+# we pass the arguements grid, min_row, max_row, min_col, max_col
+def isolate_subgrid(grid, min_row, max_row, min_col, max_col):
+
+    # we iterator through our min and max boundaries to get our subgrid matrix
+    # that we will use to rotate
+    subgrid = [row[min_col:max_col+1] for row in grid[min_row:max_row+1]]
+    return subgrid
+
+
+
+
+# we then use this subgrid to perform our matrix operations for the rotation
+def rotate(subgrid):
+
+    # we create a variable that can hold empty places for our transpose matrix
+    transpose = [[0] * len(subgrid) for _ in range(len(subgrid[0]))]
+
+    # we then iterate through our subgrid and switch the cols and rows or switch the x-y axis
+    for r in range(len(subgrid)):
+        for c in range(len(subgrid[0])):
+            transpose[c][r] = subgrid[r][c]
+    # We have
+    # [' ','*']
+    # ['*','*']
+    # ['*',' ']
+    # We get
+    # ['*','*',' ']
+    # [' ','*','*']
+
+
+    # We then reverse our rows in the transposed matrix
+    rotated = [row[::-1] for row in transpose]
+    # We then get
+    # [' ','*','*']
+    # ['*','*',' ']
+    # thus our piece is rotate 
+
+    return rotated
+
+
+
+
+
+
+
+# we clear our grid then map our rotated subgrid to our main grid
+def map_rotate_to_grid(grid, rotated, min_row, min_col):
+
+    # check if rotated is empty or has empty rows then return the unchanged grid
+    if not rotated or not rotated[0]: 
+        return grid 
+
+    # we get the length of the rows and columns for both the grid and rotated matrix
+    grid_rows, grid_cols = len(grid), len(grid[0])
+    rotated_rows, rotated_cols = len(rotated), len(rotated[0])
+    
+    # we need to prevent our rotated piece from going out of bounds
+    # we will add the starting point, the min_row and col and add the roated row and col
+    # which includes the length of the rotated row or column
+    # if either of these are greater we will subtract rotated_rows from our grid
+    # and start at the new min_row and min_col so that 
+    # our rotated piece does not go out of bounds
+    if min_row + rotated_rows > grid_rows:
+        min_row = grid_rows - rotated_rows
+    
+    if min_col + rotated_cols > grid_cols:
+        min_col = grid_cols - rotated_cols
+
+    # we clear our previous non rotated piece to allow for the rotation to be mapped to our grid
+    for r in range(len(grid)):
+        for c in range(len(grid[0])):
+            if grid[r][c] == '*':
+                grid[r][c] = ' '
+
+    for r in range(len(rotated)):
+        for c in range(len(rotated[0])):
+            # our mapping begins at our min row and colum
+            # # we map the length of rotated piece's row and column to our grid
+            grid[min_row + r][min_col + c] = rotated[r][c]
+
+
+
+
+def clear_lines(grid):
+    # we create a temporary place holder for cleared rows
+    new_grid = []
+    # we set our cleared rows counter to zero
+    lines_cleared = 0
+    # we define the length of our row on our grid
+    row_length = len(grid[0])
+
+    for row in grid:
+        # check to see if the row is filled denoted by '0'
+        if all(cell == '0' for cell in row):
+            # if the row is filled then increase the lines cleared counter
+            lines_cleared += 1
+        else:
+            # if the row is NOT cleared then we append that row to our new_grid
+            new_grid.append(row.copy())
+
+    # Add new empty rows to the top of new_grid to replace the cleared rows
+    for _ in range(lines_cleared):
+        new_grid.insert(0, [' ' for _ in range(row_length)])
+
+    return new_grid, lines_cleared
+    
+
+
+
+# we iterate through our grid
+# if we encounter a '*' on our grid we change it to a '0', which 
+# locks our piece
+def lock_pieces(grid):
+    rows, cols = len(grid), len(grid[0])
+    for r in range(rows):
+        for c in range(cols):
+            if grid[r][c] == '*':
+                grid[r][c] = '0'
+
+
+# score increase based on the amount of lines_cleared in one move
+def calculate_score(lines_cleared):
+    if lines_cleared == 1:
+        return 100
+    elif lines_cleared == 2:
+        return 300
+    elif lines_cleared == 3:
+        return 500
+    elif lines_cleared == 4:
+        return 800
+    else:
+        return 0
+
+# we define our game over condition in this function
+def game_over_condition(grid):
+    # Check if any cell in the top row contains a locked piece
+    return any(cell == '0' for cell in grid[0])
@@ -0,0 +1,148 @@
+# Input
+#
+# game_loop() used to move our piece once for every KEYDOWN event, straight
+# away, in whatever order the events came in between two frames, and a held
+# key did nothing after its first move. The InputBuffer sits between the keys
+# and the engine instead:
+#
+#   - every key press and release goes into the buffer with the time it
+#     happened, and scripts can push actions with a time of their own
+#   - holding left, right or down repeats the move like the classic games do,
+#     first after the delayed auto shift (DAS) and then every auto repeat
+#     rate (ARR) seconds. Of left and right only the key pressed last repeats,
+#     and letting go of it hands the repeat back to the other one
+#   - the game runs in fixed simulation ticks of TICK seconds. Every tick
+#     takes the actions that are due by its end out of the buffer, in the order
+#     they happened, so an action lands on the tick it belongs to however long
+#     our frames take
+#
+# Nothing is dropped: the buffer holds everything until a tick takes it, and
+# when a frame runs late the next frame runs the ticks it missed. Only held
+# keys are bounded: the game loop never catches up on more than MAX_CATCH_UP
+# seconds, so a key held through a stall repeats for at most that long and
+# doesn't drop our piece all the way down in one frame.
+#
+# The buffer doesn't import pygame, the game loop turns keys into the actions
+# of tetris/engine.py before they get here, so replays and bots can feed it
+# the same way
+from collections import deque
+
+from tetris.engine import DOWN, LEFT, RIGHT
+
+# the length of one simulation tick in seconds
+TICK = 1 / 120
+# the defaults are 10 frames and 2 frames at 60 frames a second
+DAS = 0.167
+ARR = 0.033
+# the actions that repeat while their key is held, rotating and hard dropping
+# happen once per press
+REPEATING = (LEFT, RIGHT, DOWN)
+# the most seconds of simulation the game loop runs in one frame, and the most
+# seconds of repeats one take() gives out for a held key
+MAX_CATCH_UP = 0.25
+
+# what an event in the buffer is
+PRESS = 0
+RELEASE = 1
+PUSH = 2
+
+
+class InputBuffer:
+    def __init__(self, das=DAS, arr=ARR, max_catch_up=MAX_CATCH_UP):
+        if arr <= 0:
+            raise ValueError('the auto repeat rate must be more than 0 seconds')
+        self.das = das
+        self.arr = arr
+        self.max_catch_up = max_catch_up
+        # (time, event, action) waiting for a tick to take them, oldest first
+        self.events = deque()
+        # the repeating actions whose key is held, with the time of their next
+        # repeat. The dict keeps the order the keys were pressed in
+        self.held = {}
+        # the time of the last action we gave out, the buffer never goes back
+        # before it
+        self.time = 0.0
+
+    # Adding
+    # the game loop adds events in the order it reads them. An event can't
+    # happen before one we already hold, so one that is stamped earlier is
+    # taken as happening at the same time
+
+    def add(self, time, event, action):
+        time = max(time, self.time)
+        if self.events and time < self.events[-1][0]:
+            time = self.events[-1][0]
+        self.events.append((time, event, action))
+
+    def press(self, action, time):
+        self.add(time, PRESS, action)
+
+    def release(self, action, time):
+        self.add(time, RELEASE, action)
+
+    # an action that happens once, from a script or a bot
+    def push(self, action, time):
+        self.add(time, PUSH, action)
+
+    # let go of every key, for when our window loses the focus and we won't
+    # see the keys come up
+    def release_all(self, time):
+        for action in REPEATING:
+            self.release(action, time)
+
+    # Taking
+
+    # the held actions that repeat right now, down and the last of left and right
+    def repeating(self):
+        active = [action for action in self.held if action == DOWN]
+        sideways = [action for action in self.held if action != DOWN]
+        if sideways:
+            active.append(sideways[-1])
+        return active
+
+    # the actions that are due at or before until, in the order they happen.
+    # Events and repeats are merged by time, so a key that is pressed and let
+    # go between two ticks still gets every repeat it was held for.
+    #
+    # Repeats due before since are skipped and the key carries on repeating
+    # from since. The game loop passes the time its catch up started, without
+    # it we skip the repeats due more than max_catch_up before until
+    def take(self, until, since=None):
+        events = self.events
+        held = self.held
+        actions = []
+        floor = until - self.max_catch_up if since is None else since
+        for action in held:
+            if held[action] < floor:
+                held[action] = floor
+        while True:
+            repeat_time = repeat_action = None
+            for action in self.repeating():
+                if held[action] <= until and (repeat_time is None or held[action] < repeat_time):
+                    repeat_time, repeat_action = held[action], action
+
+            if events and events[0][0] <= until and (repeat_time is None or events[0][0] <= repeat_time):
+                time, event, action = events.popleft()
+                self.time = time
+                if event == PRESS and action in REPEATING:
+                    # a new press moves the key to the end of held, so it is
+                    # the key pressed last
+                    held.pop(action, None)
+                    held[action] = max(time + self.das, floor)
+                    actions.append(action)
+                elif event == RELEASE:
+                    repeating = action in self.repeating()
+                    if held.pop(action, None) is not None and repeating and action != DOWN:
+                        # the other sideways key takes over the repeat, and
+                        # waits a full DAS like a new press
+                        for other in (LEFT, RIGHT):
+                            if other in held:
+                                held[other] = max(time + self.das, floor)
+                else:
+                    actions.append(action)
+            elif repeat_action is not None:
+                held[repeat_action] = repeat_time + self.arr
+                self.time = repeat_time
+                actions.append(repeat_action)
+            else:
+                return actions
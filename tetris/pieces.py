@@ -0,0 +1,138 @@
+# Rotation tables
+#
+# Rotating a piece on the grid takes subgrid_bound(), isolate_subgrid(), rotate(),
+# clear_piece() and map_rotate_to_grid(), which builds a transpose and several
+# new lists every time SPACE is pressed. A piece only ever has four rotations, so
+# we work all of them out once when the module is imported and rotating becomes
+# a lookup in ROTATIONS[kind][rotation].
+#
+# For every piece from new_pieces() and every rotation we keep
+#   - matrix: the piece as a tuple of rows of ' ' and '*'
+#   - cells:  the (row, col) offsets of every '*' from the top left corner
+#   - masks:  one integer per row, bit j is set when column j holds a '*'
+#   - height and width of the bounding box
+#   - tops and bottoms: for every column of the bounding box, the row offset
+#     of the highest and the lowest '*' in it. A board uses these with its
+#     column heights to find where a piece lands without moving it down
+#
+# Our rotation turns the piece clockwise around the top left corner of its
+# bounding box and then pushes it back inside the bottom and right side of the
+# grid. That push only depends on height and width, so a board can work out the
+# furthest origin for every rotation up front with max_origins()
+from collections import namedtuple
+
+from tetris.grid import new_pieces
+
+
+Rotation = namedtuple('Rotation', ['kind', 'rotation', 'matrix', 'cells', 'masks', 'height', 'width',
+                                   'tops', 'bottoms'])
+
+
+# not every piece matrix is square, the Z piece from new_pieces() has a short
+# first row, so we pad every row with ' ' to the width of the widest row. This
+# gives us the same bounding box that subgrid_bound() finds on the grid
+def pad_shape(shape):
+    width = max(len(row) for row in shape)
+    return [list(row) + [' '] * (width - len(row)) for row in shape]
+
+
+# we rotate a piece matrix clockwise the same way rotate() does on the subgrid:
+# transpose the rows and columns and then reverse every row
+def rotate_shape(shape):
+    return [list(row[::-1]) for row in zip(*shape)]
+
+
+# we turn a piece matrix into one integer per row
+# bit j of the mask is set when the piece has a '*' in column j
+def shape_masks(shape):
+    masks = []
+    for row in shape:
+        mask = 0
+        for j, cell in enumerate(row):
+            if cell == '*':
+                mask |= 1 << j
+        masks.append(mask)
+    return masks
+
+
+# we build all four rotations of every piece
+def build_rotations():
+    table = []
+    for kind, piece in enumerate(new_pieces()):
+        states = []
+        matrix = pad_shape(piece)
+        for rotation in range(4):
+            cells = tuple((i, j) for i, row in enumerate(matrix)
+                          for j, cell in enumerate(row) if cell == '*')
+            # every column of a padded piece has at least one '*' in it
+            column_rows = [[i for i, j2 in cells if j2 == j] for j in range(len(matrix[0]))]
+            states.append(Rotation(
+                kind, rotation, tuple(tuple(row) for row in matrix), cells,
+                tuple(shape_masks(matrix)), len(matrix), len(matrix[0]),
+                tuple(min(offsets) for offsets in column_rows), tuple(max(offsets) for offsets in column_rows),
+            ))
+            matrix = rotate_shape(matrix)
+        table.append(tuple(states))
+    return tuple(table)
+
+
+ROTATIONS = build_rotations()
+# piece numbers in the same order as new_pieces(): I, O, S, Z, L, J, T
+PIECE_KINDS = range(len(ROTATIONS))
+PIECE_NAMES = 'IOSZLJT'
+
+# we look up a piece number from the nested list random_piece() returns
+KIND_OF_MATRIX = {state.matrix: state.kind for states in ROTATIONS for state in states[:1]}
+
+
+def piece_kind(piece):
+    return KIND_OF_MATRIX[tuple(tuple(row) for row in pad_shape(piece))]
+
+
+# the furthest row and column the origin of every rotation can have on a board
+# of this size, rotate() clamps to these so the piece stays inside the grid
+def max_origins(columns, rows):
+    return tuple(
+        tuple((rows - state.height, columns - state.width) for state in states)
+        for states in ROTATIONS
+    )
+
+
+# Active piece
+# the piece in play is a small record of which piece it is, how many times it
+# has been rotated and where the top left corner of its bounding box is. It is
+# never written into the board, so finding it, moving it or drawing it only
+# ever looks at its own four cells. __slots__ keeps it to four fields with no
+# dict, because we make a new one for every piece and for every ghost we show
+class ActivePiece:
+    __slots__ = ('kind', 'rotation', 'row', 'col')
+
+    def __init__(self, kind, rotation=0, row=0, col=0):
+        self.kind = kind
+        self.rotation = rotation
+        self.row = row
+        self.col = col
+
+    # the table entry for the rotation the piece is in
+    @property
+    def state(self):
+        return ROTATIONS[self.kind][self.rotation]
+
+    # the (row, col) board cells the piece covers
+    def cells(self):
+        row, col = self.row, self.col
+        return [(row + i, col + j) for i, j in ROTATIONS[self.kind][self.rotation].cells]
+
+    # the same piece somewhere else, like the ghost at the row it lands on
+    def moved(self, row=None, col=None):
+        return ActivePiece(self.kind, self.rotation,
+                           self.row if row is None else row, self.col if col is None else col)
+
+    def __eq__(self, other):
+        if not isinstance(other, ActivePiece):
+            return NotImplemented
+        return (self.kind, self.rotation, self.row, self.col) == (other.kind, other.rotation, other.row, other.col)
+
+    def __repr__(self):
+        return (f'ActivePiece({PIECE_NAMES[self.kind]}, rotation={self.rotation}, '
+                f'row={self.row}, col={self.col})')
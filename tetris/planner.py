@@ -0,0 +1,518 @@
+# Lookahead planner
+#
+# best_placement() only looks at the piece in play. The Planner looks further:
+# it places the piece in play, then every piece in the preview queue after it,
+# and past the end of the queue it takes the average over all 7 pieces, since
+# we don't know which one comes. That is an expectimax search where our
+# placements are max nodes and unknown pieces are chance nodes.
+#
+# A board has around 30 placements per piece, far too many to try them all a
+# few pieces deep, so at every level we score the placements with evaluate()
+# and only search on from the best beam_width of them. The value of a line of
+# play is the lines it clears on the way, weighted like evaluate() weights
+# them, plus the evaluate() score of the last placement.
+#
+# Planning has a time budget per move. We search one piece deep, then two,
+# then three, and so on, and when the time runs out in the middle of a depth
+# we play the best move of the last depth we finished.
+#
+# Boards we have already valued are kept in a TranspositionTable, keyed on
+# the board's Zobrist hash, the pieces still to come and the depth left. It
+# outlives a single move: the boards we looked at two pieces deep this move
+# are one piece deep next move, so much of the next search is already done.
+#
+# ParallelPlanner spreads the search over a pool of worker processes, one
+# task for every placement of the next piece after every root placement, see
+# below.
+#
+#   python -m tetris.planner --pieces 200 --budget 0.005
+#   python -m tetris.planner --pieces 200 --budget 0.005 --workers 8
+import argparse
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from collections import OrderedDict
+from multiprocessing import shared_memory
+
+from tetris.ai import WEIGHTS, Placement, evaluate, placements
+from tetris.bitboard import Bitboard
+from tetris.engine import TetrisEngine
+from tetris.pieces import PIECE_KINDS, ActivePiece
+
+# the value of a line of play that tops out, lower than any board can score
+LOSS = -1e9
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+# a dict that forgets the entry used least recently once it holds size entries
+class TranspositionTable:
+    def __init__(self, size=100000):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# beam_width is how many placements we search on from at every level
+# time_budget is the seconds we may spend on a move, None for no limit
+# max_depth is the most pieces we look ahead, by default the piece in play,
+# the preview and one unknown piece after them
+class Planner:
+    # the clock our time budget is measured on
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, beam_width=6, time_budget=0.005, max_depth=None, cache_size=100000, weights=WEIGHTS):
+        self.beam_width = beam_width
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        self.weights = weights
+        self.table = TranspositionTable(cache_size)
+        self.deadline = None
+        self.nodes = 0
+        # what the last plan() did, see plan()
+        self.stats = {}
+
+    # the best placement for the piece in play on the engine's board, or None
+    # when there is no piece. After planning, stats holds the depth we
+    # finished, how many placements we scored, the time we took and the
+    # placements we scored per second
+    def plan(self, engine):
+        board = engine.board
+        if board.piece is None:
+            return None
+        start = self.clock()
+        self.deadline = start + self.time_budget if self.time_budget is not None else None
+        self.nodes = 0
+        pieces = engine.upcoming()
+        max_depth = self.max_depth or len(pieces) + 2
+
+        roots = self.ranked(placements(board))
+        best = roots[0] if roots else None
+        depth = 1
+        if roots:
+            for next_depth in range(2, max_depth + 1):
+                try:
+                    best = self.search_root(board, roots, pieces, next_depth)
+                except SearchTimeout:
+                    break
+                depth = next_depth
+
+        elapsed = self.clock() - start
+        self.stats = {
+            'depth': depth,
+            'nodes': self.nodes,
+            'seconds': elapsed,
+            'nodes_per_sec': self.nodes / elapsed if elapsed else 0.0,
+            'cache_entries': len(self.table),
+            'cache_hits': self.table.hits,
+        }
+        return best
+
+    # Search
+
+    def check_time(self):
+        if self.deadline is not None and self.clock() > self.deadline:
+            raise SearchTimeout
+
+    # placements best first by evaluate(). We count every placement we score
+    def ranked(self, candidates):
+        self.nodes += len(candidates)
+        return sorted(candidates, key=lambda placement: evaluate(placement, self.weights), reverse=True)
+
+    # a line of play tops out when the piece stays in the top row, it can only
+    # get out of it when it clears a line under it
+    def tops_out(self, placement):
+        return placement.row == 0 and placement.lines == 0
+
+    # the board after placement, with its lines cleared
+    def child(self, board, placement):
+        child = board.clone()
+        child.piece = ActivePiece(board.piece.kind, placement.rotation, placement.row, placement.col)
+        child.lock()
+        child.clear_lines()
+        return child
+
+    # the root placement with the best value depth pieces deep
+    def search_root(self, board, roots, pieces, depth):
+        best = None
+        best_value = None
+        for placement in roots[:self.beam_width]:
+            value = self.root_value(board, placement, pieces, depth)
+            if best_value is None or value > best_value:
+                best, best_value = placement, value
+        return best
+
+    # the value of one root placement depth pieces deep
+    def root_value(self, board, placement, pieces, depth):
+        if self.tops_out(placement):
+            return LOSS
+        return (self.weights['lines'] * placement.lines
+                + self.value(self.child(board, placement), pieces, depth - 1))
+
+    # the value of a board with no piece in play, depth pieces deep. The next
+    # piece is pieces[0], or any of the 7 when we have run out of preview
+    def value(self, board, pieces, depth):
+        key = (board.zobrist_hash(), tuple(pieces[:depth]), depth)
+        value = self.table.get(key)
+        if value is not None:
+            return value
+        if pieces:
+            value = self.best_value(board, pieces[0], pieces[1:], depth)
+        else:
+            value = sum(self.best_value(board, kind, (), depth) for kind in PIECE_KINDS) / len(PIECE_KINDS)
+        self.table.put(key, value)
+        return value
+
+    # the value of our best placement of kind on board
+    def best_value(self, board, kind, rest, depth):
+        self.check_time()
+        if not board.spawn(kind):
+            return LOSS
+        candidates = self.ranked(placements(board))
+        if not candidates:
+            return LOSS
+        if depth == 1:
+            best = candidates[0]
+            return LOSS if self.tops_out(best) else evaluate(best, self.weights)
+        best_value = LOSS
+        for placement in candidates[:self.beam_width]:
+            if self.tops_out(placement):
+                continue
+            value = (self.weights['lines'] * placement.lines
+                     + self.value(self.child(board, placement), rest, depth - 1))
+            if value > best_value:
+                best_value = value
+        return best_value
+
+
+# Shared board
+# the workers read the board we plan on from a block of shared memory instead
+# of having it pickled to every one of them. The block holds
+#
+#   sequence  columns  rows  kind  rotation  row  col  piece count    (header)
+#   the piece count upcoming pieces, one byte each                    (MAX_PIECES bytes)
+#   every locked row as (columns + 7) // 8 little endian bytes
+#
+# sequence works as a seqlock: it is odd while we write the block and goes up
+# by one again when we are done. A worker copies the block and only uses the
+# copy when sequence was the same even number before and after, and matches
+# the board its task was meant for
+HEADER = struct.Struct('<IHHbbHHB')
+MAX_PIECES = 32
+
+
+class SharedBoard:
+    def __init__(self, columns, rows, name=None):
+        self.columns = columns
+        self.rows = rows
+        self.row_bytes = (columns + 7) // 8
+        size = HEADER.size + MAX_PIECES + rows * self.row_bytes
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.sequence = 0
+
+    # write a board and the pieces after its piece, and give back the sequence
+    # number a worker has to see to read them
+    def write(self, board, pieces):
+        buffer = self.memory.buf
+        self.sequence += 1
+        HEADER.pack_into(buffer, 0, self.sequence, 0, 0, 0, 0, 0, 0, 0)
+        piece = board.piece
+        pieces = list(pieces)[:MAX_PIECES]
+        start = HEADER.size + MAX_PIECES
+        rows = b''.join(mask.to_bytes(self.row_bytes, 'little') for mask in board.locked)
+        buffer[HEADER.size:HEADER.size + len(pieces)] = bytes(pieces)
+        buffer[start:start + len(rows)] = rows
+        self.sequence += 1
+        HEADER.pack_into(buffer, 0, self.sequence, self.columns, self.rows, piece.kind, piece.rotation,
+                         piece.row, piece.col, len(pieces))
+        return self.sequence
+
+    # the board and pieces written with sequence, or None when they have
+    # been written over since
+    def read(self, sequence):
+        data = bytes(self.memory.buf)
+        if HEADER.unpack_from(self.memory.buf, 0)[0] != sequence:
+            return None
+        written, columns, rows, kind, rotation, row, col, count = HEADER.unpack_from(data, 0)
+        if written != sequence:
+            return None
+        board = Bitboard(columns, rows)
+        start = HEADER.size + MAX_PIECES
+        width = self.row_bytes
+        board.locked = [int.from_bytes(data[start + i * width:start + (i + 1) * width], 'little')
+                        for i in range(rows)]
+        board.rebuild_heights()
+        board.piece = ActivePiece(kind, rotation, row, col)
+        return board, list(data[HEADER.size:HEADER.size + count])
+
+    def close(self):
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
+
+
+# every worker process keeps its shared board and its own Planner, with its own
+# transposition table, for as long as the pool lives
+worker = {}
+
+
+def start_worker(name, columns, rows, beam_width, cache_size, weights):
+    worker['board'] = SharedBoard(columns, rows, name)
+    planner = Planner(beam_width, None, None, cache_size, weights)
+    planner.clock = time.monotonic
+    worker['planner'] = planner
+
+
+# a placement of the piece in play, from its (rotation, col, row, lines)
+def placement_from(rotation, col, row, lines):
+    placement = Placement(rotation, col, row, 0, col)
+    placement.lines = lines
+    return placement
+
+
+# value the subtree under a root placement, given as (rotation, col, row,
+# lines), and a placement of the next piece after it, given as (kind,
+# rotation, col, row, lines): the board after both, depth pieces deep. We give
+# back the value, the placements we scored and our transposition table hits,
+# or None when the deadline passed or the board was already written over
+def search_subtree(task):
+    sequence, root, second, depth, deadline = task
+    shared = worker['board'].read(sequence)
+    if shared is None:
+        return None
+    board, pieces = shared
+    planner = worker['planner']
+    planner.deadline = deadline
+    planner.nodes = 0
+    hits = planner.table.hits
+    kind, *pose = second
+    try:
+        child = planner.child(board, placement_from(*root))
+        child.spawn(kind)
+        value = planner.value(planner.child(child, placement_from(*pose)), pieces[1:], depth)
+    except SearchTimeout:
+        return None
+    return value, planner.nodes, planner.table.hits - hits
+
+
+# Parallel planner
+# the same search as Planner, but once the depth gets to parallel_depth the
+# workers of a process pool search it. A root placement only has a beam_width
+# of placements, too few to keep many cores busy, so we go one piece further
+# here: we place the next piece after every root placement, best first like
+# best_value() does, and hand out every one of those subtrees, around 36 with
+# a preview and 7 times as many without one. The values come back to us and we
+# put them together like value() and best_value() would have.
+#
+# Shallower depths are over too quickly to be worth handing out, so we search
+# them here like Planner does. The workers get the same deadline as we do, on
+# time.monotonic() which every process shares, and we stop waiting for them at
+# the deadline ourselves, so a move never runs over its budget by more than it
+# takes us to notice. A depth only counts when every subtree came back before
+# it. The tasks go out in one map_async() call, in one chunk per worker, so
+# handing them out costs a message per worker rather than per task
+#
+# stats adds the placements the workers scored to nodes and their table hits
+# to cache_hits.
+#
+# The pool and the shared memory are made on the first plan(), before its time
+# starts, and freed by close(), or by using the planner in a with statement
+class ParallelPlanner(Planner):
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, beam_width=6, time_budget=0.005, max_depth=None, cache_size=100000,
+                 weights=WEIGHTS, workers=None, parallel_depth=3):
+        super().__init__(beam_width, time_budget, max_depth, cache_size, weights)
+        self.workers = workers or os.cpu_count()
+        # we hand out the subtrees two pieces below the root, so the depths
+        # before 3 are always ours
+        self.parallel_depth = max(parallel_depth, 3)
+        self.pool = None
+        self.shared = None
+        # the table hits of every worker over every plan()
+        self.worker_hits = 0
+
+    def start(self, columns, rows):
+        self.close()
+        self.shared = SharedBoard(columns, rows)
+        self.pool = multiprocessing.Pool(
+            self.workers, start_worker,
+            (self.shared.name, columns, rows, self.beam_width, self.table.size, self.weights),
+        )
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        if self.shared is not None:
+            self.shared.close()
+            self.shared.unlink()
+            self.shared = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def plan(self, engine):
+        self.sequence = None
+        board = engine.board
+        if self.workers > 1 and (self.shared is None
+                                 or (self.shared.columns, self.shared.rows) != (board.columns, board.rows)):
+            self.start(board.columns, board.rows)
+        best = super().plan(engine)
+        if best is not None:
+            self.stats['cache_hits'] += self.worker_hits
+        return best
+
+    def search_root(self, board, roots, pieces, depth):
+        if depth < self.parallel_depth or self.workers <= 1:
+            return super().search_root(board, roots, pieces, depth)
+        # the board only has to be written once per move
+        if self.sequence is None:
+            self.sequence = self.shared.write(board, pieces)
+
+        # for every root placement, the value of its board when our table has
+        # it, or else for every kind the next piece can be, the lines and the
+        # task of each placement of it we search on
+        beam = roots[:self.beam_width]
+        kinds = pieces[:1] or PIECE_KINDS
+        known = {}
+        keys = {}
+        options = {}
+        tasks = []
+        for index, placement in enumerate(beam):
+            self.check_time()
+            if self.tops_out(placement):
+                continue
+            child = self.child(board, placement)
+            key = keys[index] = (child.zobrist_hash(), tuple(pieces[:depth - 1]), depth - 1)
+            value = self.table.get(key)
+            if value is not None:
+                known[index] = value
+                continue
+            root = (placement.rotation, placement.col, placement.row, placement.lines)
+            for kind in kinds:
+                found = options[index, kind] = []
+                if not child.spawn(kind):
+                    continue
+                for second in self.ranked(placements(child))[:self.beam_width]:
+                    if self.tops_out(second):
+                        continue
+                    found.append((second.lines, len(tasks)))
+                    tasks.append((self.sequence, root,
+                                  (kind, second.rotation, second.col, second.row, second.lines),
+                                  depth - 2, self.deadline))
+
+        results = []
+        if tasks:
+            chunk = -(-len(tasks) // self.workers)
+            batch = self.pool.map_async(search_subtree, tasks, chunk)
+            try:
+                if self.deadline is None:
+                    results = batch.get()
+                else:
+                    results = batch.get(max(self.deadline - self.clock(), 0))
+            except multiprocessing.TimeoutError:
+                raise SearchTimeout
+            if any(result is None for result in results):
+                raise SearchTimeout
+            for _, nodes, hits in results:
+                self.nodes += nodes
+                self.worker_hits += hits
+        self.check_time()
+
+        best = None
+        best_value = None
+        lines = self.weights['lines']
+        for index, placement in enumerate(beam):
+            if self.tops_out(placement):
+                value = LOSS
+            else:
+                if index not in known:
+                    # best_value() of every kind, and their mean like value()
+                    # takes when we don't know the next piece
+                    values = []
+                    for kind in kinds:
+                        kind_value = LOSS
+                        for second_lines, task in options[index, kind]:
+                            kind_value = max(kind_value, lines * second_lines + results[task][0])
+                        values.append(kind_value)
+                    known[index] = sum(values) / len(values)
+                    self.table.put(keys[index], known[index])
+                value = lines * placement.lines + known[index]
+            if best_value is None or value > best_value:
+                best, best_value = placement, value
+        return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play a game with the lookahead planner and report its speed.')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the pieces')
+    parser.add_argument('--pieces', type=int, default=200, help='stop after this many pieces')
+    parser.add_argument('--budget', type=float, default=0.005, help='seconds per move')
+    parser.add_argument('--beam', type=int, default=6, help='placements searched on at every level')
+    parser.add_argument('--preview', type=int, default=5, help='pieces in the preview queue')
+    parser.add_argument('--workers', type=int, default=1, help='search the root placements on this many processes')
+    args = parser.parse_args(argv)
+
+    engine = TetrisEngine(args.seed, preview=args.preview)
+    if args.workers > 1:
+        planner = ParallelPlanner(args.beam, args.budget, workers=args.workers)
+        planner.start(engine.columns, engine.rows)
+    else:
+        planner = Planner(args.beam, args.budget)
+    depths = []
+    nodes = 0
+    seconds = 0.0
+    while not engine.game_over and engine.pieces <= args.pieces:
+        placement = planner.plan(engine)
+        depths.append(planner.stats['depth'])
+        nodes += planner.stats['nodes']
+        seconds += planner.stats['seconds']
+        for action in placement.actions() if placement else []:
+            engine.step(action)
+            if engine.game_over:
+                break
+    if args.workers > 1:
+        planner.close()
+    moves = len(depths)
+    print(f'{moves} moves, score {engine.score}, {engine.lines} lines, game over: {engine.game_over}')
+    if moves:
+        print(f'mean depth {sum(depths) / moves:.2f}, mean {1000 * seconds / moves:.2f} ms per move, '
+              f'{nodes / seconds:,.0f} nodes/s, {planner.stats["cache_hits"]:,} cache hits')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+# Policies
+#
+# A policy decides which action to take in a headless game. Every policy is a
+# class that is made with a seed, so the same game seed always plays the same
+# game, and has an act(engine) method that gives back the next action.
+#
+# POLICIES maps the names we use on the command line to the policy classes
+import random
+
+from tetris.ai import best_placement
+from tetris.engine import ACTIONS, DOWN, HARD_DROP
+from tetris.planner import Planner
+
+
+# presses a random key every time
+class RandomPolicy:
+    def __init__(self, seed=None):
+        self.random = random.Random(seed)
+
+    def act(self, engine):
+        return self.random.choice(ACTIONS)
+
+
+# never moves or rotates, only drops every piece straight down
+class DropPolicy:
+    def __init__(self, seed=None):
+        pass
+
+    def act(self, engine):
+        return DOWN
+
+
+# picks the best placement for every new piece with best_placement() and then
+# plays the actions that get the piece there
+class HeuristicPolicy:
+    def __init__(self, seed=None):
+        self.piece = None
+        self.plan = []
+
+    def act(self, engine):
+        # engine.pieces counts the pieces spawned so far, so it changes for
+        # every new piece
+        if self.piece != engine.pieces:
+            self.piece = engine.pieces
+            placement = best_placement(engine.board)
+            self.plan = placement.actions() if placement else []
+            self.plan.reverse()
+        # if gravity got in the way and the plan ran out, we just drop the piece
+        return self.plan.pop() if self.plan else HARD_DROP
+
+
+# like HeuristicPolicy, but the placement comes from the lookahead Planner.
+# The planner searches as deep as its time budget allows, so on a slower
+# machine the same seed can play a different game. Give it time_budget=None
+# and a max_depth to make it play the same game everywhere
+class PlannerPolicy(HeuristicPolicy):
+    def __init__(self, seed=None, **planner_options):
+        super().__init__(seed)
+        self.planner = Planner(**planner_options)
+
+    def act(self, engine):
+        if self.piece != engine.pieces:
+            self.piece = engine.pieces
+            placement = self.planner.plan(engine)
+            self.plan = placement.actions() if placement else []
+            self.plan.reverse()
+        return self.plan.pop() if self.plan else HARD_DROP
+
+
+POLICIES = {
+    'random': RandomPolicy,
+    'drop': DropPolicy,
+    'heuristic': HeuristicPolicy,
+    'planner': PlannerPolicy,
+}
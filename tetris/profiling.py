@@ -0,0 +1,194 @@
+# Frame profiler
+#
+# When a game stutters we want to know which part of the frame took the time.
+# game_loop() splits every frame into phases and the FrameProfiler times them:
+#
+#   input:   reading the pygame events and putting the key presses and
+#            releases into the InputBuffer, see tetris/input.py
+#   update:  the fixed simulation ticks: the key presses and held key repeats
+#            the buffer gives out, autoplay moves and gravity ticks, with
+#            their locks and line clears
+#   render:  building the grid and drawing the changed cells
+#   present: pushing the changed rectangles to the screen
+#
+# The time spent waiting in clock.tick() for the next frame is not a phase, so
+# the phases of a frame add up to the work we did in it.
+#
+# Timings go into ring buffers that hold the last capacity frames, so a long
+# game never uses more memory. From them we work out means, percentiles and a
+# histogram of every phase, and we can export them as JSON or as a Chrome
+# trace that chrome://tracing and Perfetto can open. Next to the timings we
+# count how many moves, rotations, hard drops, gravity ticks, locks and cleared
+# lines the frames saw.
+#
+# Profiling is off unless game_loop() is started with profile=True, the
+# --profile flag or the TETRIS_PROFILE environment variable. When it is off
+# there is no profiler at all and game_loop() only checks for None
+import json
+import os
+from array import array
+from time import perf_counter
+
+from tetris.engine import DOWN, HARD_DROP, LEFT, RIGHT, ROTATE
+
+PHASES = ('input', 'update', 'render', 'present')
+COUNTERS = ('moves', 'rotations', 'hard_drops', 'ticks', 'locks', 'lines')
+ACTION_COUNTERS = {LEFT: 'moves', RIGHT: 'moves', DOWN: 'moves', ROTATE: 'rotations', HARD_DROP: 'hard_drops'}
+
+# upper edges of the histogram buckets in milliseconds, the last bucket holds
+# everything slower
+HISTOGRAM_EDGES = (0.25, 0.5, 1, 2, 4, 8, 16, 33, 66)
+
+
+# TETRIS_PROFILE=1 turns profiling on, 0 or an empty value leaves it off
+def profiling_requested(environ=os.environ):
+    return environ.get('TETRIS_PROFILE', '') not in ('', '0')
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class FrameProfiler:
+    def __init__(self, capacity=600, clock=perf_counter):
+        self.capacity = capacity
+        self.clock = clock
+        # for every phase, the second it started and how long it took, for
+        # the last capacity frames. Slot frame % capacity is the frame's
+        self.starts = {phase: array('d', bytes(8 * capacity)) for phase in PHASES}
+        self.durations = {phase: array('d', bytes(8 * capacity)) for phase in PHASES}
+        self.frames = 0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.origin = clock()
+        self.last = self.origin
+        # the engine's piece and line counts the last time we looked
+        self.pieces = None
+        self.lines = 0
+        self.game_over = False
+
+    # Recording
+    # game_loop() calls start_frame() at the top of every frame and lap()
+    # at the end of every phase
+
+    def start_frame(self):
+        self.last = self.clock()
+
+    def lap(self, phase):
+        now = self.clock()
+        slot = self.frames % self.capacity
+        self.starts[phase][slot] = self.last - self.origin
+        self.durations[phase][slot] = now - self.last
+        self.last = now
+
+    def end_frame(self):
+        self.frames += 1
+
+    def count(self, counter, amount=1):
+        self.counters[counter] += amount
+
+    # count an action we passed to the engine, NOOP isn't counted
+    def action(self, action):
+        counter = ACTION_COUNTERS.get(action)
+        if counter:
+            self.counters[counter] += 1
+
+    # count the locks and lines since we last looked at engine. Every lock
+    # spawns a new piece, except the one that ends the game
+    def observe(self, engine):
+        if self.pieces is not None:
+            self.counters['locks'] += engine.pieces - self.pieces
+            if engine.game_over and not self.game_over:
+                self.counters['locks'] += 1
+            self.counters['lines'] += engine.lines - self.lines
+        self.pieces = engine.pieces
+        self.lines = engine.lines
+        self.game_over = engine.game_over
+
+    # Reading
+
+    # the durations of a phase we still hold, oldest first, in milliseconds
+    def samples(self, phase):
+        held = min(self.frames, self.capacity)
+        durations = self.durations[phase]
+        first = self.frames - held
+        return [durations[(first + i) % self.capacity] * 1000 for i in range(held)]
+
+    # the durations of whole frames, all phases added up, in milliseconds
+    def frame_samples(self):
+        return [sum(times) for times in zip(*(self.samples(phase) for phase in PHASES))]
+
+    def histogram(self, samples):
+        counts = [0] * (len(HISTOGRAM_EDGES) + 1)
+        for sample in samples:
+            bucket = 0
+            while bucket < len(HISTOGRAM_EDGES) and sample > HISTOGRAM_EDGES[bucket]:
+                bucket += 1
+            counts[bucket] += 1
+        labels = [f'<={edge}ms' for edge in HISTOGRAM_EDGES] + [f'>{HISTOGRAM_EDGES[-1]}ms']
+        return dict(zip(labels, counts))
+
+    def describe(self, samples):
+        ordered = sorted(samples)
+        return {
+            'mean_ms': sum(ordered) / len(ordered) if ordered else 0.0,
+            'p50_ms': percentile(ordered, 0.5),
+            'p95_ms': percentile(ordered, 0.95),
+            'p99_ms': percentile(ordered, 0.99),
+            'max_ms': ordered[-1] if ordered else 0.0,
+            'histogram': self.histogram(ordered),
+        }
+
+    def summary(self):
+        return {
+            'frames': self.frames,
+            'frames_held': min(self.frames, self.capacity),
+            'frame': self.describe(self.frame_samples()),
+            'phases': {phase: self.describe(self.samples(phase)) for phase in PHASES},
+            'counters': dict(self.counters),
+        }
+
+    # Export
+
+    def export_json(self, path):
+        with open(path, 'w') as stream:
+            json.dump(self.summary(), stream, indent=2)
+
+    # every phase of the frames we hold is a complete event ('X') in
+    # microseconds on one thread, so a trace viewer shows every frame as a row
+    # of blocks. The counters are added as one counter event at the end
+    def chrome_trace(self):
+        events = []
+        held = min(self.frames, self.capacity)
+        first = self.frames - held
+        for frame in range(first, self.frames):
+            slot = frame % self.capacity
+            for phase in PHASES:
+                events.append({
+                    'name': phase, 'cat': 'frame', 'ph': 'X', 'pid': 1, 'tid': 1,
+                    'ts': self.starts[phase][slot] * 1e6,
+                    'dur': self.durations[phase][slot] * 1e6,
+                    'args': {'frame': frame},
+                })
+        end = (self.last - self.origin) * 1e6
+        events.append({'name': 'counters', 'ph': 'C', 'pid': 1, 'tid': 1, 'ts': end,
+                       'args': dict(self.counters)})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, path):
+        with open(path, 'w') as stream:
+            json.dump(self.chrome_trace(), stream)
+
+    # a few short lines for the on screen overlay
+    def overlay_lines(self):
+        frame = self.describe(self.frame_samples())
+        lines = [f"frame {frame['mean_ms']:.2f} ms  p95 {frame['p95_ms']:.2f}  max {frame['max_ms']:.2f}"]
+        for phase in PHASES:
+            samples = self.samples(phase)
+            mean = sum(samples) / len(samples) if samples else 0.0
+            lines.append(f'{phase:8} {mean:.3f} ms')
+        counters = self.counters
+        lines.append(f"moves {counters['moves']} rot {counters['rotations']} drops {counters['hard_drops']}")
+        lines.append(f"locks {counters['locks']} lines {counters['lines']} ticks {counters['ticks']}")
+        return lines
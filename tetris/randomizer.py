@@ -0,0 +1,177 @@
+# Piece randomizers
+#
+# Every game draws its pieces from a PieceQueue. The queue owns
+#
+#   - a PieceRandom, a small xorshift64* random number generator whose whole
+#     state is one 64 bit integer, so a game can be saved and picked up again
+#     with the exact same pieces to come
+#   - a randomizer that decides which piece comes next:
+#       uniform: every piece is equally likely every time, like random_piece()
+#       bag:     the 7 pieces are shuffled into a bag and dealt one by one, so
+#                we never wait more than 12 pieces for an I piece
+#       history: the TGM randomizer. We remember the last 4 pieces and reroll
+#                up to 4 times when we draw one of them
+#   - the upcoming pieces we show in the next piece panel
+#
+# The pieces only depend on the seed and the randomizer, not on how many
+# pieces we preview, so the same seed gives the same pieces in the game window,
+# the headless engine and BatchTetris.
+#
+# Pieces are their numbers in ROTATIONS, the shapes themselves are the tuples
+# in tetris/pieces.py that are built once and shared by every game
+import random
+from collections import deque
+
+from tetris.pieces import PIECE_KINDS, PIECE_NAMES
+
+MASK_64 = (1 << 64) - 1
+
+I, O, S, Z = (PIECE_NAMES.index(name) for name in 'IOSZ')
+
+
+class PieceRandom:
+    __slots__ = ('state',)
+
+    def __init__(self, seed=None):
+        self.seed(seed)
+
+    # we mix the seed with splitmix64 so seeds that are close together, like
+    # the game numbers of a self-play run, still start far apart. Without a
+    # seed we pick one at random. A NumPy integer seed is made a Python int
+    # first, splitmix64 needs more than 64 signed bits on the way
+    def seed(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(64)
+        seed = int(seed)
+        value = (seed + 0x9E3779B97F4A7C15) & MASK_64
+        value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+        value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK_64
+        value ^= value >> 31
+        # xorshift never leaves a state of 0, so we can't start there
+        self.state = value or 1
+
+    def next(self):
+        x = self.state
+        x ^= x >> 12
+        x ^= (x << 25) & MASK_64
+        x ^= x >> 27
+        self.state = x
+        return (x * 0x2545F4914F6CDD1D) & MASK_64
+
+    # a number from 0 to n - 1. We scale the top 32 bits instead of taking a
+    # remainder, for the 7 pieces that is off from uniform by less than 1 in 2^29
+    def below(self, n):
+        return ((self.next() >> 32) * n) >> 32
+
+    # Fisher-Yates shuffle in place
+    def shuffle(self, items):
+        for i in range(len(items) - 1, 0, -1):
+            j = self.below(i + 1)
+            items[i], items[j] = items[j], items[i]
+
+
+# every randomizer has next_kind(), and getstate() and setstate() for the
+# pieces it remembers. The random number generator is saved by the queue
+class UniformRandomizer:
+    def __init__(self, rng):
+        self.rng = rng
+
+    def next_kind(self):
+        return self.rng.below(len(PIECE_KINDS))
+
+    def getstate(self):
+        return ()
+
+    def setstate(self, state):
+        pass
+
+
+class BagRandomizer:
+    def __init__(self, rng):
+        self.rng = rng
+        # the pieces left in the bag, dealt from the end
+        self.bag = []
+
+    def next_kind(self):
+        if not self.bag:
+            self.bag = list(PIECE_KINDS)
+            self.rng.shuffle(self.bag)
+        return self.bag.pop()
+
+    def getstate(self):
+        return tuple(self.bag)
+
+    def setstate(self, state):
+        self.bag = list(state)
+
+
+# like TGM we start with a history of Z pieces and never deal an S, Z or O as
+# the first piece, because those can't be placed without leaving a hole
+class HistoryRandomizer:
+    HISTORY = 4
+    TRIES = 4
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.history = deque([Z] * self.HISTORY, maxlen=self.HISTORY)
+        self.first = True
+
+    def next_kind(self):
+        if self.first:
+            self.first = False
+            kind = self.rng.below(len(PIECE_KINDS))
+            while kind in (S, Z, O):
+                kind = self.rng.below(len(PIECE_KINDS))
+        else:
+            for _ in range(self.TRIES):
+                kind = self.rng.below(len(PIECE_KINDS))
+                if kind not in self.history:
+                    break
+        self.history.append(kind)
+        return kind
+
+    def getstate(self):
+        return (int(self.first),) + tuple(self.history)
+
+    def setstate(self, state):
+        self.first = bool(state[0])
+        self.history = deque(state[1:], maxlen=self.HISTORY)
+
+
+RANDOMIZERS = {
+    'uniform': UniformRandomizer,
+    'bag': BagRandomizer,
+    'history': HistoryRandomizer,
+}
+
+
+# the pieces of one game. next() deals the next piece and upcoming holds the
+# preview pieces after it, the first one is dealt next
+class PieceQueue:
+    def __init__(self, seed=None, randomizer='bag', preview=5):
+        if randomizer not in RANDOMIZERS:
+            raise ValueError(f'unknown randomizer {randomizer!r}')
+        self.name = randomizer
+        self.random = PieceRandom(seed)
+        self.randomizer = RANDOMIZERS[randomizer](self.random)
+        self.upcoming = deque(self.randomizer.next_kind() for _ in range(preview))
+
+    def next(self):
+        if not self.upcoming:
+            return self.randomizer.next_kind()
+        kind = self.upcoming.popleft()
+        self.upcoming.append(self.randomizer.next_kind())
+        return kind
+
+    # everything we need to deal the same pieces again, as a tuple of ints
+    # (random state, upcoming pieces, randomizer state) with the upcoming
+    # pieces led by how many there are
+    def getstate(self):
+        return ((self.random.state, len(self.upcoming)) + tuple(self.upcoming)
+                + self.randomizer.getstate())
+
+    def setstate(self, state):
+        self.random.state = state[0]
+        count = state[1]
+        self.upcoming = deque(state[2:2 + count])
+        self.randomizer.setstate(state[2 + count:])
@@ -0,0 +1,181 @@
+# Replays
+#
+# A replay holds everything we need to play a game again exactly: the seed and
+# randomizer the pieces came from, the board size and every action with the
+# frame it happened on. Gravity ticks are stored as actions too, so it doesn't matter how fast the
+# original game ran, playing the replay back on a TetrisEngine always ends on
+# the same board. We also store the final score and board digest so a replay
+# can be checked against the game it came from.
+#
+# Every replay is stored as one record:
+#
+#   b'TRPL'  version  varint body length  body
+#
+# and the body is made of varints:
+#
+#   seed  columns  rows  randomizer  event count  events...  final score  8 byte digest
+#
+# where randomizer is the position of its name in RANDOMIZER_NAMES. Version 1
+# replays were dealt by random.Random and can't be played anymore
+#
+# Every event is a single varint holding the frames since the previous event
+# shifted up 3 bits, with the action in the low 3 bits. Most events happen
+# within a few frames of each other so they take one byte.
+#
+# Records can simply be appended to one archive file. read_replays() reads an
+# archive one record at a time, so checking an archive of any size only ever
+# holds one game in memory:
+#
+#   python -m tetris.replay tournament.trp
+import argparse
+import sys
+import time
+
+from tetris.engine import TetrisEngine
+from tetris.varint import decode_varint, encode_varint, read_varint
+
+MAGIC = b'TRPL'
+VERSION = 2
+RANDOMIZER_NAMES = ('uniform', 'bag', 'history')
+
+# the action code we store for a gravity tick, engine actions use the codes below it
+TICK = 7
+ACTION_BITS = 3
+
+
+class Replay:
+    def __init__(self, seed, columns, rows, events=None, score=0, digest=bytes(8), randomizer='bag'):
+        self.seed = seed
+        self.columns = columns
+        self.rows = rows
+        self.randomizer = randomizer
+        # (frame, action) pairs in the order they happened
+        self.events = events if events is not None else []
+        self.score = score
+        self.digest = digest
+
+
+# Recorder
+# game_loop() tells the recorder about every action and gravity tick with the
+# frame it happened on, and finish() stores the final score and board digest
+class ReplayRecorder:
+    def __init__(self, engine):
+        if engine.seed is None:
+            raise ValueError('only games started with a seed can be replayed')
+        self.engine = engine
+        self.replay = Replay(engine.seed, engine.columns, engine.rows, randomizer=engine.randomizer)
+
+    def record(self, frame, action):
+        self.replay.events.append((frame, action))
+
+    def tick(self, frame):
+        self.replay.events.append((frame, TICK))
+
+    def finish(self):
+        self.replay.score = self.engine.score
+        self.replay.digest = self.engine.board.digest()
+        return self.replay
+
+    # finish the replay and append it to the archive at path
+    def save(self, path):
+        with open(path, 'ab') as stream:
+            stream.write(encode_replay(self.finish()))
+
+
+def encode_replay(replay):
+    body = bytearray()
+    randomizer = RANDOMIZER_NAMES.index(replay.randomizer)
+    for value in (replay.seed, replay.columns, replay.rows, randomizer, len(replay.events)):
+        encode_varint(value, body)
+    last_frame = 0
+    for frame, action in replay.events:
+        encode_varint((frame - last_frame) << ACTION_BITS | action, body)
+        last_frame = frame
+    encode_varint(replay.score, body)
+    body += replay.digest
+
+    record = bytearray(MAGIC)
+    record.append(VERSION)
+    encode_varint(len(body), record)
+    return bytes(record + body)
+
+
+def decode_replay_body(body):
+    seed, pos = decode_varint(body, 0)
+    columns, pos = decode_varint(body, pos)
+    rows, pos = decode_varint(body, pos)
+    randomizer, pos = decode_varint(body, pos)
+    if randomizer >= len(RANDOMIZER_NAMES):
+        raise ValueError(f'unknown randomizer {randomizer}')
+    count, pos = decode_varint(body, pos)
+    events = []
+    frame = 0
+    action_mask = (1 << ACTION_BITS) - 1
+    for _ in range(count):
+        value, pos = decode_varint(body, pos)
+        frame += value >> ACTION_BITS
+        events.append((frame, value & action_mask))
+    score, pos = decode_varint(body, pos)
+    digest = bytes(body[pos:pos + 8])
+    if len(digest) != 8:
+        raise ValueError('truncated replay')
+    return Replay(seed, columns, rows, events, score, digest, RANDOMIZER_NAMES[randomizer])
+
+
+# we read the replays in an archive one at a time
+def read_replays(stream):
+    while True:
+        header = stream.read(len(MAGIC) + 1)
+        if not header:
+            return
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError('not a replay record')
+        if header[len(MAGIC)] != VERSION:
+            raise ValueError(f'unsupported replay version {header[len(MAGIC)]}')
+        length = read_varint(stream)
+        if length is None:
+            raise ValueError('truncated replay')
+        body = stream.read(length)
+        if len(body) != length:
+            raise ValueError('truncated replay')
+        yield decode_replay_body(body)
+
+
+# play a replay on a new engine as fast as we can and give back the engine
+def play_replay(replay):
+    engine = TetrisEngine(replay.seed, replay.columns, replay.rows, replay.randomizer)
+    for _, action in replay.events:
+        if action == TICK:
+            engine.tick()
+        else:
+            engine.step(action)
+    return engine
+
+
+# check that playing a replay ends with the score and board it recorded
+def verify_replay(replay):
+    engine = play_replay(replay)
+    return engine.score == replay.score and engine.board.digest() == replay.digest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check replay archives.')
+    parser.add_argument('archives', nargs='+', help='replay archive files')
+    args = parser.parse_args(argv)
+
+    checked = failed = 0
+    start = time.perf_counter()
+    for path in args.archives:
+        with open(path, 'rb') as stream:
+            for index, replay in enumerate(read_replays(stream)):
+                checked += 1
+                if not verify_replay(replay):
+                    failed += 1
+                    print(f'{path}: replay {index} (seed {replay.seed}) does not match')
+    elapsed = time.perf_counter() - start
+    print(f'{checked} replays checked, {failed} failed in {elapsed:.2f}s')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
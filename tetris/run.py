@@ -0,0 +1,155 @@
+# Self-play runner
+#
+# Plays many headless games with a policy on every core we have and writes one
+# CSV row per game:
+#
+#   python -m tetris.run --games 100000 --workers 8 --policy random --out results.csv
+#
+# Game i is played with seed --seed + i, so every game can be played again on its
+# own. The games are handed to the workers in chunks and every finished chunk is
+# written and flushed straight away, so if the run is stopped we can start the
+# same command again and it only plays the games that are not in the CSV yet.
+# Every row also holds the settings its game was played with, and we refuse to
+# add games to a CSV that was written with other settings, so the games in one
+# file can always be compared. At the end we print the average, lowest and highest of every column over all
+# the games in the file.
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+
+from tetris.engine import TetrisEngine
+from tetris.policies import POLICIES
+from tetris.randomizer import RANDOMIZERS
+
+# what a game did, and the settings of the run that played it
+STATS = ['score', 'lines', 'pieces', 'ticks', 'moves']
+SETTINGS = ['policy', 'moves_per_tick', 'max_pieces', 'randomizer']
+FIELDS = ['seed'] + STATS + SETTINGS
+
+
+# play one game and give back its seed and STATS
+#   lines:  lines cleared with clear_lines()
+#   pieces: pieces that were placed on the board
+#   ticks:  gravity ticks the game survived
+#   moves:  actions the policy made
+# the policy gets moves_per_tick actions between every gravity tick, and we stop
+# a game that places max_pieces pieces so a strong policy can't run forever
+def play_game(seed, policy_name, moves_per_tick=4, max_pieces=10000, randomizer='bag'):
+    engine = TetrisEngine(seed, randomizer=randomizer)
+    policy = POLICIES[policy_name](seed)
+    moves = 0
+    while not engine.game_over and engine.pieces < max_pieces:
+        for _ in range(moves_per_tick):
+            engine.step(policy.act(engine))
+            moves += 1
+            # a move can lock our piece and spawn the next one, so we check
+            # the cap after every move and not only between ticks
+            if engine.game_over or engine.pieces >= max_pieces:
+                break
+        else:
+            engine.tick()
+    return [seed, engine.score, engine.lines, engine.pieces, engine.ticks, moves]
+
+
+# a chunk is a list of seeds together with the settings every game uses
+def play_chunk(chunk):
+    seeds, policy_name, moves_per_tick, max_pieces, randomizer = chunk
+    settings = [policy_name, moves_per_tick, max_pieces, randomizer]
+    return [play_game(seed, policy_name, moves_per_tick, max_pieces, randomizer) + settings
+            for seed in seeds]
+
+
+# we read the seeds that are already in our CSV so we can skip them. If the last
+# run was stopped in the middle of writing a row, we cut that row off. settings
+# holds the values of SETTINGS for this run, and we raise ValueError when the
+# CSV has games played with other settings, or doesn't say what they were
+def finished_seeds(path, settings):
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'rb+') as stream:
+        data = stream.read()
+        end = data.rfind(b'\n') + 1
+        if end != len(data):
+            stream.truncate(end)
+    expected = [str(value) for value in settings]
+    seeds = set()
+    with open(path, newline='') as stream:
+        reader = csv.DictReader(stream)
+        if reader.fieldnames is not None and reader.fieldnames != FIELDS:
+            raise ValueError(f'{path} has the columns {reader.fieldnames}, not {FIELDS}')
+        for row in reader:
+            found = [row[name] for name in SETTINGS]
+            if found != expected:
+                raise ValueError(f'{path} has games played with {dict(zip(SETTINGS, found))}, '
+                                 f'not {dict(zip(SETTINGS, expected))}')
+            seeds.add(int(row['seed']))
+    return seeds
+
+
+def summarize(path):
+    with open(path, newline='') as stream:
+        rows = [[int(row[field]) for field in STATS] for row in csv.DictReader(stream)]
+    print(f'{len(rows)} games in {path}')
+    if not rows:
+        return
+    for field, values in zip(STATS, zip(*rows)):
+        print(f'  {field:7} mean {sum(values) / len(values):10.1f}  min {min(values):8}  max {max(values):8}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play headless Tetris games on many cores.')
+    parser.add_argument('--games', type=int, default=1000, help='number of games to play')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='random')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first game')
+    parser.add_argument('--chunk-size', type=int, default=64, help='games handed to a worker at a time')
+    parser.add_argument('--moves-per-tick', type=int, default=4, help='policy actions between gravity ticks')
+    parser.add_argument('--max-pieces', type=int, default=10000, help='stop a game after this many pieces')
+    parser.add_argument('--randomizer', choices=sorted(RANDOMIZERS), default='bag', help='how pieces are dealt')
+    parser.add_argument('--out', default='results.csv', help='CSV file for the results')
+    args = parser.parse_args(argv)
+
+    try:
+        done = finished_seeds(args.out, [args.policy, args.moves_per_tick, args.max_pieces, args.randomizer])
+    except ValueError as error:
+        parser.error(f'{error}, use another --out to play with these settings')
+    seeds = [seed for seed in range(args.seed, args.seed + args.games) if seed not in done]
+    chunks = [
+        (seeds[i:i + args.chunk_size], args.policy, args.moves_per_tick, args.max_pieces, args.randomizer)
+        for i in range(0, len(seeds), args.chunk_size)
+    ]
+    if done:
+        print(f'resuming, {len(done)} games already played, {len(seeds)} to go')
+
+    start = time.perf_counter()
+    new_file = not os.path.exists(args.out) or os.path.getsize(args.out) == 0
+    with open(args.out, 'a', newline='') as stream:
+        writer = csv.writer(stream)
+        if new_file:
+            writer.writerow(FIELDS)
+        # with a single worker we play in this process and skip the pool
+        if args.workers <= 1:
+            results = map(play_chunk, chunks)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(args.workers)
+            results = pool.imap_unordered(play_chunk, chunks)
+        try:
+            for rows in results:
+                writer.writerows(rows)
+                stream.flush()
+        finally:
+            if pool:
+                pool.terminate()
+    elapsed = time.perf_counter() - start
+    if seeds:
+        print(f'played {len(seeds)} games in {elapsed:.2f}s ({len(seeds) / elapsed:.0f} games/s)')
+    summarize(args.out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
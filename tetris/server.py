@@ -0,0 +1,602 @@
+# Multiplayer server
+#
+# Head to head and battle royale games over TCP. The server is authoritative:
+# every player's TetrisEngine runs here, clients only send the actions of their
+# keys and draw the boards we send back. Many rooms share one asyncio event
+# loop. A single task ticks every room TICK_RATE times a second, so a thousand
+# rooms cost a thousand short function calls a tick and no task switches.
+#
+# Every player in a room gets the same seed, and so the same pieces. When a
+# player clears lines they attack a random opponent that is still in the game
+# with ATTACK garbage lines. Garbage waits until the target locks a piece
+# without clearing, and lines the target clears first cancel it, like the
+# modern games. The last player standing wins.
+#
+# The protocol is small. A client sends
+#
+#   hello:   varint room number, varint players in the room, or 0 to watch
+#            the room instead of playing in it
+#   actions: one byte each, the action numbers of tetris/engine.py. Actions
+#            sent before START are ignored, and a client with more than
+#            MAX_INPUTS actions waiting for a tick is disconnected
+#
+# and every message from the server is a varint length followed by a body
+# that starts with its type:
+#
+#   START    seat, players, columns, rows. Spectators get the seat players
+#   UPDATE   tick, then the seat and a frame of the state stream for every
+#            board that changed this tick, see tetris/stream.py. The first
+#            frame of every board is a keyframe
+#   END      seat of the winner + 1, 0 when nobody won
+#   FULL     the room has started or has all its players
+#
+# A room starts when its last player joins, the first player to join picks
+# its size. Spectators can come and go at any time, they get a keyframe of
+# every board when they join and the same UPDATEs as the players after that.
+#
+#   python -m tetris.server --port 7777
+#   python -m tetris.server --load --rooms 1000 --seconds 10
+#
+# --load runs the server in a second process and plays random games against it
+# over loopback, then reports the tick latency and how many rooms one core of
+# the server holds
+import argparse
+import asyncio
+import multiprocessing
+import random
+import socket
+import sys
+import time
+from collections import deque
+
+from tetris.engine import ACTIONS, GRAVITY_CURVE, HARD_DROP, TetrisEngine, gravity_delay
+from tetris.grid import columns, rows
+from tetris.profiling import percentile
+from tetris.randomizer import PieceRandom
+from tetris.stream import StateDecoder, StateEncoder
+from tetris.varint import decode_varint, encode_varint
+
+TICK_RATE = 60
+# garbage lines sent for clearing 0, 1, 2, 3 and 4 lines at once
+ATTACK = (0, 0, 1, 2, 4)
+# the most actions a player can have waiting for the next tick. That is
+# seconds of the fastest play, a client that sends more is flooding us and is
+# disconnected
+MAX_INPUTS = 256
+
+# message types
+START = 1
+UPDATE = 2
+END = 3
+FULL = 4
+
+
+def frame(body):
+    out = bytearray()
+    encode_varint(len(body), out)
+    return bytes(out + body)
+
+
+class Player:
+    def __init__(self, seat, transport, engine):
+        self.seat = seat
+        self.transport = transport
+        self.engine = engine
+        # actions that came in since the last tick, in the order they came,
+        # never more than MAX_INPUTS
+        self.inputs = deque()
+        self.gravity_time = 0.0
+        # garbage lines sent to us that haven't come up yet
+        self.pending = 0
+        # True when something may have changed since we last sent our board
+        self.dirty = True
+        # makes the frames of our board, the first one is a keyframe
+        self.encoder = StateEncoder(engine.columns, engine.rows)
+
+    # apply one action, and when it locks our piece give back the lines it
+    # cleared. None means our piece didn't lock
+    def apply(self, action):
+        engine = self.engine
+        pieces, lines = engine.pieces, engine.lines
+        if action is None:
+            engine.tick()
+        else:
+            engine.step(action)
+        self.dirty = True
+        if engine.pieces != pieces or engine.game_over:
+            return engine.lines - lines
+        return None
+
+
+# size is None until the first player joins and picks it
+class Room:
+    def __init__(self, number, seed, columns=columns, rows=rows, gravity_curve=GRAVITY_CURVE):
+        self.number = number
+        self.size = None
+        self.seed = seed
+        self.columns = columns
+        self.rows = rows
+        self.gravity_curve = gravity_curve
+        self.players = []
+        self.spectators = []
+        self.started = False
+        self.finished = False
+        self.ticks = 0
+        # picks our garbage holes and who we attack, seeded so a room plays
+        # the same way again with the same inputs
+        self.random = PieceRandom(seed)
+
+    # seat a player, None when the room is full
+    def join(self, transport, size):
+        if self.size is None:
+            self.size = max(size, 1)
+        if self.started or len(self.players) >= self.size:
+            return None
+        player = Player(len(self.players), transport,
+                        TetrisEngine(self.seed, self.columns, self.rows))
+        self.players.append(player)
+        if len(self.players) == self.size:
+            self.start()
+        return player
+
+    # a spectator gets START and a keyframe of every board straight away when
+    # we have started, and START with the players when we haven't
+    def watch(self, transport):
+        self.spectators.append(transport)
+        if self.started:
+            self.greet(transport, self.size)
+            body = bytearray((UPDATE,))
+            encode_varint(self.ticks, body)
+            for player in self.players:
+                if player.encoder.started:
+                    encode_varint(player.seat, body)
+                    body += player.encoder.keyframe()
+            transport.write(frame(body))
+
+    # send message to every player still connected and every spectator, we
+    # give back how many got it
+    def broadcast(self, message):
+        sent = 0
+        for transport in [player.transport for player in self.players] + self.spectators:
+            if transport is not None and not transport.is_closing():
+                transport.write(message)
+                sent += 1
+        return sent
+
+    def greet(self, transport, seat):
+        body = bytearray((START,))
+        for value in (seat, self.size, self.columns, self.rows):
+            encode_varint(value, body)
+        transport.write(frame(body))
+
+    def start(self):
+        self.started = True
+        for player in self.players:
+            self.greet(player.transport, player.seat)
+        for transport in self.spectators:
+            self.greet(transport, self.size)
+
+    # the player's connection is gone, they are out of the game. Before the
+    # start they give up their seat, and the players after them move up one
+    def leave(self, player):
+        if not self.started:
+            self.players.remove(player)
+            for seat, other in enumerate(self.players):
+                other.seat = seat
+            return
+        player.transport = None
+        player.engine.game_over = True
+        player.dirty = True
+
+    # a lock cleared lines, or didn't. Cleared lines cancel our own garbage
+    # first and the rest goes to a random opponent. A lock that didn't clear
+    # brings up the garbage that is waiting
+    def settle(self, player, lines):
+        if lines:
+            attack = ATTACK[min(lines, len(ATTACK) - 1)]
+            cancel = min(attack, player.pending)
+            player.pending -= cancel
+            attack -= cancel
+            targets = [other for other in self.players if other is not player and not other.engine.game_over]
+            if attack and targets:
+                target = targets[self.random.below(len(targets))]
+                target.pending += attack
+                target.dirty = True
+        elif player.pending and not player.engine.game_over:
+            player.engine.add_garbage(player.pending, self.random.below(self.columns))
+            player.pending = 0
+
+    # one tick of the game: every player's actions in the order they came,
+    # then gravity. We give back the UPDATE message for this tick, or None when
+    # no board changed
+    def tick(self, seconds):
+        self.ticks += 1
+        for player in self.players:
+            engine = player.engine
+            inputs = player.inputs
+            while inputs and not engine.game_over:
+                lines = player.apply(inputs.popleft())
+                if lines is not None:
+                    self.settle(player, lines)
+            inputs.clear()
+            if engine.game_over:
+                continue
+            player.gravity_time += seconds
+            delay = gravity_delay(engine.level, self.gravity_curve)
+            while player.gravity_time >= delay and not engine.game_over:
+                player.gravity_time -= delay
+                lines = player.apply(None)
+                if lines is not None:
+                    self.settle(player, lines)
+
+        body = bytearray((UPDATE,))
+        encode_varint(self.ticks, body)
+        empty = len(body)
+        for player in self.players:
+            if player.dirty:
+                player.dirty = False
+                data = player.encoder.encode(player.engine, player.pending)
+                if data is not None:
+                    encode_varint(player.seat, body)
+                    body += data
+        message = frame(body) if len(body) > empty else None
+
+        alive = [player for player in self.players if not player.engine.game_over]
+        if len(alive) <= (1 if self.size > 1 else 0):
+            self.finished = True
+        return message
+
+    def winner(self):
+        alive = [player.seat for player in self.players if not player.engine.game_over]
+        return alive[0] if len(alive) == 1 else None
+
+
+# Connections
+# one PlayerConnection per client. It reads the hello, then turns every byte
+# into an action for our player. A spectator's player is WATCHING, and the
+# bytes it sends are ignored
+WATCHING = object()
+
+
+class PlayerConnection(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.hello = bytearray()
+        self.room = None
+        self.player = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        sock = transport.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def data_received(self, data):
+        if self.player is None:
+            self.hello += data
+            try:
+                number, pos = decode_varint(self.hello, 0)
+                size, pos = decode_varint(self.hello, pos)
+            except ValueError:
+                # the hello isn't all here yet. Two varints never need more
+                # than 20 bytes, more means a broken client
+                if len(self.hello) > 20:
+                    self.transport.close()
+                return
+            self.room = self.server.room(number)
+            if size == 0:
+                self.room.watch(self.transport)
+                self.player = WATCHING
+                return
+            self.player = self.room.join(self.transport, size)
+            if self.player is None:
+                self.transport.write(frame(bytes((FULL,))))
+                self.transport.close()
+                return
+            data = self.hello[pos:]
+        if self.player is WATCHING or not self.room.started:
+            return
+        inputs = self.player.inputs
+        if len(inputs) + len(data) > MAX_INPUTS:
+            self.transport.close()
+            return
+        for action in data:
+            if action >= len(ACTIONS):
+                self.transport.close()
+                return
+            inputs.append(action)
+
+    def connection_lost(self, exc):
+        if self.room is None:
+            return
+        if self.player is WATCHING:
+            self.room.spectators.remove(self.transport)
+        elif self.player is not None:
+            self.room.leave(self.player)
+        self.server.forget(self.room)
+
+
+class GameServer:
+    def __init__(self, tick_rate=TICK_RATE, seed=None, columns=columns, rows=rows, history=10000):
+        self.tick_rate = tick_rate
+        self.seed = random.getrandbits(32) if seed is None else seed
+        self.columns = columns
+        self.rows = rows
+        self.rooms = {}
+        self.ticks = 0
+        self.games = 0
+        self.messages = 0
+        self.bytes_sent = 0
+        # how long the work of our last ticks took and how late they started,
+        # in seconds
+        self.tick_work = deque(maxlen=history)
+        self.tick_lag = deque(maxlen=history)
+
+    # the room with this number, a new one when there is none
+    def room(self, number):
+        room = self.rooms.get(number)
+        if room is None:
+            seed = (self.seed << 32) ^ number
+            room = self.rooms[number] = Room(number, seed, self.columns, self.rows)
+        return room
+
+    # a room that hasn't started and has nobody left in it, players or
+    # spectators, is gone. Rooms that started go when their game ends
+    def forget(self, room):
+        if (not room.started and not room.players and not room.spectators
+                and self.rooms.get(room.number) is room):
+            del self.rooms[room.number]
+
+    # tick every room that has started, send its UPDATE, and end the games
+    # that are over
+    def tick(self):
+        seconds = 1 / self.tick_rate
+        finished = []
+        for room in self.rooms.values():
+            if not room.started:
+                continue
+            message = room.tick(seconds)
+            if message is not None:
+                self.messages += 1
+                self.bytes_sent += len(message) * room.broadcast(message)
+            if room.finished:
+                finished.append(room)
+        for room in finished:
+            winner = room.winner()
+            room.broadcast(frame(bytes((END, 0 if winner is None else winner + 1))))
+            for player in room.players:
+                if player.transport is not None:
+                    player.transport.close()
+            for transport in room.spectators:
+                transport.close()
+            del self.rooms[room.number]
+            self.games += 1
+        self.ticks += 1
+
+    # tick forever at tick_rate. When a tick runs late the next ones start
+    # straight away until we have caught up
+    async def run_ticks(self):
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.tick_rate
+        due = loop.time()
+        while True:
+            start = loop.time()
+            self.tick_lag.append(max(start - due, 0.0))
+            self.tick()
+            self.tick_work.append(loop.time() - start)
+            due += interval
+            await asyncio.sleep(max(due - loop.time(), 0))
+
+    async def serve(self, host='127.0.0.1', port=7777, ready=None):
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(lambda: PlayerConnection(self), host, port, backlog=4096)
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[1])
+        async with server:
+            await self.run_ticks()
+
+    def stats(self):
+        work = sorted(self.tick_work)
+        lag = sorted(self.tick_lag)
+        return {
+            'ticks': self.ticks,
+            'games': self.games,
+            'rooms': sum(room.started for room in self.rooms.values()),
+            'messages': self.messages,
+            'bytes_sent': self.bytes_sent,
+            'tick_ms': {name: percentile(work, fraction) * 1000
+                        for name, fraction in (('p50', 0.5), ('p99', 0.99))},
+            'tick_lag_ms': {name: percentile(lag, fraction) * 1000
+                            for name, fraction in (('p50', 0.5), ('p99', 0.99))},
+            'tick_ms_max': work[-1] * 1000 if work else 0.0,
+        }
+
+
+# Clients
+# RoomView follows the boards of a room from the messages the server sends,
+# with a StateDecoder for every board. It is what a client draws from, and the
+# load generator uses it to check every message decodes. A spectator's seat is
+# the number of players
+class RoomView:
+    def __init__(self):
+        self.seat = None
+        self.boards = []
+        self.tick = 0
+        self.winner = None
+        self.finished = False
+        self.full = False
+
+    def apply(self, body):
+        kind = body[0]
+        pos = 1
+        if kind == START:
+            values = []
+            for _ in range(4):
+                value, pos = decode_varint(body, pos)
+                values.append(value)
+            self.seat, size, self.columns, self.rows = values
+            self.boards = [StateDecoder() for _ in range(size)]
+        elif kind == UPDATE:
+            self.tick, pos = decode_varint(body, pos)
+            while pos < len(body):
+                seat, pos = decode_varint(body, pos)
+                pos = self.boards[seat].apply(body, pos)
+        elif kind == END:
+            winner = body[1]
+            self.winner = winner - 1 if winner else None
+            self.finished = True
+        elif kind == FULL:
+            self.full = True
+
+
+# read the framed messages from a stream until it closes, and hand every body
+# to view.apply()
+async def read_messages(reader, view):
+    count = 0
+    while True:
+        length = 0
+        shift = 0
+        while True:
+            byte = await reader.read(1)
+            if not byte:
+                return count
+            length |= (byte[0] & 0x7F) << shift
+            if byte[0] < 0x80:
+                break
+            shift += 7
+        body = await reader.readexactly(length)
+        view.apply(body)
+        count += 1
+
+
+# Load generator
+# every client plays random actions at rate actions a second in its room, and
+# when its game ends joins the next free room, so we keep rooms games going
+
+async def load_client(host, port, number, size, rate, deadline, totals):
+    # we spread the first action of our clients over a second so they don't
+    # all send at once
+    rng = random.Random(number)
+    while time.monotonic() < deadline:
+        reader, writer = await asyncio.open_connection(host, port)
+        hello = bytearray()
+        encode_varint(number, hello)
+        encode_varint(size, hello)
+        writer.write(hello)
+        view = RoomView()
+        reading = asyncio.ensure_future(read_messages(reader, view))
+        await asyncio.sleep(rng.random())
+        # mostly moves, with a hard drop now and then so pieces come quicker
+        actions = [action for action in ACTIONS if action != HARD_DROP] * 3 + [HARD_DROP]
+        while not reading.done() and time.monotonic() < deadline:
+            writer.write(bytes((rng.choice(actions),)))
+            totals['actions'] += 1
+            await asyncio.sleep(1 / rate)
+        writer.close()
+        try:
+            totals['messages'] += await reading
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        if view.full:
+            totals['full'] += 1
+        if view.finished:
+            totals['games'] += 1
+        # the next game is in a room no one has used, our room number counts
+        # up by the stride of the room numbers of all clients
+        number += totals['stride']
+
+
+def serve_in_process(connection, tick_rate, seconds):
+    server = GameServer(tick_rate)
+
+    async def main():
+        task = asyncio.ensure_future(server.serve(port=0, ready=connection.send))
+        await asyncio.sleep(seconds)
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+        server.tick_work.clear()
+        server.tick_lag.clear()
+        connection.send('measuring')
+        # the clients have all joined by now, we measure the steady state
+        await asyncio.sleep(seconds)
+        stats = server.stats()
+        stats['cpu_seconds'] = time.process_time() - start_cpu
+        stats['wall_seconds'] = time.perf_counter() - start
+        connection.send(stats)
+        task.cancel()
+
+    asyncio.run(main())
+
+
+# every client is a socket, and the default limit of open files is often too
+# low for a big load test. Windows has no resource module and no such limit to
+# raise
+def raise_file_limit(needed):
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+
+def load_test(rooms, size, rate, seconds, tick_rate):
+    raise_file_limit(rooms * size * 2 + 100)
+    parent, child = multiprocessing.Pipe()
+    # the server warms up for seconds while the clients join, and is measured
+    # for the seconds after that
+    process = multiprocessing.Process(target=serve_in_process, args=(child, tick_rate, seconds))
+    process.start()
+    port = parent.recv()
+    totals = {'actions': 0, 'messages': 0, 'games': 0, 'full': 0, 'stride': rooms}
+
+    async def clients():
+        deadline = time.monotonic() + 2 * seconds
+        await asyncio.gather(*(load_client('127.0.0.1', port, number, size, rate, deadline, totals)
+                               for number in range(rooms) for _ in range(size)))
+
+    asyncio.run(clients())
+    parent.recv()
+    stats = parent.recv()
+    process.join()
+    busy = stats['cpu_seconds'] / stats['wall_seconds']
+    stats['clients'] = totals
+    stats['rooms_per_core'] = stats['rooms'] / busy if busy else 0.0
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the multiplayer server, or load test it over loopback.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=7777, help='port to listen on')
+    parser.add_argument('--tick-rate', type=int, default=TICK_RATE, help='room ticks per second')
+    parser.add_argument('--seed', type=int, help='seed for the rooms')
+    parser.add_argument('--load', action='store_true', help='run a loopback load test instead')
+    parser.add_argument('--rooms', type=int, default=200, help='rooms the load test keeps busy')
+    parser.add_argument('--players', type=int, default=2, help='players per room in the load test')
+    parser.add_argument('--rate', type=float, default=10, help='actions a second per load test player')
+    parser.add_argument('--seconds', type=float, default=5, help='seconds the load test warms up and measures')
+    args = parser.parse_args(argv)
+
+    if not args.load:
+        server = GameServer(args.tick_rate, args.seed)
+        asyncio.run(server.serve(args.host, args.port,
+                                 ready=lambda port: print(f'listening on {args.host}:{port}')))
+        return 0
+
+    stats = load_test(args.rooms, args.players, args.rate, args.seconds, args.tick_rate)
+    clients = stats['clients']
+    print(f"{stats['rooms']} rooms of {args.players} at {args.tick_rate} ticks a second, "
+          f"{clients['actions']:,} actions sent, {clients['games']} games finished")
+    print(f"tick {stats['tick_ms']['p50']:.3f} ms p50, {stats['tick_ms']['p99']:.3f} ms p99, "
+          f"{stats['tick_ms_max']:.3f} ms max, started late by {stats['tick_lag_ms']['p99']:.3f} ms p99")
+    print(f"server cpu {stats['cpu_seconds']:.2f} s in {stats['wall_seconds']:.2f} s, "
+          f"{stats['rooms_per_core']:,.0f} rooms per core")
+    print(f"{stats['messages']:,} updates, {stats['bytes_sent'] / max(stats['messages'], 1):.1f} bytes each")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
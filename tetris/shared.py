@@ -0,0 +1,293 @@
+# Shared board export
+#
+# Training processes used to get the board back as a pickled list of lists
+# every step. A BoardExport writes the state of a game into a block of shared
+# memory instead, or into any writable buffer, with a fixed layout that a
+# consumer in another process reads in place:
+#
+#   offset 0    generation                                  8 bytes
+#               columns, rows                               2 bytes each
+#               score                                       8 bytes
+#               lines, pieces, ticks                        4 bytes each
+#               piece kind (-1 for no piece), rotation      1 byte each
+#               piece row, piece col                        2 bytes each
+#               game over                                   1 byte
+#   offset 64   rows * columns cells, one byte each, row 0 first:
+#               0 empty, 1 locked, 2 the active piece
+#
+# every number is little endian. The cells are a plain uint8 array, so NumPy
+# can look at them without a copy:
+#
+#   export = BoardExport.attach(name)
+#   cells = export.array()          # shape (rows, columns), no copy
+#
+# generation works as a seqlock, like the planner's SharedBoard: it is odd
+# while the game writes the block and goes up by one again when the write is
+# done. A reader that needs a state that is all from one write notes the
+# generation before it reads and checks it is the same even number after,
+# read() does that for us and copies the cells into an array we pass it.
+#
+# The game only writes the rows that changed since its last write, so a write
+# after a gravity tick touches the few rows around the piece.
+#
+#   python -m tetris.shared --steps 20000
+#
+# plays a game into shared memory in one process, reads it with NumPy in
+# another and compares it with pickling the grid
+import argparse
+import multiprocessing
+import pickle
+import struct
+import sys
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+from tetris.engine import ACTIONS, TetrisEngine
+
+GENERATION = struct.Struct('<Q')
+# the header after the generation
+FIELDS = struct.Struct('<HHqIIIbbhhB')
+CELLS_OFFSET = 64
+
+EMPTY = 0
+LOCKED = 1
+PIECE = 2
+
+# turns the '0' and '1' characters of a row mask written out in binary into
+# the bytes 0 and LOCKED
+ROW_CELLS = bytes.maketrans(b'01', bytes((EMPTY, LOCKED)))
+
+ExportedState = namedtuple('ExportedState', [
+    'generation', 'columns', 'rows', 'score', 'lines', 'pieces', 'ticks', 'piece', 'game_over', 'cells',
+])
+
+
+# the cells of a row mask, column 0 first
+def row_cells(mask, columns):
+    return format(mask, f'0{columns}b')[::-1].encode().translate(ROW_CELLS)
+
+
+class BoardExport:
+    # a new block of shared memory for a board of columns by rows, or the
+    # writable buffer we are given
+    def __init__(self, columns, rows, buffer=None, name=None):
+        self.columns = columns
+        self.rows = rows
+        self.memory = None
+        if buffer is None:
+            if name is None:
+                self.memory = shared_memory.SharedMemory(create=True, size=self.size(columns, rows))
+            else:
+                self.memory = shared_memory.SharedMemory(name=name)
+            buffer = self.memory.buf
+        if len(buffer) < self.size(columns, rows):
+            raise ValueError(f'a {columns} by {rows} board needs {self.size(columns, rows)} bytes')
+        self.buffer = buffer
+        self.name = self.memory.name if self.memory is not None else None
+        # what we wrote last: the locked rows and the rows our piece was on
+        self.written_rows = None
+        self.piece_rows = ()
+        # a block we made, or a buffer we were given, gets its size in the
+        # header straight away, so a reader that attaches before our first
+        # write() sees an empty board of the right size, with its counters at 0
+        # and no piece
+        if name is None:
+            FIELDS.pack_into(buffer, GENERATION.size, columns, rows, 0, 0, 0, 0, -1, 0, 0, 0, False)
+
+    @staticmethod
+    def size(columns, rows):
+        return CELLS_OFFSET + columns * rows
+
+    # open a block another process made, we read its size from its header
+    @classmethod
+    def attach(cls, name):
+        memory = shared_memory.SharedMemory(name=name)
+        columns, rows = FIELDS.unpack_from(memory.buf, GENERATION.size)[:2]
+        export = cls.__new__(cls)
+        export.columns = columns
+        export.rows = rows
+        export.memory = memory
+        export.buffer = memory.buf
+        export.name = name
+        export.written_rows = None
+        export.piece_rows = ()
+        return export
+
+    @property
+    def generation(self):
+        return GENERATION.unpack_from(self.buffer, 0)[0]
+
+    # Writing
+
+    # write the state of engine and give back the generation it is under
+    def write(self, engine):
+        buffer = self.buffer
+        board = engine.board
+        columns = self.columns
+        generation = self.generation + 1
+        GENERATION.pack_into(buffer, 0, generation)
+
+        # the rows to write again are the rows that changed and the rows our
+        # piece was on or is on now
+        piece = board.piece
+        cells = board.piece_cells()
+        piece_rows = {row for row, _ in cells}
+        locked = board.locked
+        if self.written_rows is None:
+            dirty = range(self.rows)
+        else:
+            dirty = {row for row, (mask, written) in enumerate(zip(locked, self.written_rows))
+                     if mask != written}
+            dirty.update(self.piece_rows, piece_rows)
+        for row in dirty:
+            start = CELLS_OFFSET + row * columns
+            buffer[start:start + columns] = row_cells(locked[row], columns)
+        for row, col in cells:
+            buffer[CELLS_OFFSET + row * columns + col] = PIECE
+        self.written_rows = list(locked)
+        self.piece_rows = piece_rows
+
+        if piece is None:
+            pose = (-1, 0, 0, 0)
+        else:
+            pose = (piece.kind, piece.rotation, piece.row, piece.col)
+        FIELDS.pack_into(buffer, GENERATION.size, columns, self.rows, engine.score, engine.lines,
+                         engine.pieces, engine.ticks, *pose, engine.game_over)
+        # the generation goes last, on its own, so a reader that sees it even
+        # sees everything we wrote before it
+        GENERATION.pack_into(buffer, 0, generation + 1)
+        return generation + 1
+
+    # Reading
+
+    # the cells as a rows by columns memoryview of the block, no copy
+    def cells(self):
+        return self.buffer[CELLS_OFFSET:CELLS_OFFSET + self.columns * self.rows].cast(
+            'B', (self.rows, self.columns))
+
+    # the cells as a rows by columns uint8 NumPy array of the block, no copy.
+    # Only readers need NumPy, so we import it here
+    def array(self):
+        import numpy as np
+        return np.frombuffer(self.buffer, np.uint8, self.columns * self.rows, CELLS_OFFSET).reshape(
+            self.rows, self.columns)
+
+    # a state that is all from one write. The cells are copied into out, an
+    # array of rows by columns bytes such as a NumPy array, or into a new
+    # bytearray. We try again while the game is writing, up to tries times,
+    # and give back None when we never got a clean read
+    def read(self, out=None, tries=1000):
+        buffer = self.buffer
+        size = self.columns * self.rows
+        if out is None:
+            out = bytearray(size)
+        target = memoryview(out).cast('B') if not isinstance(out, bytearray) else out
+        for _ in range(tries):
+            before = GENERATION.unpack_from(buffer, 0)[0]
+            if before & 1:
+                continue
+            fields = FIELDS.unpack_from(buffer, GENERATION.size)
+            target[:size] = buffer[CELLS_OFFSET:CELLS_OFFSET + size]
+            if GENERATION.unpack_from(buffer, 0)[0] != before:
+                continue
+            columns, rows, score, lines, pieces, ticks, kind, rotation, row, col, over = fields
+            piece = None if kind < 0 else (kind, rotation, row, col)
+            return ExportedState(before, columns, rows, score, lines, pieces, ticks, piece,
+                                 bool(over), out)
+        return None
+
+    def close(self):
+        self.buffer = None
+        if self.memory is not None:
+            self.memory.close()
+
+    def unlink(self):
+        if self.memory is not None:
+            self.memory.unlink()
+
+
+# Benchmark
+# first we time writing, reading and what we did before, pickling the grid and
+# loading it into NumPy again, in one process. Then a game plays and writes
+# every step in a second process while we read it here, and we check every
+# clean read is whole: the cells marked PIECE are the cells of the piece in the
+# header
+
+def play(name, steps):
+    export = BoardExport.attach(name)
+    engine = TetrisEngine(0)
+    for step in range(steps):
+        engine.step(ACTIONS[step % len(ACTIONS)])
+        if engine.game_over:
+            engine.reset(step)
+        export.write(engine)
+    export.close()
+
+
+def time_per_call(call, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        call()
+    return (time.perf_counter() - start) / count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the shared board export with pickling the grid.')
+    parser.add_argument('--steps', type=int, default=20000, help='steps the game writes')
+    args = parser.parse_args(argv)
+
+    import numpy as np
+
+    from tetris.pieces import ROTATIONS
+
+    engine = TetrisEngine(0)
+    export = BoardExport(engine.columns, engine.rows)
+    cells = np.empty((engine.rows, engine.columns), np.uint8)
+
+    # every step is an action and a gravity tick, so the header we write
+    # holds the counters of a real game
+    steps = 0
+
+    def step_and_write():
+        nonlocal steps
+        engine.step(ACTIONS[steps % len(ACTIONS)])
+        engine.tick()
+        steps += 1
+        if engine.game_over:
+            engine.reset(steps)
+        export.write(engine)
+
+    write = time_per_call(step_and_write, args.steps)
+    read = time_per_call(lambda: export.read(cells), args.steps)
+    pickled = time_per_call(lambda: np.array(pickle.loads(pickle.dumps(engine.grid()))), args.steps // 10)
+    print(f'step and write {write * 1e6:.2f} us, read into NumPy {read * 1e6:.2f} us, '
+          f'pickle the grid into NumPy {pickled * 1e6:.2f} us')
+
+    writer = multiprocessing.Process(target=play, args=(export.name, args.steps))
+    writer.start()
+    reads = torn = 0
+    generations = set()
+    while writer.is_alive():
+        state = export.read(cells)
+        if state is None:
+            continue
+        reads += 1
+        generations.add(state.generation)
+        marked = sorted(zip(*np.nonzero(cells == PIECE)))
+        expected = []
+        if state.piece is not None:
+            kind, rotation, row, col = state.piece
+            expected = sorted((row + i, col + j) for i, j in ROTATIONS[kind][rotation].cells)
+        if [(int(r), int(c)) for r, c in marked] != expected:
+            torn += 1
+    writer.join()
+    print(f'{reads:,} reads from another process saw {len(generations):,} writes, {torn} were torn')
+
+    export.close()
+    export.unlink()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+# State stream
+#
+# Spectators and remote clients follow a game by the frames a StateEncoder
+# makes from it, one frame whenever the game changed. Sending the 20 by 10
+# grid of characters every tick costs hundreds of bytes, but from one tick to
+# the next usually only the piece moves, so most frames are a single byte.
+#
+# A frame starts with a byte of flags that says which fields follow, every
+# number after it is a varint:
+#
+#   KEYFRAME    columns, rows, then every cell of the locked rows packed into
+#               bits, row 0 first and column 0 in the lowest bit. A keyframe
+#               always sends the piece, score and pending fields too, so it
+#               holds the whole state and can be decoded on its own
+#   CELLS       how many cells were locked or cleared, then the gaps between
+#               their numbers row * columns + col, counting up from -1
+#   PIECE_FELL  the piece moved down a row, no fields
+#   PIECE       kind + 1 (0 when there is no piece), rotation, row, col
+#   SCORE       score, lines
+#   PENDING     garbage lines waiting to come up, see tetris/server.py
+#   GAME_OVER   no fields, the game is over
+#
+# A gravity tick is the one byte PIECE_FELL. A lock is the 4 cells of the piece
+# and the new piece, around 12 bytes. A line clear moves every cell above it,
+# so when the changed cells would take more bytes than the whole board we send
+# a keyframe instead.
+#
+# A StateDecoder follows the frames on a Bitboard of its own, so grid() gives
+# the same nested list, ghost and all, that draw_grid() draws from the game.
+#
+#   python -m tetris.stream --games 20
+#
+# plays games and compares the bytes and encode time per frame with sending
+# the whole grid as JSON
+import argparse
+import json
+import random
+import sys
+import time
+
+from tetris.bitboard import Bitboard, pack_rows, packed_size, unpack_rows
+from tetris.engine import ACTIONS, TetrisEngine
+from tetris.pieces import ActivePiece
+from tetris.policies import HeuristicPolicy
+from tetris.profiling import percentile
+from tetris.varint import decode_varint, encode_varint
+
+KEYFRAME = 1
+CELLS = 2
+PIECE_FELL = 4
+PIECE = 8
+SCORE = 16
+PENDING = 32
+GAME_OVER = 64
+
+
+def encode_piece(piece, out):
+    if piece is None:
+        out.append(0)
+        return
+    kind, rotation, row, col = piece
+    encode_varint(kind + 1, out)
+    encode_varint(rotation, out)
+    encode_varint(row, out)
+    encode_varint(col, out)
+
+
+class StateEncoder:
+    def __init__(self, columns, rows):
+        self.columns = columns
+        self.rows = rows
+        self.row_bytes = packed_size(columns, rows)
+        # the state our last frame left the receivers in, the next frame is the
+        # difference from it
+        self.sent_rows = [0] * rows
+        self.sent_piece = None
+        self.sent_score = 0
+        self.sent_lines = 0
+        self.sent_pending = 0
+        self.sent_game_over = False
+        self.started = False
+
+    # the frame that takes our receivers from what we sent last to the state of
+    # engine, or None when nothing changed. The first frame is a keyframe
+    def encode(self, engine, pending=0):
+        board = engine.board
+        piece = board.piece
+        if piece is not None:
+            piece = (piece.kind, piece.rotation, piece.row, piece.col)
+        if not self.started:
+            self.update(board.locked, piece, engine, pending)
+            self.started = True
+            return self.keyframe()
+
+        flags = 0
+        out = bytearray(1)
+        if board.locked != self.sent_rows:
+            cells = self.changed_cells(board.locked)
+            if len(cells) > self.row_bytes:
+                self.update(board.locked, piece, engine, pending)
+                return self.keyframe()
+            flags |= CELLS
+            encode_varint(len(cells), out)
+            last = -1
+            for cell in cells:
+                encode_varint(cell - last - 1, out)
+                last = cell
+        if piece != self.sent_piece:
+            sent = self.sent_piece
+            if (piece is not None and sent is not None and piece[:2] == sent[:2]
+                    and piece[2] == sent[2] + 1 and piece[3] == sent[3]):
+                flags |= PIECE_FELL
+            else:
+                flags |= PIECE
+                encode_piece(piece, out)
+        if engine.score != self.sent_score or engine.lines != self.sent_lines:
+            flags |= SCORE
+            encode_varint(engine.score, out)
+            encode_varint(engine.lines, out)
+        if pending != self.sent_pending:
+            flags |= PENDING
+            encode_varint(pending, out)
+        if engine.game_over and not self.sent_game_over:
+            flags |= GAME_OVER
+        if not flags:
+            return None
+        self.update(board.locked, piece, engine, pending)
+        out[0] = flags
+        return bytes(out)
+
+    def update(self, locked, piece, engine, pending):
+        self.sent_rows = list(locked)
+        self.sent_piece = piece
+        self.sent_score = engine.score
+        self.sent_lines = engine.lines
+        self.sent_pending = pending
+        self.sent_game_over = engine.game_over
+
+    # the numbers of the cells that differ from what we sent, in order
+    def changed_cells(self, locked):
+        columns = self.columns
+        cells = []
+        for row, (mask, sent) in enumerate(zip(locked, self.sent_rows)):
+            changed = mask ^ sent
+            while changed:
+                low = changed & -changed
+                cells.append(row * columns + low.bit_length() - 1)
+                changed ^= low
+        return cells
+
+    # the whole state we last sent, for a receiver that joins late or lost
+    # track. It doesn't change what the next delta is made from
+    def keyframe(self):
+        flags = KEYFRAME | PIECE | SCORE | PENDING
+        if self.sent_game_over:
+            flags |= GAME_OVER
+        out = bytearray((flags,))
+        encode_varint(self.columns, out)
+        encode_varint(self.rows, out)
+        out += pack_rows(self.sent_rows, self.columns)
+        encode_piece(self.sent_piece, out)
+        encode_varint(self.sent_score, out)
+        encode_varint(self.sent_lines, out)
+        encode_varint(self.sent_pending, out)
+        return bytes(out)
+
+
+class StateDecoder:
+    def __init__(self):
+        self.board = None
+        self.score = 0
+        self.lines = 0
+        self.pending = 0
+        self.game_over = False
+
+    # apply the frame that starts at pos in data, we give back the position
+    # after it so frames can be packed one after another
+    def apply(self, data, pos=0):
+        flags = data[pos]
+        pos += 1
+        if flags & KEYFRAME:
+            columns, pos = decode_varint(data, pos)
+            rows, pos = decode_varint(data, pos)
+            size = packed_size(columns, rows)
+            board = self.board = Bitboard(columns, rows)
+            board.locked = unpack_rows(data[pos:pos + size], columns, rows)
+            pos += size
+            board.rebuild_heights()
+            self.game_over = False
+        elif self.board is None:
+            raise ValueError('a delta frame needs a keyframe before it')
+        board = self.board
+        if flags & CELLS:
+            count, pos = decode_varint(data, pos)
+            columns = board.columns
+            locked = board.locked
+            cell = -1
+            for _ in range(count):
+                gap, pos = decode_varint(data, pos)
+                cell += gap + 1
+                locked[cell // columns] ^= 1 << (cell % columns)
+            board.rebuild_heights()
+        if flags & PIECE_FELL:
+            board.piece.row += 1
+        if flags & PIECE:
+            kind, pos = decode_varint(data, pos)
+            if kind == 0:
+                board.piece = None
+            else:
+                rotation, pos = decode_varint(data, pos)
+                row, pos = decode_varint(data, pos)
+                col, pos = decode_varint(data, pos)
+                board.piece = ActivePiece(kind - 1, rotation, row, col)
+        if flags & SCORE:
+            self.score, pos = decode_varint(data, pos)
+            self.lines, pos = decode_varint(data, pos)
+        if flags & PENDING:
+            self.pending, pos = decode_varint(data, pos)
+        if flags & GAME_OVER:
+            self.game_over = True
+        return pos
+
+    # the nested list grid for draw_grid(), see Bitboard.to_grid()
+    def grid(self, top=0, left=0, height=None, width=None, ghost=False):
+        return self.board.to_grid(top, left, height, width, ghost)
+
+
+# what we compare against: the whole grid and the score as JSON, every frame
+def json_frame(engine):
+    return json.dumps({'grid': engine.grid(), 'score': engine.score, 'lines': engine.lines}).encode()
+
+
+# Benchmark
+# we play games with the heuristic player, which moves the piece into place
+# and hard drops it, with a gravity tick after every move, and random games
+# that mostly fall. Every time the game changes we make both kinds of frame,
+# decode ours and check the decoder's grid matches the game's
+
+def measure(games, policy):
+    sizes = {'tick': [], 'other': [], 'json': []}
+    times = {'stream': [], 'json': []}
+    clock = time.perf_counter
+    for seed in range(games):
+        engine = TetrisEngine(seed)
+        encoder = StateEncoder(engine.columns, engine.rows)
+        decoder = StateDecoder()
+        player = HeuristicPolicy() if policy == 'heuristic' else None
+        rng = random.Random(seed)
+        decoder.apply(encoder.encode(engine))
+        while not engine.game_over and engine.pieces <= 300:
+            for kind in ('move', 'tick'):
+                if kind == 'move':
+                    engine.step(player.act(engine) if player else rng.choice(ACTIONS))
+                else:
+                    engine.tick()
+                start = clock()
+                data = encoder.encode(engine)
+                times['stream'].append(clock() - start)
+                start = clock()
+                naive = json_frame(engine)
+                times['json'].append(clock() - start)
+                if data is None:
+                    continue
+                sizes['tick' if kind == 'tick' else 'other'].append(len(data))
+                sizes['json'].append(len(naive))
+                decoder.apply(data)
+                if decoder.grid(ghost=True) != engine.grid(ghost=True) or decoder.score != engine.score:
+                    raise AssertionError(f'decoded state differs from game {seed}')
+    return sizes, times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the state stream with sending the grid as JSON.')
+    parser.add_argument('--games', type=int, default=20, help='games to play of each kind')
+    args = parser.parse_args(argv)
+
+    for policy in ('heuristic', 'random'):
+        sizes, times = measure(args.games, policy)
+        frames = sizes['tick'] + sizes['other']
+        print(f'{policy} games, {len(frames):,} frames')
+        ticks = sorted(sizes['tick'])
+        print(f"  gravity tick: {sum(ticks) / max(len(ticks), 1):6.1f} bytes mean, "
+              f"{percentile(ticks, 0.99)} bytes p99")
+        print(f"  any frame:    {sum(frames) / max(len(frames), 1):6.1f} bytes mean, "
+              f"{max(frames)} bytes max")
+        print(f"  JSON frame:   {sum(sizes['json']) / max(len(sizes['json']), 1):6.1f} bytes mean")
+        for name in ('stream', 'json'):
+            spent = sorted(times[name])
+            print(f"  {name + ' encode:':14}{sum(spent) / len(spent) * 1e6:6.2f} us mean, "
+                  f"{percentile(spent, 0.99) * 1e6:.2f} us p99")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
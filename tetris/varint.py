@@ -0,0 +1,50 @@
+# Varints
+#
+# Our replay and network formats store lots of small numbers, so we write them as
+# varints: seven bits of the number per byte, with the top bit set on every byte
+# except the last. Numbers below 128 take a single byte.
+#
+#   300 = 0b10_0101100  ->  0b1_0101100 0b0_0000010  ->  b'\xac\x02'
+
+
+# append value to the bytearray out
+def encode_varint(value, out):
+    if value < 0:
+        raise ValueError('varints can not be negative')
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+# read a varint from data starting at pos, we give back the value and the
+# position of the first byte after it
+def decode_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise ValueError('truncated varint')
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+# read a varint from a binary file one byte at a time, we give back None when
+# the file ends before the first byte
+def read_varint(stream):
+    value = 0
+    shift = 0
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            if shift:
+                raise ValueError('truncated varint')
+            return None
+        value |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7